@@ -63,20 +63,17 @@ function Send-Data($jsonFilePath, $endpoint) {
         return
     }
     
-    $apiEndpointUrl = "$apiUrl/$endpoint"
-    
-    # Read the JSON file as UTF-8 and parse it
-    $jsonContent = Get-Content -Path $jsonFilePath -Raw -Encoding UTF8
-    $jsonArray = $jsonContent | ConvertFrom-Json
-    
-    foreach ($item in $jsonArray) {
-        try {
-            $response = Invoke-RestMethod -Uri $apiEndpointUrl -Method Put -Body ($item | ConvertTo-Json -Depth 10) -ContentType "application/json"
-            Write-Output "PUT $endpoint Request Successful: $response"
-        } catch {
-            Write-Output "Error: $_"
+    $apiEndpointUrl = "$apiUrl/$endpoint/bulk"
+
+    # The file is streamed as is; the API parses it incrementally and writes the records in batches
+    try {
+        $response = Invoke-RestMethod -Uri $apiEndpointUrl -Method Post -InFile $jsonFilePath -ContentType "application/json"
+        Write-Output "POST $endpoint/bulk: wrote $($response.written) of $($response.received) records, $($response.failed) failed"
+        foreach ($failure in $response.errors) {
+            Write-Output "  record $($failure.index) ($($failure.id)): $($failure.error)"
         }
-        Start-Sleep -Milliseconds 500  # Sleep for 0.5 seconds
+    } catch {
+        Write-Output "Error: $_"
     }
 }
 
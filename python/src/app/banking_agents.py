@@ -1,18 +1,28 @@
+import asyncio
 import logging
 import os
 import uuid
+from dataclasses import replace
+from functools import lru_cache
 from langchain.schema import AIMessage
+from langchain_core.messages import SystemMessage
 from typing import Literal
+from langgraph.errors import ParentCommand
 from langgraph.graph import StateGraph, START, MessagesState
 from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt.chat_agent_executor import AgentState
 from langgraph.types import Command, interrupt
-from langgraph_checkpoint_cosmosdb import CosmosDBSaver
 from langsmith import traceable
-from src.app.services.azure_open_ai import model
-from src.app.services.azure_cosmos_db import DATABASE_NAME, checkpoint_container, chat_container, \
-    update_chat_container, patch_active_agent
+from src.app.services.azure_open_ai import get_chat_model
+from src.app.services.fast_router import fast_route
+from src.app.services.context_window import build_context_window, with_summary
+from src.app.services.checkpointer import AsyncCosmosDBSaver, create_checkpoint_serializer
+from src.app.services.hybrid_checkpointer import HybridCheckpointSaver
+from src.app.services.azure_cosmos_db import DATABASE_NAME, get_checkpoint_container, update_chat_container, \
+    patch_active_agent, fetch_active_agent_async
 from src.app.tools.sales import get_offer_information, calculate_monthly_payment, create_account
-from src.app.tools.transactions import bank_balance, bank_transfer, get_transaction_history
+from src.app.tools.transactions import bank_balance, bank_transfer, get_transaction_history, \
+    get_monthly_account_summary
 from src.app.tools.support import service_request, get_branch_location
 from src.app.tools.coordinator import create_agent_transfer
 
@@ -40,35 +50,20 @@ coordinator_agent_tools = [
     create_agent_transfer(agent_name="sales_agent"),
 ]
 
-coordinator_agent = create_react_agent(
-    model,
-    coordinator_agent_tools,
-    state_modifier=load_prompt("coordinator_agent"),
-)
-
 customer_support_agent_tools = [
     get_branch_location,
     service_request,
     create_agent_transfer(agent_name="sales_agent"),
     create_agent_transfer(agent_name="transactions_agent"),
 ]
-customer_support_agent = create_react_agent(
-    model,
-    customer_support_agent_tools,
-    state_modifier=load_prompt("customer_support_agent"),
-)
 
 transactions_agent_tools = [
     bank_balance,
     bank_transfer,
     get_transaction_history,
+    get_monthly_account_summary,
     create_agent_transfer(agent_name="customer_support_agent"),
 ]
-transactions_agent = create_react_agent(
-    model,
-    transactions_agent_tools,
-    state_modifier=load_prompt("transactions_agent"),
-)
 
 sales_agent_tools = [
     get_offer_information,
@@ -78,15 +73,56 @@ sales_agent_tools = [
     create_agent_transfer(agent_name="transactions_agent"),
 ]
 
-sales_agent = create_react_agent(
-    model,
-    sales_agent_tools,
-    state_modifier=load_prompt("sales_agent"),
-)
+agent_tools = {
+    "coordinator_agent": coordinator_agent_tools,
+    "customer_support_agent": customer_support_agent_tools,
+    "transactions_agent": transactions_agent_tools,
+    "sales_agent": sales_agent_tools,
+}
+
+
+class BankingState(MessagesState):
+    # Rolling summary of the messages before summarized_until, which are no longer sent to the agents
+    summary: str
+    summarized_until: int
+
+
+class WindowedAgentState(AgentState):
+    summary: str
+
+
+@lru_cache(maxsize=None)
+def get_agent(agent_name):
+    """Creates the react agent on first use, so prompts are read and the model is initialized once per process."""
+    prompt = load_prompt(agent_name)
+    return create_react_agent(
+        get_chat_model(),
+        agent_tools[agent_name],
+        state_schema=WindowedAgentState,
+        state_modifier=lambda state: [SystemMessage(content=with_summary(prompt, state.get("summary")))]
+                                     + state["messages"],
+    )
+
+
+async def invoke_agent(agent_name, state, config=None):
+    """
+    Runs an agent on the token-budgeted window of the conversation and returns the state update: the messages
+    the agent added, and the rolling summary when it was extended.
+    """
+    context, context_update = await build_context_window(state)
+    try:
+        response = await get_agent(agent_name).ainvoke(context, config)
+    except ParentCommand as e:
+        # A transfer to another agent ends this node with the tool's command; keep the extended summary with it
+        command = e.args[0]
+        if context_update:
+            raise ParentCommand(replace(command, update={**command.update, **context_update})) from None
+        raise
+    return {"messages": response["messages"][len(context["messages"]):], **context_update}
 
 
 @traceable(run_type="llm")
-def call_coordinator_agent(state: MessagesState, config) -> Command[Literal["coordinator_agent", "human"]]:
+async def call_coordinator_agent(state: BankingState, config) -> Command[Literal["coordinator_agent", "human"]]:
     thread_id = config["configurable"].get("thread_id", "UNKNOWN_THREAD_ID")
     userId = config["configurable"].get("userId", "UNKNOWN_USER_ID")
     tenantId = config["configurable"].get("tenantId", "UNKNOWN_TENANT_ID")
@@ -94,11 +130,9 @@ def call_coordinator_agent(state: MessagesState, config) -> Command[Literal["coo
     logging.debug(f"Calling coordinator agent with Thread ID: {thread_id}")
 
     # Get the active agent from Cosmos DB with a point lookup
-    partition_key = [tenantId, userId, thread_id]
     activeAgent = None
     try:
-        activeAgent = chat_container.read_item(item=thread_id, partition_key=partition_key).get('activeAgent',
-                                                                                                'unknown')
+        activeAgent = await fetch_active_agent_async(tenantId, userId, thread_id)
     except Exception as e:
         logging.debug(f"No active agent found: {e}")
 
@@ -124,50 +158,57 @@ def call_coordinator_agent(state: MessagesState, config) -> Command[Literal["coo
         logging.debug(f"Routing straight to last active agent: {activeAgent}")
         return Command(update=state, goto=activeAgent)
     else:
-        response = coordinator_agent.invoke(state)
+        # Clear-cut requests are routed by embedding similarity, saving the coordinator LLM round trip
+        last_message = state["messages"][-1] if state["messages"] else None
+        if getattr(last_message, "type", None) == "human":
+            routed_agent = await fast_route(last_message.content)
+            if routed_agent is not None:
+                logging.debug(f"Fast router routing to: {routed_agent}")
+                return Command(update=state, goto=routed_agent)
+        response = await invoke_agent("coordinator_agent", state)
         return Command(update=response, goto="human")
 
 
 @traceable(run_type="llm")
-def call_customer_support_agent(state: MessagesState, config) -> Command[Literal["customer_support_agent", "human"]]:
+async def call_customer_support_agent(state: BankingState, config) -> Command[Literal["customer_support_agent", "human"]]:
     thread_id = config["configurable"].get("thread_id", "UNKNOWN_THREAD_ID")
     if local_interactive_mode:
         patch_active_agent(tenantId="cli-test", userId="cli-test", sessionId=thread_id,
                            activeAgent="customer_support_agent")
-    response = customer_support_agent.invoke(state)
+    response = await invoke_agent("customer_support_agent", state)
     return Command(update=response, goto="human")
 
 
 @traceable(run_type="llm")
-def call_sales_agent(state: MessagesState, config) -> Command[Literal["sales_agent", "human"]]:
+async def call_sales_agent(state: BankingState, config) -> Command[Literal["sales_agent", "human"]]:
     thread_id = config["configurable"].get("thread_id", "UNKNOWN_THREAD_ID")
     if local_interactive_mode:
         patch_active_agent(tenantId="cli-test", userId="cli-test", sessionId=thread_id,
                            activeAgent="sales_agent")
-    response = sales_agent.invoke(state, config)  # Invoke sales agent with state
+    response = await invoke_agent("sales_agent", state, config)  # Invoke sales agent with state
     return Command(update=response, goto="human")
 
 
 @traceable(run_type="llm")
-def call_transactions_agent(state: MessagesState, config) -> Command[Literal["transactions_agent", "human"]]:
+async def call_transactions_agent(state: BankingState, config) -> Command[Literal["transactions_agent", "human"]]:
     thread_id = config["configurable"].get("thread_id", "UNKNOWN_THREAD_ID")
     if local_interactive_mode:
         patch_active_agent(tenantId="cli-test", userId="cli-test", sessionId=thread_id,
                            activeAgent="transactions_agent")
-    response = transactions_agent.invoke(state)
+    response = await invoke_agent("transactions_agent", state)
     return Command(update=response, goto="human")
 
 
 # The human_node with interrupt function serves as a mechanism to stop
 # the graph and collect user input for multi-turn conversations.
 @traceable
-def human_node(state: MessagesState, config) -> None:
+def human_node(state: BankingState, config) -> None:
     """A node for collecting user input."""
     interrupt(value="Ready for user input.")
     return None
 
 
-builder = StateGraph(MessagesState)
+builder = StateGraph(BankingState)
 builder.add_node("coordinator_agent", call_coordinator_agent)
 builder.add_node("customer_support_agent", call_customer_support_agent)
 builder.add_node("sales_agent", call_sales_agent)
@@ -176,11 +217,20 @@ builder.add_node("human", human_node)
 
 builder.add_edge(START, "coordinator_agent")
 
-checkpointer = CosmosDBSaver(database_name=DATABASE_NAME, container_name=checkpoint_container)
-graph = builder.compile(checkpointer=checkpointer)
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    return HybridCheckpointSaver(AsyncCosmosDBSaver(database_name=DATABASE_NAME,
+                                                    container_name=get_checkpoint_container(),
+                                                    serde=create_checkpoint_serializer()))
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    return builder.compile(checkpointer=get_checkpointer())
 
 
-def interactive_chat():
+async def interactive_chat():
     thread_config = {"configurable": {"thread_id": str(uuid.uuid4()), "userId": "Mark", "tenantId": "Contoso"}}
     global local_interactive_mode
     local_interactive_mode = True
@@ -196,7 +246,7 @@ def interactive_chat():
 
         response_found = False  # Track if we received an AI response
 
-        for update in graph.stream(
+        async for update in get_graph().astream(
                 input_message,
                 config=thread_config,
                 stream_mode="updates",
@@ -217,4 +267,4 @@ def interactive_chat():
 
 
 if __name__ == "__main__":
-    interactive_chat()
+    asyncio.run(interactive_chat())
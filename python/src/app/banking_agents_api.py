@@ -1,5 +1,9 @@
+import asyncio
+import json
 import os
 import uuid
+from contextlib import asynccontextmanager
+
 import fastapi
 
 from dotenv import load_dotenv
@@ -11,20 +15,38 @@ from azure.monitor.opentelemetry import configure_azure_monitor
 
 from azure.cosmos.exceptions import CosmosHttpResponseError
 
-from fastapi import Depends, HTTPException, Body
-from langchain_core.messages import HumanMessage, ToolMessage
+from fastapi import Depends, HTTPException, Body, Response, Request
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, AIMessageChunk
 from pydantic import BaseModel
-from typing import List, Dict
-from src.app.services.azure_open_ai import model
+from typing import List, Dict, Optional
+from src.app.services.azure_open_ai import get_chat_model, close_http_clients
 from langgraph_checkpoint_cosmosdb import CosmosDBSaver
 from langgraph.graph.state import CompiledStateGraph
 from starlette.middleware.cors import CORSMiddleware
-from src.app.banking_agents import graph, checkpointer
+from src.app.banking_agents import get_graph, get_checkpointer
 from src.app.services.azure_cosmos_db import update_chat_container, patch_active_agent, \
     fetch_chat_container_by_tenant_and_user, \
-    fetch_chat_container_by_session, delete_userdata_item, debug_container, update_users_container, \
+    fetch_chat_container_by_session, delete_userdata_item, get_debug_container, update_users_container, \
     update_account_container, update_offers_container, store_chat_history, update_active_agent_in_latest_message, \
-    chat_container, fetch_chat_history_by_session, delete_chat_history_by_session
+    fetch_chat_history_by_session, delete_chat_history_by_session, fetch_active_agent_async, \
+    fetch_chat_sessions_page, fetch_chat_history_by_sessions, fetch_chat_history_page, \
+    patch_active_agent_async, close_async_cosmos_client
+from src.app.services.chat_history_writer import start_chat_history_writer, stop_chat_history_writer, \
+    enqueue_chat_history
+from src.app.services.offer_index import load_offer_index, offer_index
+from src.app.services.semantic_cache import is_cacheable_prompt, embed_prompt, lookup_semantic_cache, \
+    store_semantic_cache, reset_semantic_cache_for_tenant, semantic_cache_metrics
+from src.app.services.checkpoint_compaction import run_compaction_service, mark_thread_dirty, forget_thread, \
+    delete_thread_records, compaction_metrics
+from src.app.services.ledger import run_transfer_recovery_service, ledger_metrics
+from src.app.services.bulk_loader import bulk_load
+from src.app.services.hybrid_checkpointer import HybridCheckpointSaver, hybrid_checkpoint_metrics
+from src.app.services.account_rollups import run_account_rollup_service
+from src.app.services.session_state_cache import session_state_metrics
+from src.app.services.fast_router import router_metrics
+from src.app.services.debug_log_writer import start_debug_log_writer, stop_debug_log_writer, submit_debug_log, \
+    get_pending_debug_log, debug_log_metrics
 import logging
 
 # Setup logging
@@ -32,12 +54,12 @@ logging.basicConfig(level=logging.ERROR)
 
 load_dotenv(override=False)
 
-configure_azure_monitor()
-
-
 endpointTitle = "ChatEndpoints"
 dataLoadTitle = "DataLoadEndpoints"
 
+# Response header carrying the token for the next page of paginated list endpoints
+CONTINUATION_TOKEN_HEADER = "x-continuation-token"
+
 # Mapping for agent function names to standardized names
 agent_mapping = {
     "coordinator_agent": "Coordinator",
@@ -48,10 +70,36 @@ agent_mapping = {
 
 
 def get_compiled_graph():
-    return graph
+    return get_graph()
+
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    # Clients, agents and the compiled graph are created here, once per worker process after it has been forked,
+    # instead of as a side effect of importing the modules.
+    configure_azure_monitor()
+    get_graph()
+    start_chat_history_writer()
+    start_debug_log_writer()
+    await asyncio.to_thread(load_offer_index)
+    compaction_task = asyncio.create_task(run_compaction_service(get_checkpointer()))
+    transfer_recovery_task = asyncio.create_task(run_transfer_recovery_service())
+    account_rollup_task = asyncio.create_task(run_account_rollup_service())
+
+    yield
+
+    compaction_task.cancel()
+    transfer_recovery_task.cancel()
+    account_rollup_task.cancel()
+    await get_checkpointer().drain()
+    await stop_chat_history_writer()
+    await stop_debug_log_writer()
+    await close_async_cosmos_client()
+    await close_http_clients()
 
 
-app = fastapi.FastAPI(title="Cosmos DB Multi-Agent Banking API", openapi_url="/cosmos-multi-agent-api.json")
+app = fastapi.FastAPI(title="Cosmos DB Multi-Agent Banking API", openapi_url="/cosmos-multi-agent-api.json",
+                      lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -59,6 +107,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CONTINUATION_TOKEN_HEADER],
 )
 
 
@@ -108,80 +157,21 @@ class DebugLog(BaseModel):
     propertyBag: list
 
 
-def store_debug_log(sessionId, tenantId, userId, response_data):
-    """Stores detailed debug log information in Cosmos DB."""
+async def store_debug_log(sessionId, tenantId, userId, response_data, extra_properties=None):
+    """
+    Queues detailed debug log information for the background writer and returns its id straight away.
+    The document is built and stored in Cosmos DB after the response has been sent.
+    """
     debug_log_id = str(uuid.uuid4())
-    message_id = str(uuid.uuid4())
-    timestamp = datetime.utcnow().isoformat()
-
-    # Extract relevant debug details
-    agent_selected = "Unknown"
-    previous_agent = "Unknown"
-    finish_reason = "Unknown"
-    model_name = "Unknown"
-    system_fingerprint = "Unknown"
-    input_tokens = 0
-    output_tokens = 0
-    total_tokens = 0
-    cached_tokens = 0
-    transfer_success = False
-    tool_calls = []
-    logprobs = None
-    content_filter_results = {}
-
-    for entry in response_data:
-        for agent, details in entry.items():
-            if "messages" in details:
-                for msg in details["messages"]:
-                    if hasattr(msg, "response_metadata"):
-                        metadata = msg.response_metadata
-                        finish_reason = metadata.get("finish_reason", finish_reason)
-                        model_name = metadata.get("model_name", model_name)
-                        system_fingerprint = metadata.get("system_fingerprint", system_fingerprint)
-                        input_tokens = metadata.get("token_usage", {}).get("prompt_tokens", input_tokens)
-                        output_tokens = metadata.get("token_usage", {}).get("completion_tokens", output_tokens)
-                        total_tokens = metadata.get("token_usage", {}).get("total_tokens", total_tokens)
-                        cached_tokens = metadata.get("token_usage", {}).get("prompt_tokens_details", {}).get(
-                            "cached_tokens", cached_tokens)
-                        logprobs = metadata.get("logprobs", logprobs)
-                        content_filter_results = metadata.get("content_filter_results", content_filter_results)
-
-                        if "tool_calls" in msg.additional_kwargs:
-                            tool_calls.extend(msg.additional_kwargs["tool_calls"])
-                            transfer_success = any(
-                                call.get("name", "").startswith("transfer_to_") for call in tool_calls)
-                            previous_agent = agent_selected
-                            agent_selected = tool_calls[-1].get("name", "").replace("transfer_to_",
-                                                                                    "") if tool_calls else agent_selected
-
-    property_bag = [
-        {"key": "agent_selected", "value": agent_selected, "timeStamp": timestamp},
-        {"key": "previous_agent", "value": previous_agent, "timeStamp": timestamp},
-        {"key": "finish_reason", "value": finish_reason, "timeStamp": timestamp},
-        {"key": "model_name", "value": model_name, "timeStamp": timestamp},
-        {"key": "system_fingerprint", "value": system_fingerprint, "timeStamp": timestamp},
-        {"key": "input_tokens", "value": input_tokens, "timeStamp": timestamp},
-        {"key": "output_tokens", "value": output_tokens, "timeStamp": timestamp},
-        {"key": "total_tokens", "value": total_tokens, "timeStamp": timestamp},
-        {"key": "cached_tokens", "value": cached_tokens, "timeStamp": timestamp},
-        {"key": "transfer_success", "value": transfer_success, "timeStamp": timestamp},
-        {"key": "tool_calls", "value": str(tool_calls), "timeStamp": timestamp},
-        {"key": "logprobs", "value": str(logprobs), "timeStamp": timestamp},
-        {"key": "content_filter_results", "value": str(content_filter_results), "timeStamp": timestamp}
-    ]
-
-    debug_entry = {
-        "id": debug_log_id,
-        "messageId": message_id,
-        "type": "debug_log",
+    submit_debug_log(debug_log_id, {
+        "message_id": str(uuid.uuid4()),
+        "timestamp": datetime.utcnow().isoformat(),
         "sessionId": sessionId,
         "tenantId": tenantId,
         "userId": userId,
-        "timeStamp": timestamp,
-        "propertyBag": property_bag
-    }
-
-    debug_container.create_item(debug_entry)
+        "response_data": response_data,
+        "extra_properties": extra_properties
+    })
     return debug_log_id
 
 
@@ -232,11 +222,10 @@ def _fetch_messages_for_session(sessionId: str, tenantId: str, userId: str) -> L
     }
 
     logging.debug(f"Fetching messages for sessionId: {sessionId} with config: {config}")
-    checkpoints = list(checkpointer.list(config))
-    logging.debug(f"Number of checkpoints retrieved: {len(checkpoints)}")
+    last_checkpoint = get_checkpointer().get_tuple(config)
+    logging.debug(f"Latest checkpoint found: {last_checkpoint is not None}")
 
-    if checkpoints:
-        last_checkpoint = checkpoints[-1]
+    if last_checkpoint:
         for key, value in last_checkpoint.checkpoint.items():
             if key == "channel_values" and "messages" in value:
                 messages.extend(value["messages"])
@@ -272,15 +261,26 @@ def _fetch_messages_for_session(sessionId: str, tenantId: str, userId: str) -> L
 
 
 @app.get("/tenant/{tenantId}/user/{userId}/sessions",
-         description="Retrieves sessions from the given tenantId and userId", tags=[endpointTitle],
-         response_model=List[Session])
-def get_chat_sessions(tenantId: str, userId: str):
-    items = fetch_chat_container_by_tenant_and_user(tenantId, userId)
+         description="Retrieves sessions from the given tenantId and userId. Messages are only included when "
+                     "includeMessages is set, and are then fetched for all sessions in a single query. "
+                     "When pageSize is given, the token for the next page is returned in the "
+                     f"{CONTINUATION_TOKEN_HEADER} response header.",
+         tags=[endpointTitle], response_model=List[Session])
+def get_chat_sessions(tenantId: str, userId: str, response: Response, includeMessages: bool = False,
+                      pageSize: Optional[int] = None, continuationToken: Optional[str] = None):
+    if pageSize:
+        items, next_token = fetch_chat_sessions_page(tenantId, userId, pageSize, continuationToken)
+        if next_token:
+            response.headers[CONTINUATION_TOKEN_HEADER] = next_token
+    else:
+        items = fetch_chat_container_by_tenant_and_user(tenantId, userId)
+
+    history = fetch_chat_history_by_sessions([item["sessionId"] for item in items]) if includeMessages else {}
     sessions = []
 
     for item in items:
         sessionId = item["sessionId"]
-        messages = fetch_chat_history_by_session(sessionId)
+        messages = history.get(sessionId, [])
 
         session = {
             "id": sessionId,
@@ -298,9 +298,18 @@ def get_chat_sessions(tenantId: str, userId: str):
 
 
 @app.get("/tenant/{tenantId}/user/{userId}/sessions/{sessionId}/messages",
-         description="Retrieves messages from the sessionId", tags=[endpointTitle], response_model=List[MessageModel])
-def get_chat_session(tenantId: str, userId: str, sessionId: str):
-    return fetch_chat_history_by_session(sessionId)
+         description="Retrieves messages from the sessionId. When pageSize is given, the token for the next page is "
+                     f"returned in the {CONTINUATION_TOKEN_HEADER} response header.",
+         tags=[endpointTitle], response_model=List[MessageModel])
+def get_chat_session(tenantId: str, userId: str, sessionId: str, response: Response,
+                     pageSize: Optional[int] = None, continuationToken: Optional[str] = None):
+    if not pageSize:
+        return fetch_chat_history_by_session(sessionId)
+
+    messages, next_token = fetch_chat_history_page(sessionId, pageSize, continuationToken)
+    if next_token:
+        response.headers[CONTINUATION_TOKEN_HEADER] = next_token
+    return messages
 
 
 # to be implemented
@@ -329,8 +338,12 @@ def rate_message(tenantId: str, userId: str, sessionId: str, messageId: str, rat
          description="Retrieves debug information for chat completions", tags=[endpointTitle],
          operation_id="GetChatCompletionDetails", response_model=DebugLog)
 def get_chat_completion_details(tenantId: str, userId: str, sessionId: str, debuglogId: str):
+    # The debug log may still be queued for the background writer
+    pending_debug_log = get_pending_debug_log(debuglogId)
+    if pending_debug_log is not None:
+        return pending_debug_log
     try:
-        debug_log = debug_container.read_item(item=debuglogId, partition_key=sessionId)
+        debug_log = get_debug_container().read_item(item=debuglogId, partition_key=sessionId)
         return debug_log
     except Exception:
         raise HTTPException(status_code=404, detail="Debug log not found")
@@ -356,51 +369,20 @@ def rename_chat_session(tenantId: str, userId: str, sessionId: str, newChatSessi
 
 def delete_all_thread_records(cosmos_saver: CosmosDBSaver, thread_id: str) -> None:
     """
-    Deletes all records related to a given thread in CosmosDB by first identifying all partition keys
-    and then deleting every record under each partition key.
+    Deletes all records related to a given thread in CosmosDB. Their partitions are derived from the thread id
+    and its recorded namespaces, so no query has to scan the container.
     """
-
-    # Step 1: Identify all partition keys related to the thread
-    query = "SELECT DISTINCT c.partition_key FROM c WHERE CONTAINS(c.partition_key, @thread_id)"
-    parameters = [{"name": "@thread_id", "value": thread_id}]
-
-    partition_keys = list(cosmos_saver.container.query_items(
-        query=query, parameters=parameters, enable_cross_partition_query=True
-    ))
-
-    if not partition_keys:
-        print(f"No records found for thread: {thread_id}")
-        return
-
-    print(f"Found {len(partition_keys)} partition keys related to the thread.")
-
-    # Step 2: Delete all records under each partition key
-    for partition in partition_keys:
-        partition_key = partition["partition_key"]
-
-        # Query all records under the current partition
-        record_query = "SELECT c.id FROM c WHERE c.partition_key=@partition_key"
-        record_parameters = [{"name": "@partition_key", "value": partition_key}]
-
-        records = list(cosmos_saver.container.query_items(
-            query=record_query, parameters=record_parameters, enable_cross_partition_query=True
-        ))
-
-        for record in records:
-            record_id = record["id"]
-            try:
-                cosmos_saver.container.delete_item(record_id, partition_key=partition_key)
-                print(f"Deleted record: {record_id} from partition: {partition_key}")
-            except CosmosHttpResponseError as e:
-                print(f"Error deleting record {record_id} (HTTP {e.status_code}): {e.message}")
-
-    print(f"Successfully deleted all records for thread: {thread_id}")
+    deleted = delete_thread_records(cosmos_saver.container, thread_id)
+    forget_thread(thread_id)
+    print(f"Successfully deleted {deleted} records for thread: {thread_id}")
 
 
 # deletes the session user data container and all messages in the checkpointer store
 @app.delete("/tenant/{tenantId}/user/{userId}/sessions/{sessionId}", tags=[endpointTitle], )
-def delete_chat_session(tenantId: str, userId: str, sessionId: str, background_tasks: BackgroundTasks):
+def delete_chat_session(tenantId: str, userId: str, sessionId: str, background_tasks: BackgroundTasks,
+                        checkpointer: HybridCheckpointSaver = Depends(get_checkpointer)):
     delete_userdata_item(tenantId, userId, sessionId)
+    checkpointer.evict_thread(sessionId)
 
     # Delete all messages in the checkpointer store
     config = {
@@ -422,14 +404,16 @@ def create_chat_session(tenantId: str, userId: str):
     return create_thread(tenantId, userId)
 
 
-def extract_relevant_messages(debug_lod_id, last_active_agent, response_data, tenantId, userId, sessionId):
+async def extract_relevant_messages(debug_lod_id, last_active_agent, response_data, tenantId, userId, sessionId,
+                                    request_body):
+    """
+    Returns the messages of a turn: the user message, and the replies of the agent that answered. The agents
+    only return the messages they added, so the user message is taken from the request.
+    """
     # Convert last_active_agent to its mapped value
     last_active_agent = agent_mapping.get(last_active_agent, last_active_agent)
 
     debug_lod_id = debug_lod_id
-    if not response_data:
-        return []
-
     last_agent_node = None
     last_agent_name = "unknown"
     for i in range(len(response_data) - 1, -1, -1):
@@ -441,26 +425,14 @@ def extract_relevant_messages(debug_lod_id, last_active_agent, response_data, te
 
     # storing the last active agent in the session container so that we can retrieve it later
     # and deterministically route the incoming message directly to the agent that asked the question.
-    patch_active_agent(tenantId, userId, sessionId, last_agent_name)
+    await patch_active_agent_async(tenantId, userId, sessionId, last_agent_name)
 
-    if not last_agent_node:
-        return []
-
-    messages = []
-    for key, value in last_agent_node.items():
+    replies = []
+    for key, value in (last_agent_node or {}).items():
         if isinstance(value, dict) and "messages" in value:
-            messages.extend(value["messages"])
-
-    last_user_index = -1
-    for i in range(len(messages) - 1, -1, -1):
-        if isinstance(messages[i], HumanMessage):
-            last_user_index = i
-            break
+            replies.extend(msg for msg in value["messages"] if not isinstance(msg, (HumanMessage, ToolMessage)))
 
-    if last_user_index == -1:
-        return []
-
-    filtered_messages = [msg for msg in messages[last_user_index:] if not isinstance(msg, ToolMessage)]
+    filtered_messages = [HumanMessage(content=request_body)] + replies
 
     return [
         MessageModel(
@@ -484,31 +456,100 @@ def extract_relevant_messages(debug_lod_id, last_active_agent, response_data, te
     ]
 
 
-def process_messages(messages, userId, tenantId, sessionId):
-    for message in messages:
-        item = {
-            "id": message.id,
-            "type": message.type,
-            "sessionId": message.sessionId,
-            "tenantId": message.tenantId,
-            "userId": message.userId,
-            "timeStamp": message.timeStamp,
-            "sender": message.sender,
-            "senderRole": message.senderRole,
-            "text": message.text,
-            "debugLogId": message.debugLogId,
-            "tokensUsed": message.tokensUsed,
-            "rating": message.rating,
-            "completionPromptId": message.completionPromptId
-        }
-        store_chat_history(item)
+async def process_messages(messages, userId, tenantId, sessionId):
+    # The sender of the last message is already set to the active agent, so the turn is written once,
+    # in a single transactional batch on the session partition, by the background chat history writer.
+    items = [message.model_dump() for message in messages]
+    await enqueue_chat_history(sessionId, items)
 
-    partition_key = [tenantId, userId, sessionId]
-    # Get the active agent from Cosmos DB with a point lookup
-    activeAgent = chat_container.read_item(item=sessionId, partition_key=partition_key).get('activeAgent', 'unknown')
 
-    last_active_agent = agent_mapping.get(activeAgent, activeAgent)
-    update_active_agent_in_latest_message(sessionId, last_active_agent)
+async def prepare_graph_input(tenantId, userId, sessionId, request_body):
+    """
+    Builds the graph input for a new user message and returns it with the last active agent. Only the new
+    message is sent: the graph appends it to the messages stored with the thread, so the previous state is
+    neither read back from the checkpointer nor re-submitted and re-written on every turn.
+    """
+    # The agent that asked the last question is kept with the session, and usually served from the session cache
+    try:
+        last_active_agent = await fetch_active_agent_async(tenantId, userId, sessionId)
+    except Exception:
+        last_active_agent = "unknown"
+    if last_active_agent == "unknown":
+        last_active_agent = "coordinator_agent"  # Default fallback
+
+    return {"messages": [HumanMessage(content=request_body)]}, last_active_agent
+
+
+async def complete_turn(tenantId, userId, sessionId, last_active_agent, response_data, request_body):
+    """Stores the debug log and chat history of a finished graph run and returns the messages of the turn."""
+    debug_log_id = await store_debug_log(sessionId, tenantId, userId, response_data)
+
+    messages = await extract_relevant_messages(debug_log_id, last_active_agent, response_data, tenantId, userId,
+                                               sessionId, request_body)
+
+    # update last sender in messages to the active agent, unless no agent replied
+    if messages and messages[-1].senderRole != "User":
+        # Get the active agent from Cosmos DB with a point lookup
+        activeAgent = await fetch_active_agent_async(tenantId, userId, sessionId)
+        messages[-1].sender = agent_mapping.get(activeAgent, activeAgent)
+
+    # Queue storing chat history for the background writer to avoid blocking the API response
+    # as this is not needed unless retrieving the message history later.
+    await process_messages(messages, userId, tenantId, sessionId)
+
+    # New checkpoints were written for this thread, so include it in the next compaction run
+    mark_thread_dirty(sessionId)
+
+    return messages
+
+
+async def has_prior_turns(workflow, config):
+    state = await workflow.aget_state(config)
+    return bool(state.values.get("messages"))
+
+
+async def complete_cached_turn(workflow, config, tenantId, userId, sessionId, request_body, cached_messages):
+    """
+    Answers a turn from the semantic cache without running the graph and persists it like any other turn: the
+    prompt and cached replies are added to the graph state, so later turns see them, and the agent that answered
+    becomes the active agent of the session.
+    """
+    # The replies were stored under the display name of the agent that gave them
+    node_names = {name: node for node, name in agent_mapping.items()}
+    answering_agent = node_names.get(cached_messages[-1]["sender"], "coordinator_agent")
+    await workflow.aupdate_state(
+        config,
+        {"messages": [HumanMessage(content=request_body)]
+                     + [AIMessage(content=msg["text"]) for msg in cached_messages]},
+        as_node=answering_agent
+    )
+    await patch_active_agent_async(tenantId, userId, sessionId, answering_agent)
+    mark_thread_dirty(sessionId)
+
+    debug_log_id = await store_debug_log(sessionId, tenantId, userId, [], {"semantic_cache_hit": True})
+    timestamp = datetime.utcnow().isoformat()
+    turn = [{"sender": "User", "senderRole": "User", "text": request_body}] + cached_messages
+
+    messages = [
+        MessageModel(
+            id=str(uuid.uuid4()),
+            type="ai_response",
+            sessionId=sessionId,
+            tenantId=tenantId,
+            userId=userId,
+            timeStamp=timestamp,
+            sender=msg["sender"],
+            senderRole=msg["senderRole"],
+            text=msg["text"],
+            debugLogId=debug_log_id,
+            tokensUsed=0,
+            rating=True,
+            completionPromptId=""
+        )
+        for msg in turn
+    ]
+    await process_messages(messages, userId, tenantId, sessionId)
+    return messages
 
 
 @app.post("/tenant/{tenantId}/user/{userId}/sessions/{sessionId}/completion", tags=[endpointTitle],
@@ -525,50 +566,130 @@ async def get_chat_completion(
     if not request_body.strip():
         raise HTTPException(status_code=400, detail="Request body cannot be empty")
 
-    # Retrieve last checkpoint
     config = {"configurable": {"thread_id": sessionId, "checkpoint_ns": "", "userId": userId, "tenantId": tenantId}}
-    checkpoints = list(checkpointer.list(config))
-    last_active_agent = "coordinator_agent"  # Default fallback
 
-    if not checkpoints:
-        # No previous state, start fresh
-        new_state = {"messages": [{"role": "user", "content": request_body}]}
-        response_data = workflow.invoke(new_state, config, stream_mode="updates")
-    else:
-        # Resume from last checkpoint
-        last_checkpoint = checkpoints[-1]
-        last_state = last_checkpoint.checkpoint
+    # Near-identical questions within a tenant are answered from the semantic cache, scoped by the active agent.
+    # Only the opening prompt of a thread is considered: later answers depend on the conversation before them.
+    cache_vector = None
+    if is_cacheable_prompt(request_body) and not await has_prior_turns(workflow, config):
+        try:
+            cache_agent = await fetch_active_agent_async(tenantId, userId, sessionId)
+        except Exception:
+            cache_agent = "unknown"
+        cache_vector = await embed_prompt(request_body)
+        cached_messages = await lookup_semantic_cache(tenantId, cache_agent, cache_vector)
+        if cached_messages:
+            return await complete_cached_turn(workflow, config, tenantId, userId, sessionId, request_body,
+                                              cached_messages)
+
+    graph_input, last_active_agent = await prepare_graph_input(tenantId, userId, sessionId, request_body)
+    response_data = await workflow.ainvoke(graph_input, config, stream_mode="updates")
+
+    messages = await complete_turn(tenantId, userId, sessionId, last_active_agent, response_data, request_body)
+
+    if cache_vector is not None:
+        cached_messages = [{"sender": msg.sender, "senderRole": msg.senderRole, "text": msg.text}
+                           for msg in messages if msg.senderRole != "User"]
+        if cached_messages:
+            await store_semantic_cache(tenantId, cache_agent, cache_vector, cached_messages, response_data)
 
-        if "messages" not in last_state:
-            last_state["messages"] = []
+    return messages
 
-        last_state["messages"].append({"role": "user", "content": request_body})
 
-        if "channel_versions" in last_state:
-            for key in reversed(last_state["channel_versions"].keys()):
-                if "agent" in key:
-                    last_active_agent = key.split(":")[1]
-                    break
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-        last_state["langgraph_triggers"] = [f"resume:{last_active_agent}"]
-        response_data = workflow.invoke(last_state, config, stream_mode="updates")
 
-    debug_log_id = store_debug_log(sessionId, tenantId, userId, response_data)
+def message_events(chunk):
+    """Server-sent events for one chunk of the "messages" stream: a token, a tool call or result, or a transfer."""
+    message, metadata = chunk
+    # Tokens of the react agents are emitted from their inner "agent" node, the namespace names the outer one
+    agent = metadata.get("langgraph_checkpoint_ns", "").split(":")[0] or metadata.get("langgraph_node")
 
-    messages = extract_relevant_messages(debug_log_id, last_active_agent, response_data, tenantId, userId, sessionId)
+    if isinstance(message, ToolMessage):
+        yield sse_event("tool_result", {"agent": agent, "name": message.name})
+        return
 
-    partition_key = [tenantId, userId, sessionId]
-    # Get the active agent from Cosmos DB with a point lookup
-    activeAgent = chat_container.read_item(item=sessionId, partition_key=partition_key).get('activeAgent', 'unknown')
+    for tool_call_chunk in getattr(message, "tool_call_chunks", []):
+        name = tool_call_chunk.get("name")
+        if not name:
+            continue
+        if name.startswith("transfer_to_"):
+            yield sse_event("agent_transfer", {"from": agent, "to": name.replace("transfer_to_", "")})
+        else:
+            yield sse_event("tool_call", {"agent": agent, "name": name})
 
-    # update last sender in messages to the active agent
-    messages[-1].sender = agent_mapping.get(activeAgent, activeAgent)
+    if isinstance(message, AIMessageChunk) and message.content:
+        yield sse_event("token", {"agent": agent_mapping.get(agent, agent), "content": message.content})
 
-    # Schedule storing chat history and updating correct agent in last message as a background task
-    # to avoid blocking the API response as this is not needed unless retrieving the message history later.
-    background_tasks.add_task(process_messages, messages, userId, tenantId, sessionId)
 
-    return messages
+# Streamed turns run in their own tasks, referenced here until they finish
+streamed_turns = set()
+
+
+async def run_streamed_turn(workflow, graph_input, config, tenantId, userId, sessionId, last_active_agent, events):
+    """
+    Runs the graph and persists the turn, putting server-sent events on a queue and None once it is over.
+    It does not depend on the client: a client that disconnects mid-stream stops receiving events, but the turn
+    still completes and reaches chat history, matching the graph state it advanced.
+    """
+    response_data = []
+    try:
+        async for mode, chunk in workflow.astream(graph_input, config, stream_mode=["messages", "updates"]):
+            if mode == "updates":
+                response_data.append(chunk)
+                continue
+            for event in message_events(chunk):
+                events.put_nowait(event)
+
+        request_body = graph_input["messages"][-1].content
+        messages = await complete_turn(tenantId, userId, sessionId, last_active_agent, response_data, request_body)
+        events.put_nowait(sse_event("messages", [message.model_dump() for message in messages]))
+    except Exception as e:
+        logging.error(f"Error streaming completion for sessionId: {sessionId}: {e}")
+        events.put_nowait(sse_event("error", {"detail": str(e)}))
+    finally:
+        events.put_nowait(None)
+
+
+async def stream_completion_events(workflow, graph_input, config, tenantId, userId, sessionId, last_active_agent):
+    """
+    Yields server-sent events for a turn: tokens as they are generated, tool calls, tool results and agent
+    transfers, then the final messages once the turn is persisted.
+    """
+    events = asyncio.Queue()
+    turn = asyncio.create_task(run_streamed_turn(workflow, graph_input, config, tenantId, userId, sessionId,
+                                                 last_active_agent, events))
+    streamed_turns.add(turn)
+    turn.add_done_callback(streamed_turns.discard)
+
+    while (event := await events.get()) is not None:
+        yield event
+    yield sse_event("done", {})
+
+
+@app.post("/tenant/{tenantId}/user/{userId}/sessions/{sessionId}/completion/stream", tags=[endpointTitle],
+          operation_id="StreamChatCompletion",
+          description="Streams the completion as server-sent events: token, tool_call, tool_result, agent_transfer, "
+                      "then the final messages and done")
+async def stream_chat_completion(
+        tenantId: str,
+        userId: str,
+        sessionId: str,
+        request_body: str = Body(..., media_type="application/json"),
+        workflow: CompiledStateGraph = Depends(get_compiled_graph),
+):
+    if not request_body.strip():
+        raise HTTPException(status_code=400, detail="Request body cannot be empty")
+
+    config = {"configurable": {"thread_id": sessionId, "checkpoint_ns": "", "userId": userId, "tenantId": tenantId}}
+    graph_input, last_active_agent = await prepare_graph_input(tenantId, userId, sessionId, request_body)
+
+    return StreamingResponse(
+        stream_completion_events(workflow, graph_input, config, tenantId, userId, sessionId, last_active_agent),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/tenant/{tenantId}/user/{userId}/sessions/{sessionId}/summarize-name", tags=[endpointTitle],
@@ -585,7 +706,7 @@ def summarize_chat_session_name(tenantId: str, userId: str, sessionId: str,
             "Summary Name:"
         )
 
-        response = model.invoke(prompt)
+        response = get_chat_model().invoke(prompt)
         summarized_name = response.content.strip()
 
         return summarized_name
@@ -596,9 +717,53 @@ def summarize_chat_session_name(tenantId: str, userId: str, sessionId: str,
 
 @app.post("/tenant/{tenantId}/user/{userId}/semanticcache/reset", tags=[endpointTitle],
           operation_id="ResetSemanticCache", response_description="Success",
-          description="Semantic cache reset - not yet implemented", )
-def reset_semantic_cache(tenantId: str, userId: str):
-    return {"message": "Semantic cache reset not yet implemented"}
+          description="Invalidates the semantic cache of the tenant. Cached responses are shared by the users of a "
+                      "tenant, so the whole tenant scope is cleared.", )
+async def reset_semantic_cache(tenantId: str, userId: str):
+    await reset_semantic_cache_for_tenant(tenantId)
+    return {"message": f"Semantic cache reset for tenant {tenantId}"}
+
+
+@app.get("/semanticcache/metrics", tags=[endpointTitle], operation_id="GetSemanticCacheMetrics",
+         description="Reports semantic cache hits, misses, stores and evictions")
+def get_semantic_cache_metrics():
+    return semantic_cache_metrics
+
+
+@app.get("/checkpoints/compaction/metrics", tags=[endpointTitle], operation_id="GetCheckpointCompactionMetrics",
+         description="Reports bytes reclaimed and per-thread checkpoint counts from checkpoint compaction")
+def get_checkpoint_compaction_metrics():
+    return compaction_metrics
+
+
+@app.get("/checkpoints/metrics", tags=[endpointTitle], operation_id="GetCheckpointMetrics",
+         description="Reports in-memory checkpoint reads and the checkpoint flushes written to Cosmos DB")
+def get_checkpoint_metrics():
+    return hybrid_checkpoint_metrics
+
+
+@app.get("/ledger/metrics", tags=[endpointTitle], operation_id="GetLedgerMetrics",
+         description="Reports applied ledger entries, ETag conflicts, and recovered or reversed transfers")
+def get_ledger_metrics():
+    return ledger_metrics
+
+
+@app.get("/sessionstate/metrics", tags=[endpointTitle], operation_id="GetSessionStateCacheMetrics",
+         description="Reports hits, misses and ETag revalidations of the session state cache")
+def get_session_state_metrics():
+    return session_state_metrics
+
+
+@app.get("/router/metrics", tags=[endpointTitle], operation_id="GetFastRouterMetrics",
+         description="Reports messages routed by embedding similarity and those left to the coordinator agent")
+def get_router_metrics():
+    return router_metrics
+
+
+@app.get("/debuglogs/metrics", tags=[endpointTitle], operation_id="GetDebugLogMetrics",
+         description="Reports queued, written, dropped and truncated debug logs")
+def get_debug_log_metrics():
+    return debug_log_metrics
 
 
 @app.put("/userdata", tags=[dataLoadTitle], description="Inserts or updates a single user data record in Cosmos DB")
@@ -624,6 +789,28 @@ async def put_accountdata(data: Dict):
 async def put_offerdata(data: Dict):
     try:
         update_offers_container(data)
+        offer_index.upsert(data)
         return {"message": "Inserted offer record successfully", "id": data.get("id")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to insert offer data: {str(e)}")
+
+
+@app.post("/userdata/bulk", tags=[dataLoadTitle],
+          description="Inserts or updates user data records streamed as NDJSON or a JSON array, "
+                      "and reports the records that failed")
+async def post_userdata_bulk(request: Request):
+    return await bulk_load("users", request.stream())
+
+
+@app.post("/accountdata/bulk", tags=[dataLoadTitle],
+          description="Inserts or updates account data records streamed as NDJSON or a JSON array, "
+                      "and reports the records that failed")
+async def post_accountdata_bulk(request: Request):
+    return await bulk_load("accounts", request.stream())
+
+
+@app.post("/offerdata/bulk", tags=[dataLoadTitle],
+          description="Inserts or updates offer data records streamed as NDJSON or a JSON array, optionally "
+                      "embedding offer terms that have no vector, and reports the records that failed")
+async def post_offerdata_bulk(request: Request, embed: bool = False):
+    return await bulk_load("offers", request.stream(), embed=embed, on_written=offer_index.upsert)
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError, \
+    CosmosResourceNotFoundError
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_account_container, get_account_rollup_container
+
+load_dotenv(override=False)
+
+ACCOUNT_ROLLUP_FEED_ENABLED = os.getenv("ACCOUNT_ROLLUP_FEED_ENABLED", "true").lower() == "true"
+ACCOUNT_ROLLUP_FEED_INTERVAL_SECONDS = int(os.getenv("ACCOUNT_ROLLUP_FEED_INTERVAL_SECONDS", "5"))
+ACCOUNT_ROLLUP_FEED_PAGE_SIZE = 100
+# Only the worker holding the lease reads the feed; it is taken over by another worker once it expires
+ACCOUNT_ROLLUP_LEASE_SECONDS = int(os.getenv("ACCOUNT_ROLLUP_LEASE_SECONDS", "30"))
+# Longest range of months answered by a single summary
+MAX_SUMMARY_MONTHS = 24
+
+# Rollups, the change feed position and the lease live in the AccountRollups container rather than in
+# AccountsData, so writing them does not feed back into the change feed they are computed from. The position
+# and the lease share one document in its own logical partition.
+FEED_STATE_ID = "changefeed-account-rollups"
+FEED_STATE_PARTITION_KEY = ["ChangeFeed", "accountRollups"]
+
+# Identifies this worker process as the lease owner
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+rollup_metrics = {
+    "feed_batches": 0,
+    "transactions_seen": 0,
+    "rollups_written": 0,
+    "lease_acquired": 0,
+    "lease_lost": 0,
+}
+
+
+def rollup_id(accountId, month):
+    return f"rollup-{accountId}-{month}"
+
+
+def compute_rollups(transactions):
+    """
+    Folds transactions into one rollup per tenant, account and month (YYYY-MM): debit and credit totals and
+    counts, and the balance after the last transaction of the month.
+    """
+    rollups = {}
+    for transaction in sorted(transactions, key=lambda t: t["transactionDateTime"]):
+        month = transaction["transactionDateTime"][:7]
+        key = (transaction["tenantId"], transaction["accountId"], month)
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = {
+                "id": rollup_id(transaction["accountId"], month),
+                "tenantId": transaction["tenantId"],
+                "accountId": transaction["accountId"],
+                "type": "MonthlyRollup",
+                "month": month,
+                "debitTotal": 0,
+                "creditTotal": 0,
+                "debitCount": 0,
+                "creditCount": 0,
+                "transactionCount": 0,
+                "closingBalance": None,
+                "lastTransactionDateTime": None
+            }
+        debit = transaction.get("debitAmount") or 0
+        credit = transaction.get("creditAmount") or 0
+        rollup["debitTotal"] += debit
+        rollup["creditTotal"] += credit
+        rollup["debitCount"] += int(debit > 0)
+        rollup["creditCount"] += int(credit > 0)
+        rollup["transactionCount"] += 1
+        rollup["closingBalance"] = transaction.get("accountBalance")
+        rollup["lastTransactionDateTime"] = transaction["transactionDateTime"]
+    return list(rollups.values())
+
+
+def rebuild_month(tenantId, accountId, month):
+    """
+    Recomputes the rollup of one account and month from its transactions. Rebuilding rather than incrementing
+    keeps the rollup exact when the change feed delivers a transaction more than once.
+    """
+    query = """
+    SELECT c.tenantId, c.accountId, c.debitAmount, c.creditAmount, c.accountBalance, c.transactionDateTime
+    FROM c WHERE c.type = 'BankTransaction' AND STARTSWITH(c.transactionDateTime, @month)
+    """
+    parameters = [{"name": "@month", "value": month}]
+    transactions = list(get_account_container().query_items(query=query, parameters=parameters,
+                                                            partition_key=[tenantId, accountId]))
+    for rollup in compute_rollups(transactions):
+        get_account_rollup_container().upsert_item(rollup)
+        rollup_metrics["rollups_written"] += 1
+
+
+def acquire_feed_lease():
+    """
+    Takes or renews the lease on the change feed and returns the feed state, or None when another worker holds
+    an unexpired lease. The lease is written with the ETag that was read, so two workers cannot both take it.
+    """
+    container = get_account_rollup_container()
+    now = time.time()
+    try:
+        state = container.read_item(item=FEED_STATE_ID, partition_key=FEED_STATE_PARTITION_KEY)
+    except CosmosResourceNotFoundError:
+        state = None
+
+    if state is not None and state.get("owner") not in (None, WORKER_ID) and state.get("leaseExpiresAt", 0) > now:
+        return None
+    taken_over = state is None or state.get("owner") != WORKER_ID
+    lease = {
+        "id": FEED_STATE_ID,
+        "tenantId": FEED_STATE_PARTITION_KEY[0],
+        "accountId": FEED_STATE_PARTITION_KEY[1],
+        "type": "ChangeFeedState",
+        "continuation": state.get("continuation") if state else None,
+        "owner": WORKER_ID,
+        "leaseExpiresAt": now + ACCOUNT_ROLLUP_LEASE_SECONDS
+    }
+    try:
+        if state is None:
+            state = container.create_item(lease)
+        else:
+            state = container.replace_item(item=FEED_STATE_ID, body=lease, etag=state["_etag"],
+                                           match_condition=MatchConditions.IfNotModified)
+    except (CosmosResourceExistsError, CosmosAccessConditionFailedError):
+        # Another worker took the lease between the read and the write
+        return None
+    if taken_over:
+        rollup_metrics["lease_acquired"] += 1
+    return state
+
+
+def save_feed_continuation(state, continuation):
+    """Stores the new feed position, unless the lease was lost in the meantime. Returns False when it was."""
+    try:
+        get_account_rollup_container().replace_item(item=FEED_STATE_ID, body={**state, "continuation": continuation},
+                                                    etag=state["_etag"],
+                                                    match_condition=MatchConditions.IfNotModified)
+        return True
+    except CosmosAccessConditionFailedError:
+        rollup_metrics["lease_lost"] += 1
+        return False
+
+
+def process_rollup_feed():
+    """
+    Reads the AccountsData changes since the stored position and rebuilds the rollups of every account and
+    month that received transactions. Only the lease holder reads the feed, and the position is saved after
+    the rollups and only when it moved, so changes are processed at least once.
+    """
+    state = acquire_feed_lease()
+    if state is None:
+        return
+    container = get_account_container()
+    continuation = state.get("continuation")
+    feed = container.query_items_change_feed(is_start_from_beginning=continuation is None, continuation=continuation,
+                                             max_item_count=ACCOUNT_ROLLUP_FEED_PAGE_SIZE)
+    affected = set()
+    for item in feed:
+        if item.get("type") == "BankTransaction" and item.get("transactionDateTime"):
+            affected.add((item["tenantId"], item["accountId"], item["transactionDateTime"][:7]))
+            rollup_metrics["transactions_seen"] += 1
+    new_continuation = container.client_connection.last_response_headers.get("etag")
+
+    for tenantId, accountId, month in affected:
+        rebuild_month(tenantId, accountId, month)
+    if new_continuation and new_continuation != continuation:
+        save_feed_continuation(state, new_continuation)
+    rollup_metrics["feed_batches"] += 1
+
+
+async def run_account_rollup_service(interval_seconds: int = ACCOUNT_ROLLUP_FEED_INTERVAL_SECONDS) -> None:
+    """Background loop that keeps the monthly rollups up to date from the change feed."""
+    if not ACCOUNT_ROLLUP_FEED_ENABLED:
+        return
+    while True:
+        try:
+            await asyncio.to_thread(process_rollup_feed)
+        except Exception as e:
+            print(f"[ERROR] Error processing account rollup change feed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def months_between(startMonth, endMonth):
+    """Months from startMonth to endMonth inclusive. Ranges longer than MAX_SUMMARY_MONTHS are rejected."""
+    start = datetime.strptime(startMonth, "%Y-%m")
+    end = datetime.strptime(endMonth, "%Y-%m")
+    count = (end.year - start.year) * 12 + end.month - start.month + 1
+    if count > MAX_SUMMARY_MONTHS:
+        raise ValueError(f"A summary covers at most {MAX_SUMMARY_MONTHS} months, {startMonth} to {endMonth} "
+                         f"is {count} months")
+    months = []
+    year, month = start.year, start.month
+    for _ in range(count):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def fetch_monthly_rollups(tenantId, accountId, startMonth, endMonth):
+    """Point reads the rollup of each month in the range; months without transactions are omitted."""
+    rollups = []
+    for month in months_between(startMonth, endMonth):
+        try:
+            rollups.append(get_account_rollup_container().read_item(item=rollup_id(accountId, month),
+                                                                    partition_key=[tenantId, accountId]))
+        except CosmosResourceNotFoundError:
+            continue
+    return rollups
+
+
+def summarize_rollups(rollups):
+    fields = ("month", "debitTotal", "creditTotal", "debitCount", "creditCount", "transactionCount", "closingBalance")
+    return {
+        "months": [{field: rollup[field] for field in fields} for rollup in rollups],
+        "debitTotal": sum(rollup["debitTotal"] for rollup in rollups),
+        "creditTotal": sum(rollup["creditTotal"] for rollup in rollups),
+        "transactionCount": sum(rollup["transactionCount"] for rollup in rollups),
+        "closingBalance": rollups[-1]["closingBalance"] if rollups else None
+    }
+
+
+def replay_rollups_from_file(path, write=False):
+    """
+    Rebuilds the rollups from a data file such as data/AccountsData.json without reading the change feed,
+    optionally writing them to Cosmos DB. Used to test the rollups against known data.
+    """
+    with open(path, encoding="utf-8") as data_file:
+        documents = json.load(data_file)
+    rollups = compute_rollups([document for document in documents if document.get("type") == "BankTransaction"])
+    if write:
+        for rollup in rollups:
+            get_account_rollup_container().upsert_item(rollup)
+    return rollups
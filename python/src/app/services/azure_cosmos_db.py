@@ -3,11 +3,18 @@ import os
 from datetime import datetime
 from typing import List, Dict
 import re
+from functools import lru_cache
 
+from azure.core import MatchConditions
 from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
 from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
 from dotenv import load_dotenv
 
+from src.app.services.session_state_cache import session_state_cache, session_state_metrics
+
 logging.basicConfig(level=logging.ERROR)
 
 load_dotenv(override=False)
@@ -15,49 +22,118 @@ load_dotenv(override=False)
 COSMOS_DB_URL = os.getenv("COSMOSDB_ENDPOINT")
 DATABASE_NAME = "MultiAgentBanking"
 
-cosmos_client = None
-database = None
-container = None
-
-# Define Cosmos DB containers
-chat_container = None
-debug_container = None
-chat_history_container = None
-users_container = None
-offers_container = None
-account_container = None
-
-try:
-    credential = DefaultAzureCredential()
-    cosmos_client = CosmosClient(COSMOS_DB_URL, credential=credential)
-    print("[DEBUG] Connected to Cosmos DB successfully using DefaultAzureCredential.")
-except Exception as dac_error:
-    print(f"[ERROR] Failed to authenticate using DefaultAzureCredential: {dac_error}")
-    raise dac_error
-
-# Initialize Cosmos DB client and containers
-try:
-    database = cosmos_client.get_database_client(DATABASE_NAME)
-    print(f"[DEBUG] Connected to Cosmos DB: {DATABASE_NAME}")
-
-    chat_container = database.get_container_client("Chat")
-    checkpoint_container = database.get_container_client("Checkpoints")
-    chat_history_container = database.get_container_client("ChatHistory")
-    users_container = database.get_container_client("Users")
-    offers_container = database.get_container_client("OffersData")
-    account_container = database.get_container_client("AccountsData")
-    debug_container = database.get_container_client("Debug")
-
-except Exception as e:
-    print(f"[ERROR] Error initializing Cosmos DB Containers: {e}")
-    raise e
+# Clients and containers are created on first use rather than at import time, so importing this module
+# (in tests, tooling or before a worker forks) does not authenticate or open connections.
+@lru_cache(maxsize=None)
+def get_cosmos_client():
+    try:
+        credential = DefaultAzureCredential()
+        cosmos_client = CosmosClient(COSMOS_DB_URL, credential=credential)
+        print("[DEBUG] Connected to Cosmos DB successfully using DefaultAzureCredential.")
+        return cosmos_client
+    except Exception as dac_error:
+        print(f"[ERROR] Failed to authenticate using DefaultAzureCredential: {dac_error}")
+        raise dac_error
+
+
+@lru_cache(maxsize=None)
+def get_container(container_name):
+    try:
+        database = get_cosmos_client().get_database_client(DATABASE_NAME)
+        return database.get_container_client(container_name)
+    except Exception as e:
+        print(f"[ERROR] Error initializing Cosmos DB Container {container_name}: {e}")
+        raise e
+
+
+# Async client used by the request path so that Cosmos DB I/O does not block the event loop
+@lru_cache(maxsize=None)
+def get_async_credential():
+    return AsyncDefaultAzureCredential()
+
+
+@lru_cache(maxsize=None)
+def get_async_cosmos_client():
+    try:
+        async_cosmos_client = AsyncCosmosClient(COSMOS_DB_URL, credential=get_async_credential())
+        print("[DEBUG] Initialized async Cosmos DB client.")
+        return async_cosmos_client
+    except Exception as e:
+        print(f"[ERROR] Error initializing async Cosmos DB client: {e}")
+        raise e
+
+
+@lru_cache(maxsize=None)
+def get_async_container(container_name):
+    return get_async_cosmos_client().get_database_client(DATABASE_NAME).get_container_client(container_name)
+
+
+def get_chat_container():
+    return get_container("Chat")
+
+
+def get_checkpoint_container():
+    return get_container("Checkpoints")
+
+
+def get_chat_history_container():
+    return get_container("ChatHistory")
+
+
+def get_users_container():
+    return get_container("Users")
+
+
+def get_offers_container():
+    return get_container("OffersData")
+
+
+def get_account_container():
+    return get_container("AccountsData")
+
+
+def get_account_rollup_container():
+    return get_container("AccountRollups")
+
+
+def get_debug_container():
+    return get_container("Debug")
+
+
+def get_async_chat_container():
+    return get_async_container("Chat")
+
+
+def get_async_debug_container():
+    return get_async_container("Debug")
+
+
+def get_async_chat_history_container():
+    return get_async_container("ChatHistory")
+
+
+def get_async_semantic_cache_container():
+    return get_async_container("SemanticCache")
+
+
+async def close_async_cosmos_client():
+    if not get_async_cosmos_client.cache_info().currsize:
+        return
+    try:
+        await get_async_cosmos_client().close()
+        await get_async_credential().close()
+    except Exception as e:
+        print(f"[ERROR] Error closing async Cosmos DB client: {e}")
+    get_async_container.cache_clear()
+    get_async_cosmos_client.cache_clear()
+    get_async_credential.cache_clear()
 
 
 def vector_search(vectors, accountType):
     print("accountType: ", accountType)
     print("vectors: ", vectors)
     # Execute the query
-    results = offers_container.query_items(
+    results = get_offers_container().query_items(
         query='''
         SELECT TOP 10 c.offerId, c.text, c.name
                         FROM c
@@ -88,7 +164,10 @@ def vector_search(vectors, accountType):
 # update the user data container
 def update_chat_container(data):
     try:
-        chat_container.upsert_item(data)
+        document = get_chat_container().upsert_item(data)
+        # Write-through, so the next routing decision for the session does not read it back
+        session_state_cache.put((data["tenantId"], data["userId"], data["sessionId"]), document)
+        session_state_metrics["writes"] += 1
         logging.debug(f"User data saved to Cosmos DB: {data}")
     except Exception as e:
         print(f"[ERROR] Error saving user data to Cosmos DB: {e}")
@@ -97,8 +176,8 @@ def update_chat_container(data):
 
 def update_offers_container(data):
     try:
-        offers_container.upsert_item(data)
-        print(f"[DEBUG] Offers data saved to Cosmos DB: {data}")
+        get_offers_container().upsert_item(data)
+        print(f"[DEBUG] Offers data saved to Cosmos DB: {data.get('id')}")
     except Exception as e:
         print(f"[ERROR] Error saving Offers data to Cosmos DB: {e}")
         raise e
@@ -106,8 +185,8 @@ def update_offers_container(data):
 
 def update_account_container(data):
     try:
-        account_container.upsert_item(data)
-        print(f"[DEBUG] Account data saved to Cosmos DB: {data}")
+        get_account_container().upsert_item(data)
+        print(f"[DEBUG] Account data saved to Cosmos DB: {data.get('id')}")
     except Exception as e:
         print(f"[ERROR] Error saving Account data to Cosmos DB: {e}")
         raise e
@@ -115,18 +194,24 @@ def update_account_container(data):
 
 def update_users_container(data):
     try:
-        users_container.upsert_item(data)
-        print(f"[DEBUG] Users data saved to Cosmos DB: {data}")
+        get_users_container().upsert_item(data)
+        print(f"[DEBUG] Users data saved to Cosmos DB: {data.get('id')}")
     except Exception as e:
         print(f"[ERROR] Error saving Users data to Cosmos DB: {e}")
         raise e
 
 
 # fetch the user data from the container by tenantId, userId
+# [tenantId, userId] is a prefix of the hierarchical partition key, so the query only touches that user's partitions
 def fetch_chat_container_by_tenant_and_user(tenantId, userId):
     try:
-        query = f"SELECT * FROM c WHERE c.tenantId = '{tenantId}' AND c.userId = '{userId}'"
-        items = list(chat_container.query_items(query=query, enable_cross_partition_query=True))
+        query = "SELECT * FROM c WHERE c.tenantId = @tenantId AND c.userId = @userId"
+        parameters = [
+            {"name": "@tenantId", "value": tenantId},
+            {"name": "@userId", "value": userId}
+        ]
+        items = list(get_chat_container().query_items(query=query, parameters=parameters,
+                                                partition_key=[tenantId, userId]))
         print(f"[DEBUG] Fetched {len(items)} user data for tenantId: {tenantId}, userId: {userId}")
         return items
     except Exception as e:
@@ -134,11 +219,36 @@ def fetch_chat_container_by_tenant_and_user(tenantId, userId):
         raise e
 
 
+def query_page(container, query, parameters, partition_key, page_size, continuation_token=None):
+    """Runs a single-partition query and returns one page of results with the token for the next page."""
+    pager = container.query_items(query=query, parameters=parameters, partition_key=partition_key,
+                                  max_item_count=page_size).by_page(continuation_token)
+    items = list(next(pager, []))
+    return items, pager.continuation_token
+
+
+# fetch one page of sessions for tenantId, userId
+def fetch_chat_sessions_page(tenantId, userId, page_size, continuation_token=None):
+    try:
+        query = "SELECT * FROM c WHERE c.tenantId = @tenantId AND c.userId = @userId ORDER BY c._ts DESC"
+        parameters = [
+            {"name": "@tenantId", "value": tenantId},
+            {"name": "@userId", "value": userId}
+        ]
+        return query_page(get_chat_container(), query, parameters, [tenantId, userId], page_size, continuation_token)
+    except Exception as e:
+        print(f"[ERROR] Error fetching sessions page for tenantId: {tenantId}, userId: {userId}: {e}")
+        raise e
+
+
 # fetch the user data from the container by tenantId, userId, sessionId
+# the session document id is the sessionId and the full partition key is known, so this is a point read
 def fetch_chat_container_by_session(tenantId, userId, sessionId):
     try:
-        query = f"SELECT * FROM c WHERE c.tenantId = '{tenantId}' AND c.userId = '{userId}' AND c.sessionId = '{sessionId}'"
-        items = list(chat_container.query_items(query=query, enable_cross_partition_query=True))
+        try:
+            items = [get_chat_container().read_item(item=sessionId, partition_key=[tenantId, userId, sessionId])]
+        except CosmosResourceNotFoundError:
+            items = []
         print(
             f"[DEBUG] Fetched {len(items)} user data for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}")
         return items
@@ -157,8 +267,10 @@ def patch_active_agent(tenantId, userId, sessionId, activeAgent):
 
         try:
             pk = [tenantId, userId, sessionId]
-            chat_container.patch_item(item=sessionId, partition_key=pk,
-                                      patch_operations=operations)
+            document = get_chat_container().patch_item(item=sessionId, partition_key=pk,
+                                                       patch_operations=operations)
+            session_state_cache.put((tenantId, userId, sessionId), document)
+            session_state_metrics["writes"] += 1
         except Exception as e:
             print('\nError occurred. {0}'.format(e.message))
     except Exception as e:
@@ -166,6 +278,60 @@ def patch_active_agent(tenantId, userId, sessionId, activeAgent):
             f"[ERROR] Error patching active agent for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}: {e}")
         raise e
 
+
+# fetch the session document through the session state cache: fresh entries cost no round trip, older ones
+# are revalidated with a conditional read that only transfers the document when another worker changed it
+async def fetch_session_state_async(tenantId, userId, sessionId):
+    key = (tenantId, userId, sessionId)
+    partition_key = [tenantId, userId, sessionId]
+    entry = session_state_cache.get(key)
+    if entry is not None and session_state_cache.is_fresh(entry):
+        session_state_metrics["hits"] += 1
+        return entry["document"]
+
+    if entry is None:
+        session_state_metrics["misses"] += 1
+        item = await get_async_chat_container().read_item(item=sessionId, partition_key=partition_key)
+    else:
+        session_state_metrics["revalidations"] += 1
+        try:
+            item = await get_async_chat_container().read_item(item=sessionId, partition_key=partition_key,
+                                                              etag=entry["etag"],
+                                                              match_condition=MatchConditions.IfModified)
+        except CosmosHttpResponseError as e:
+            if e.status_code != 304:
+                raise e
+            item = None
+        if not item:
+            # 304 Not Modified: the cached document is still current
+            session_state_metrics["not_modified"] += 1
+            session_state_cache.touch(key)
+            return entry["document"]
+
+    session_state_cache.put(key, item)
+    return item
+
+
+async def fetch_active_agent_async(tenantId, userId, sessionId):
+    item = await fetch_session_state_async(tenantId, userId, sessionId)
+    return item.get('activeAgent', 'unknown')
+
+
+async def patch_active_agent_async(tenantId, userId, sessionId, activeAgent):
+    try:
+        operations = [
+            {'op': 'replace', 'path': '/activeAgent', 'value': activeAgent}
+        ]
+        pk = [tenantId, userId, sessionId]
+        document = await get_async_chat_container().patch_item(item=sessionId, partition_key=pk,
+                                                               patch_operations=operations)
+        session_state_cache.put((tenantId, userId, sessionId), document)
+        session_state_metrics["writes"] += 1
+    except Exception as e:
+        print(
+            f"[ERROR] Error patching active agent for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}: {e}")
+
+
     # deletes the user data from the container by tenantId, userId, sessionId
 
 
@@ -176,7 +342,7 @@ def patch_account_record(tenantId, account_id, balance):
 
         operations = [{'op': 'replace', 'path': '/balance', 'value': balance}]
         partition_key = [tenantId, account_id]
-        account_container.patch_item(item=account_id, partition_key=partition_key, patch_operations=operations)
+        get_account_container().patch_item(item=account_id, partition_key=partition_key, patch_operations=operations)
         # print(f"[DEBUG] Account record patched: {account_id}")
     except Exception as e:
         print(f"[ERROR] Error patching account record: {e}")
@@ -184,15 +350,14 @@ def patch_account_record(tenantId, account_id, balance):
 
 
 def delete_userdata_item(tenantId, userId, sessionId):
+    session_state_cache.invalidate((tenantId, userId, sessionId))
     try:
-        query = f"SELECT * FROM c WHERE c.tenantId = '{tenantId}' AND c.userId = '{userId}' AND c.sessionId = '{sessionId}'"
-        items = list(chat_container.query_items(query=query, enable_cross_partition_query=True))
-        if len(items) == 0:
+        try:
+            get_chat_container().delete_item(sessionId, partition_key=[tenantId, userId, sessionId])
+        except CosmosResourceNotFoundError:
             print(f"[DEBUG] No user data found for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}")
             return
-        for item in items:
-            chat_container.delete_item(item, partition_key=[tenantId, userId, sessionId])
-            print(f"[DEBUG] Deleted user data for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}")
+        print(f"[DEBUG] Deleted user data for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}")
     except Exception as e:
         print(
             f"[ERROR] Error deleting user data for tenantId: {tenantId}, userId: {userId}, sessionId: {sessionId}: {e}")
@@ -205,7 +370,7 @@ def delete_userdata_item(tenantId, userId, sessionId):
 # Function to create an account record
 def create_account_record(account_data):
     try:
-        account_container.upsert_item(account_data)
+        get_account_container().upsert_item(account_data)
         print(f"[DEBUG] Account record created: {account_data}")
     except Exception as e:
         print(f"[ERROR] Error creating account record: {e}")
@@ -214,7 +379,7 @@ def create_account_record(account_data):
 
 def create_service_request_record(account_data):
     try:
-        account_container.upsert_item(account_data)
+        get_account_container().upsert_item(account_data)
         print(f"[DEBUG] Account record created: {account_data}")
     except Exception as e:
         print(f"[ERROR] Error creating account record: {e}")
@@ -224,7 +389,7 @@ def create_service_request_record(account_data):
 def fetch_latest_account_number():
     try:
         query = "SELECT c.accountId FROM c WHERE c.type = 'BankAccount'"
-        items = list(account_container.query_items(query=query, enable_cross_partition_query=True))
+        items = list(get_account_container().query_items(query=query, enable_cross_partition_query=True))
 
         print(f"[DEBUG] Fetched {len(items)} account numbers")
 
@@ -250,18 +415,22 @@ def fetch_latest_account_number():
         raise e
 
 
-def fetch_latest_transaction_number(account_number):
+def fetch_latest_transaction_number(tenantId, accountId):
+    """
+    Highest transaction number found in the history of an account. Only used to seed the lastTransactionNumber
+    counter of accounts that predate it, so this partition-scoped scan runs at most once per account.
+    """
     try:
-        query = f"SELECT c.id FROM c WHERE c.type = 'BankTransaction' AND c.accountId = '{account_number}' ORDER BY c._ts DESC"
-        items = list(account_container.query_items(query=query, enable_cross_partition_query=True))
-
-        if items:
-            latest_transaction_id = items[0]["id"]
-            numeric_part = re.sub(r'\D', '', latest_transaction_id)
-            latest_transaction_number = int(numeric_part)
-            return latest_transaction_number
+        query = "SELECT VALUE c.id FROM c WHERE c.type = 'BankTransaction'"
+        ids = list(get_account_container().query_items(query=query, partition_key=[tenantId, accountId]))
 
-        return 0  # No transactions found
+        # Ids are "<accountId>-<n>", or "Transaction<n>" in the sample data
+        numbers = [len(ids)]
+        for transaction_id in ids:
+            match = re.search(r'(\d+)$', transaction_id)
+            if match:
+                numbers.append(int(match.group(1)))
+        return max(numbers)
 
     except Exception as e:
         print(f"[ERROR] Error fetching latest transaction number: {e}")
@@ -270,8 +439,10 @@ def fetch_latest_transaction_number(account_number):
 
 def fetch_account_by_number(account_number, tenantId, userId):
     try:
-        query = f"SELECT * FROM c WHERE c.type = 'BankAccount' AND c.accountId = '{account_number}' AND c.tenantId = '{tenantId}' AND c.userId = '{userId}'"
-        items = list(account_container.query_items(query=query, enable_cross_partition_query=True))
+        query = "SELECT * FROM c WHERE c.type = 'BankAccount' AND c.userId = @userId"
+        parameters = [{"name": "@userId", "value": userId}]
+        items = list(get_account_container().query_items(query=query, parameters=parameters,
+                                                   partition_key=[tenantId, account_number]))
 
         if items:
             return items[0]  # Return the first matching account
@@ -283,36 +454,78 @@ def fetch_account_by_number(account_number, tenantId, userId):
         raise e
 
 
-def fetch_transactions_by_date_range(accountId: str, startDate: datetime, endDate: datetime) -> List[Dict]:
-    """
-    Retrieve the transaction history for a specific account between two dates.
+# Fields of a transaction that are useful to the agent; ids of the tenant and account are already known to the caller
+TRANSACTION_FIELDS = "c.id, c.debitAmount, c.creditAmount, c.accountBalance, c.details, c.transactionDateTime"
+TRANSACTION_RANGE_FILTER = """
+    c.type = "BankTransaction" AND c.transactionDateTime >= @startDate AND c.transactionDateTime <= @endDate
+"""
 
-    :param accountId: The ID of the account to retrieve transactions for.
-    :param startDate: The start date for the transaction history.
-    :param endDate: The end date for the transaction history.
-    :return: A list of transactions within the specified date range.
-    """
-    query = """
-    SELECT * FROM c
-    WHERE c.accountId = @accountId AND c.transactionDateTime >= @startDate AND c.transactionDateTime <= @endDate
-    AND c.type = "BankTransaction"
-    ORDER BY c.transactionDateTime ASC
-    """
-    parameters = [
-        {"name": "@accountId", "value": accountId},
+
+def transaction_range_parameters(startDate: datetime, endDate: datetime) -> List[Dict]:
+    return [
         {"name": "@startDate", "value": startDate.isoformat() + "Z"},
         {"name": "@endDate", "value": endDate.isoformat() + "Z"}
     ]
-    transactions = list(
-        account_container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
-    return transactions
+
+
+def fetch_transactions_page(tenantId: str, accountId: str, startDate: datetime, endDate: datetime, page_size: int,
+                            continuation_token: str = None):
+    """
+    Retrieve one page of the transaction history of an account between two dates, oldest first.
+
+    :return: The projected transactions of the page and the continuation token of the next page, or None.
+    """
+    try:
+        query = f"SELECT {TRANSACTION_FIELDS} FROM c WHERE {TRANSACTION_RANGE_FILTER} ORDER BY c.transactionDateTime ASC"
+        return query_page(get_account_container(), query, transaction_range_parameters(startDate, endDate),
+                          [tenantId, accountId], page_size, continuation_token)
+    except Exception as e:
+        print(f"[ERROR] Error fetching transactions page for account {accountId}: {e}")
+        raise e
+
+
+def summarize_transactions(tenantId: str, accountId: str, startDate: datetime, endDate: datetime,
+                           top_n: int) -> Dict:
+    """
+    Aggregate the transaction history of an account between two dates in Cosmos DB: counts, totals,
+    min/max and the largest debits and credits, so the size of the result does not depend on the history.
+    """
+    try:
+        container = get_account_container()
+        partition_key = [tenantId, accountId]
+        parameters = transaction_range_parameters(startDate, endDate)
+        query = f"""
+        SELECT COUNT(1) AS count,
+               SUM(c.debitAmount) AS totalDebits, SUM(c.creditAmount) AS totalCredits,
+               MAX(c.debitAmount) AS largestDebit, MAX(c.creditAmount) AS largestCredit,
+               MIN(c.accountBalance) AS minBalance, MAX(c.accountBalance) AS maxBalance,
+               MIN(c.transactionDateTime) AS firstTransaction, MAX(c.transactionDateTime) AS lastTransaction
+        FROM c WHERE {TRANSACTION_RANGE_FILTER}
+        """
+        summary = next(iter(container.query_items(query=query, parameters=parameters, partition_key=partition_key)),
+                       {"count": 0})
+
+        top_parameters = parameters + [{"name": "@topN", "value": top_n}]
+        for key, field in (("topDebits", "debitAmount"), ("topCredits", "creditAmount")):
+            query = f"""
+            SELECT TOP @topN {TRANSACTION_FIELDS} FROM c
+            WHERE {TRANSACTION_RANGE_FILTER} AND c.{field} > 0
+            ORDER BY c.{field} DESC
+            """
+            summary[key] = list(container.query_items(query=query, parameters=top_parameters,
+                                                      partition_key=partition_key))
+        return summary
+    except Exception as e:
+        print(f"[ERROR] Error summarizing transactions for account {accountId}: {e}")
+        raise e
 
 
 def update_active_agent_in_latest_message(sessionId: str, new_active_agent: str):
     try:
-        # Fetch the latest message from the ChatHistory container
-        query = f"SELECT * FROM c WHERE c.sessionId = '{sessionId}' ORDER BY c._ts DESC OFFSET 0 LIMIT 1"
-        items = list(chat_history_container.query_items(query=query, enable_cross_partition_query=True))
+        # Fetch the latest message from the session's partition of the ChatHistory container
+        query = "SELECT TOP 1 * FROM c WHERE c.sessionId = @sessionId ORDER BY c._ts DESC"
+        parameters = [{"name": "@sessionId", "value": sessionId}]
+        items = list(get_chat_history_container().query_items(query=query, parameters=parameters, partition_key=sessionId))
 
         if not items:
             print(f"[DEBUG] No chat history found for sessionId: {sessionId}")
@@ -322,7 +535,7 @@ def update_active_agent_in_latest_message(sessionId: str, new_active_agent: str)
         latest_message['sender'] = new_active_agent
 
         # Upsert the updated message back into the ChatHistory container
-        chat_history_container.upsert_item(latest_message)
+        get_chat_history_container().upsert_item(latest_message)
         print(f"[DEBUG] Updated activeAgent in the latest message for sessionId: {sessionId}")
 
     except Exception as e:
@@ -332,7 +545,7 @@ def update_active_agent_in_latest_message(sessionId: str, new_active_agent: str)
 
 def store_chat_history(data):
     try:
-        chat_history_container.upsert_item(data)
+        get_chat_history_container().upsert_item(data)
         print(f"[DEBUG] Chat history saved to Cosmos DB: {data}")
     except Exception as e:
         print(f"[ERROR] Error saving chat history to Cosmos DB: {e}")
@@ -341,8 +554,9 @@ def store_chat_history(data):
 
 def fetch_chat_history_by_session(sessionId):
     try:
-        query = f"SELECT * FROM c WHERE c.sessionId = '{sessionId}'"
-        items = list(chat_history_container.query_items(query=query, enable_cross_partition_query=True))
+        query = "SELECT * FROM c WHERE c.sessionId = @sessionId"
+        parameters = [{"name": "@sessionId", "value": sessionId}]
+        items = list(get_chat_history_container().query_items(query=query, parameters=parameters, partition_key=sessionId))
         print(f"[DEBUG] Fetched {len(items)} chat history for sessionId: {sessionId}")
         return items
     except Exception as e:
@@ -350,15 +564,44 @@ def fetch_chat_history_by_session(sessionId):
         raise e
 
 
+# fetch the chat history of many sessions with a single query instead of one query per session
+def fetch_chat_history_by_sessions(sessionIds):
+    try:
+        history = {sessionId: [] for sessionId in sessionIds}
+        if not sessionIds:
+            return history
+        query = "SELECT * FROM c WHERE ARRAY_CONTAINS(@sessionIds, c.sessionId)"
+        parameters = [{"name": "@sessionIds", "value": list(sessionIds)}]
+        for item in get_chat_history_container().query_items(query=query, parameters=parameters,
+                                                       enable_cross_partition_query=True):
+            history[item["sessionId"]].append(item)
+        print(f"[DEBUG] Fetched chat history for {len(sessionIds)} sessions")
+        return history
+    except Exception as e:
+        print(f"[ERROR] Error fetching chat history for sessions: {e}")
+        raise e
+
+
+def fetch_chat_history_page(sessionId, page_size, continuation_token=None):
+    try:
+        query = "SELECT * FROM c WHERE c.sessionId = @sessionId ORDER BY c._ts ASC"
+        parameters = [{"name": "@sessionId", "value": sessionId}]
+        return query_page(get_chat_history_container(), query, parameters, sessionId, page_size, continuation_token)
+    except Exception as e:
+        print(f"[ERROR] Error fetching chat history page for sessionId: {sessionId}: {e}")
+        raise e
+
+
 def delete_chat_history_by_session(sessionId):
     try:
-        query = f"SELECT * FROM c WHERE c.sessionId = '{sessionId}'"
-        items = list(chat_history_container.query_items(query=query, enable_cross_partition_query=True))
+        query = "SELECT c.id FROM c WHERE c.sessionId = @sessionId"
+        parameters = [{"name": "@sessionId", "value": sessionId}]
+        items = list(get_chat_history_container().query_items(query=query, parameters=parameters, partition_key=sessionId))
         if len(items) == 0:
             print(f"[DEBUG] No chat history found for sessionId: {sessionId}")
             return
         for item in items:
-            chat_history_container.delete_item(item, partition_key=[sessionId])
+            get_chat_history_container().delete_item(item["id"], partition_key=sessionId)
             print(f"[DEBUG] Deleted chat history for sessionId: {sessionId}")
     except Exception as e:
         print(f"[ERROR] Error deleting chat history for sessionId: {sessionId}: {e}")
@@ -368,7 +611,7 @@ def delete_chat_history_by_session(sessionId):
 # Function to create a transaction record
 def create_transaction_record(transaction_data):
     try:
-        account_container.upsert_item(transaction_data)
+        get_account_container().upsert_item(transaction_data)
         # print(f"[DEBUG] Transaction record created: {transaction_data}")
     except Exception as e:
         print(f"[ERROR] Error creating transaction record: {e}")
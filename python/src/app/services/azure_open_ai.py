@@ -1,6 +1,14 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import httpx
 from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
 from dotenv import load_dotenv
 from langchain_openai import AzureChatOpenAI
@@ -8,44 +16,215 @@ from openai import AzureOpenAI
 
 load_dotenv(override=False)
 
-# Use DefaultAzureCredential to get a token
-def get_azure_ad_token():
-    try:
-        credential = DefaultAzureCredential()
-        token = credential.get_token("https://cognitiveservices.azure.com/.default")
+# In-memory LRU of embeddings, an optional directory that persists them across restarts,
+# and the number of inputs sent per embeddings request
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+embedding_cache = OrderedDict()
+embedding_cache_lock = threading.Lock()
+
+# Tokens are refreshed this long before they expire, so requests never wait for a token round-trip
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("AZURE_OPENAI_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+TOKEN_RETRY_SECONDS = 30
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+# Connection pool shared by the chat model and the embeddings client
+HTTP_MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AZURE_OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("AZURE_OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS", "120"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("AZURE_OPENAI_HTTP_TIMEOUT_SECONDS", "120"))
+
+
+class RefreshingTokenProvider:
+    """
+    Token provider for the Azure OpenAI clients. Returns a cached Azure AD token and refreshes it on a
+    background timer before it expires, so long-running processes never send an expired token.
+    Calling the provider serves the sync clients; get_token_async serves the async ones.
+    """
+
+    def __init__(self, credential, scope, refresh_margin_seconds):
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.token = None
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def __call__(self):
+        with self.lock:
+            if self.token is None or self.token.expires_on - time.time() < 60:
+                self.refresh()
+            return self.token.token
+
+    async def get_token_async(self):
+        """
+        Returns the cached token without blocking the event loop. Only when there is no valid token yet, on the
+        first request or after refreshes kept failing, is the credential called, in a worker thread.
+        """
+        token = self.token
+        if token is not None and token.expires_on - time.time() >= 60:
+            return token.token
+        return await asyncio.to_thread(self)
+
+    def refresh(self):
+        try:
+            self.token = self.credential.get_token(self.scope)
+            print("[DEBUG] Retrieved Azure AD token successfully using DefaultAzureCredential.")
+            delay = max(self.token.expires_on - time.time() - self.refresh_margin_seconds, TOKEN_RETRY_SECONDS)
+        except Exception as e:
+            print(f"[ERROR] Failed to retrieve Azure AD token: {e}")
+            if self.token is None:
+                raise e
+            delay = TOKEN_RETRY_SECONDS
+        self.schedule_refresh(delay)
+
+    def schedule_refresh(self, delay):
+        if self.timer:
+            self.timer.cancel()
+        self.timer = threading.Timer(delay, self.background_refresh)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def background_refresh(self):
+        with self.lock:
+            self.refresh()
+
+
+@lru_cache(maxsize=None)
+def get_token_provider():
+    return RefreshingTokenProvider(DefaultAzureCredential(), COGNITIVE_SERVICES_SCOPE, TOKEN_REFRESH_MARGIN_SECONDS)
+
+
+def http_limits():
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS)
+
+
+# One keep-alive HTTP/2 pool per code path: sync and async transports cannot share connections
+@lru_cache(maxsize=None)
+def get_http_client():
+    return httpx.Client(http2=True, limits=http_limits(), timeout=HTTP_TIMEOUT_SECONDS)
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client():
+    return httpx.AsyncClient(http2=True, limits=http_limits(), timeout=HTTP_TIMEOUT_SECONDS)
+
+
+async def close_http_clients():
+    if get_async_http_client.cache_info().currsize:
+        await get_async_http_client().aclose()
+        get_async_http_client.cache_clear()
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+        get_http_client.cache_clear()
+
 
-        print("[DEBUG] Retrieved Azure AD token successfully using DefaultAzureCredential.")
+def normalize_embedding_text(text):
+    return " ".join(text.split())
+
+
+def embedding_cache_key(text, deployment_id):
+    return hashlib.sha256(f"{deployment_id}\n{text}".encode("utf-8")).hexdigest()
+
+
+def read_cached_embedding(key):
+    with embedding_cache_lock:
+        if key in embedding_cache:
+            embedding_cache.move_to_end(key)
+            return embedding_cache[key]
+
+    if EMBEDDING_CACHE_DIR:
+        file_path = os.path.join(EMBEDDING_CACHE_DIR, f"{key}.json")
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                embedding = json.load(file)
+            write_cached_embedding(key, embedding, persist=False)
+            return embedding
+    return None
+
+
+def write_cached_embedding(key, embedding, persist=True):
+    with embedding_cache_lock:
+        embedding_cache[key] = embedding
+        embedding_cache.move_to_end(key)
+        while len(embedding_cache) > EMBEDDING_CACHE_SIZE:
+            embedding_cache.popitem(last=False)
+
+    if persist and EMBEDDING_CACHE_DIR:
+        os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+        with open(os.path.join(EMBEDDING_CACHE_DIR, f"{key}.json"), "w", encoding="utf-8") as file:
+            json.dump(embedding, file)
+
+
+def generate_embeddings(texts):
+    """
+    Returns one embedding per input text. Embeddings are memoized by normalized text and deployment,
+    and the texts that are not cached are sent in as few embeddings requests as possible.
+    """
+    deployment_id = os.getenv("AZURE_OPENAI_EMBEDDINGDEPLOYMENTID")
+    normalized_texts = [normalize_embedding_text(text) for text in texts]
+    keys = [embedding_cache_key(text, deployment_id) for text in normalized_texts]
+
+    embeddings = {}
+    missing = OrderedDict()
+    for key, text in zip(keys, normalized_texts):
+        embedding = read_cached_embedding(key)
+        if embedding is None:
+            missing[key] = text
+        else:
+            embeddings[key] = embedding
+
+    missing_keys = list(missing.keys())
+    for start in range(0, len(missing_keys), EMBEDDING_BATCH_SIZE):
+        batch_keys = missing_keys[start:start + EMBEDDING_BATCH_SIZE]
+        response = get_aoai_client().embeddings.create(input=[missing[key] for key in batch_keys], model=deployment_id)
+        for item in response.data:
+            key = batch_keys[item.index]
+            embeddings[key] = item.embedding
+            write_cached_embedding(key, item.embedding)
+
+    return [embeddings[key] for key in keys]
+
+
+def generate_embedding(text):
+    return generate_embeddings([text])[0]
+
+
+# The chat model and the embeddings client are created on first use instead of at import time
+@lru_cache(maxsize=None)
+def get_chat_model():
+    try:
+        azure_openai_api_version = "2023-05-15"
+        azure_deployment_name = os.getenv("AZURE_OPENAI_COMPLETIONSDEPLOYMENTID")
+        model = AzureChatOpenAI(
+            azure_deployment=azure_deployment_name,
+            api_version=azure_openai_api_version,
+            temperature=0,
+            azure_ad_token_provider=get_token_provider(),
+            azure_ad_async_token_provider=get_token_provider().get_token_async,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client()
+        )
+        print("[DEBUG] Azure OpenAI model initialized successfully.")
+        return model
     except Exception as e:
-        print(f"[ERROR] Failed to retrieve Azure AD token: {e}")
+        print(f"[ERROR] Error initializing Azure OpenAI model: {e}")
         raise e
-    return token.token
 
 
-def generate_embedding(text):
-    response = aoai_client.embeddings.create(input=text, model=os.getenv("AZURE_OPENAI_EMBEDDINGDEPLOYMENTID"))
-    json_response = response.model_dump_json(indent=2)
-    parsed_response = json.loads(json_response)
-    return parsed_response['data'][0]['embedding']
-
-
-# Fetch AD Token
-azure_ad_token = get_azure_ad_token()
-
-try:
-    azure_openai_api_version = "2023-05-15"
-    azure_deployment_name = model=os.getenv("AZURE_OPENAI_COMPLETIONSDEPLOYMENTID")
-    model = AzureChatOpenAI(
-        azure_deployment=azure_deployment_name,
-        api_version=azure_openai_api_version,
-        temperature=0,
-        azure_ad_token=azure_ad_token
-    )
-    aoai_client = AzureOpenAI(
-        azure_ad_token=azure_ad_token,
-        api_version="2024-09-01-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
-    print("[DEBUG] Azure OpenAI model initialized successfully.")
-except Exception as e:
-    print(f"[ERROR] Error initializing Azure OpenAI model: {e}")
-    raise e
+@lru_cache(maxsize=None)
+def get_aoai_client():
+    try:
+        return AzureOpenAI(
+            azure_ad_token_provider=get_token_provider(),
+            api_version="2024-09-01-preview",
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            http_client=get_http_client()
+        )
+    except Exception as e:
+        print(f"[ERROR] Error initializing Azure OpenAI client: {e}")
+        raise e
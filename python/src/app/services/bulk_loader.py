@@ -0,0 +1,279 @@
+import asyncio
+import codecs
+import json
+import os
+import time
+from collections import defaultdict
+
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_async_container
+from src.app.services.azure_open_ai import generate_embeddings
+
+load_dotenv(override=False)
+
+# Partition groups written at once, and the records parsed before their partition groups are written
+BULK_LOAD_CONCURRENCY = int(os.getenv("BULK_LOAD_CONCURRENCY", "16"))
+BULK_LOAD_CHUNK_RECORDS = int(os.getenv("BULK_LOAD_CHUNK_RECORDS", "1000"))
+# Retries of a throttled request after the SDK's own retries are exhausted
+BULK_LOAD_MAX_THROTTLE_RETRIES = int(os.getenv("BULK_LOAD_MAX_THROTTLE_RETRIES", "10"))
+BULK_LOAD_MAX_REPORTED_ERRORS = int(os.getenv("BULK_LOAD_MAX_REPORTED_ERRORS", "1000"))
+# Larger than any item Cosmos DB accepts, so a record that does not parse within it is malformed
+BULK_LOAD_MAX_RECORD_CHARS = 4 * 1024 * 1024
+
+# Operations of a transactional batch, which must share a partition key
+TRANSACTIONAL_BATCH_SIZE = 100
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+BULK_TARGETS = {
+    "users": {"container": "Users", "partition_key": lambda record: record["tenantId"]},
+    "accounts": {"container": "AccountsData",
+                 "partition_key": lambda record: [record["tenantId"], record["accountId"]]},
+    "offers": {"container": "OffersData", "partition_key": lambda record: record["tenantId"]},
+}
+
+
+class RecordParser:
+    """
+    Parses a JSON array or NDJSON stream incrementally, yielding (index, record, error) for each record as
+    soon as it is complete. NDJSON lines are parsed independently, so a malformed line only fails that record;
+    a malformed element of a JSON array ends the stream.
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.mode = None
+        self.index = 0
+        self.done = False
+
+    def feed(self, chunk, final=False):
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk, final=final)
+        self.buffer += chunk
+        if self.done:
+            return
+        if self.mode is None:
+            stripped = self.buffer.lstrip()
+            if not stripped:
+                return
+            self.mode = "array" if stripped[0] == "[" else "ndjson"
+            self.buffer = stripped[1:] if self.mode == "array" else stripped
+        if self.mode == "ndjson":
+            yield from self.parse_lines(final)
+        else:
+            yield from self.parse_array(final)
+
+    def close(self):
+        return self.feed(b"", final=True)
+
+    def next_index(self):
+        self.index += 1
+        return self.index - 1
+
+    def parse_lines(self, final):
+        lines = self.buffer.split("\n")
+        self.buffer = "" if final else lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield self.next_index(), None, f"Invalid JSON: {e}"
+                continue
+            yield self.next_index(), record, None
+
+    def parse_array(self, final):
+        while True:
+            self.buffer = self.buffer.lstrip(" \t\r\n,")
+            if not self.buffer:
+                break
+            if self.buffer[0] == "]":
+                self.done = True
+                self.buffer = ""
+                return
+            try:
+                record, end = self.json_decoder.raw_decode(self.buffer)
+            except json.JSONDecodeError as e:
+                if final or len(self.buffer) > BULK_LOAD_MAX_RECORD_CHARS:
+                    self.done = True
+                    self.buffer = ""
+                    yield self.next_index(), None, f"Invalid JSON, stopped reading the array: {e}"
+                    return
+                # The record is not complete yet
+                break
+            self.buffer = self.buffer[end:]
+            yield self.next_index(), record, None
+        if final and not self.done:
+            self.done = True
+            yield self.next_index(), None, "Unterminated JSON array"
+
+
+class BulkLoadReport:
+    def __init__(self, target):
+        self.target = target
+        self.start = time.perf_counter()
+        self.received = 0
+        self.written = 0
+        self.failed = 0
+        self.throttled = 0
+        self.embedded = 0
+        self.requests = 0
+        self.errors = []
+
+    def error(self, index, record, message):
+        self.failed += 1
+        if len(self.errors) < BULK_LOAD_MAX_REPORTED_ERRORS:
+            record_id = record.get("id") if isinstance(record, dict) else None
+            self.errors.append({"index": index, "id": record_id, "error": message})
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return {
+            "target": self.target,
+            "received": self.received,
+            "written": self.written,
+            "failed": self.failed,
+            "embedded": self.embedded,
+            "throttled": self.throttled,
+            "requests": self.requests,
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.written / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def retry_after_seconds(error):
+    headers = getattr(error, "headers", None) or {}
+    retry_after_ms = headers.get("x-ms-retry-after-ms")
+    return float(retry_after_ms) / 1000 if retry_after_ms else DEFAULT_RETRY_AFTER_SECONDS
+
+
+async def with_throttle_retry(operation, report):
+    """Runs a Cosmos DB request, waiting as long as the service asks whenever it is throttled."""
+    for attempt in range(BULK_LOAD_MAX_THROTTLE_RETRIES + 1):
+        report.requests += 1
+        try:
+            return await operation()
+        except CosmosHttpResponseError as e:
+            if e.status_code != 429 or attempt == BULK_LOAD_MAX_THROTTLE_RETRIES:
+                raise e
+            report.throttled += 1
+            await asyncio.sleep(retry_after_seconds(e))
+
+
+async def write_partition(container, partition_key, entries, report, on_written):
+    """
+    Upserts the records of one partition in transactional batches. A batch that fails is retried record by
+    record, so one invalid record is reported on its own and does not fail its neighbours.
+    """
+    for start in range(0, len(entries), TRANSACTIONAL_BATCH_SIZE):
+        batch = entries[start:start + TRANSACTIONAL_BATCH_SIZE]
+        try:
+            await with_throttle_retry(lambda: container.execute_item_batch(
+                [("upsert", (record,)) for _, record in batch], partition_key=partition_key), report)
+            written = batch
+        except (CosmosBatchOperationError, CosmosHttpResponseError):
+            written = []
+            for index, record in batch:
+                try:
+                    await with_throttle_retry(lambda: container.upsert_item(record), report)
+                    written.append((index, record))
+                except CosmosHttpResponseError as e:
+                    report.error(index, record, f"{e.status_code}: {e.message}")
+        report.written += len(written)
+        if on_written:
+            for _, record in written:
+                on_written(record)
+
+
+async def embed_missing_vectors(entries, report):
+    """Computes the vectors of offer terms that have none, in batched embeddings requests."""
+    missing = [(index, record) for index, record in entries
+               if record.get("type") == "Term" and record.get("text") and not record.get("vector")]
+    if not missing:
+        return entries
+    try:
+        vectors = await asyncio.to_thread(generate_embeddings, [record["text"] for _, record in missing])
+    except Exception as e:
+        print(f"[ERROR] Error generating embeddings for {len(missing)} offer terms: {e}")
+        failed = {index for index, _ in missing}
+        for index, record in missing:
+            report.error(index, record, f"Embedding failed: {e}")
+        return [(index, record) for index, record in entries if index not in failed]
+    for (_, record), vector in zip(missing, vectors):
+        record["vector"] = vector
+    report.embedded += len(missing)
+    return entries
+
+
+async def write_chunk(container, target, entries, report, embed, on_written, semaphore):
+    if embed:
+        entries = await embed_missing_vectors(entries, report)
+
+    partitions = defaultdict(list)
+    partition_keys = {}
+    for index, record in entries:
+        partition_key = target["partition_key"](record)
+        group = json.dumps(partition_key)
+        partitions[group].append((index, record))
+        partition_keys[group] = partition_key
+
+    async def write_group(group):
+        async with semaphore:
+            await write_partition(container, partition_keys[group], partitions[group], report, on_written)
+
+    await asyncio.gather(*(write_group(group) for group in partitions))
+
+
+async def bulk_load(target_name, chunks, embed=False, on_written=None):
+    """
+    Upserts the records of a JSON array or NDJSON stream into the container of a target, parsing the stream
+    incrementally and writing each chunk of records grouped by partition with bounded concurrency.
+    Returns the throughput summary and an error report entry for every record that was not written.
+    """
+    target = BULK_TARGETS[target_name]
+    container = get_async_container(target["container"])
+    report = BulkLoadReport(target_name)
+    semaphore = asyncio.Semaphore(BULK_LOAD_CONCURRENCY)
+    parser = RecordParser()
+    entries = []
+
+    def accept(parsed):
+        for index, record, error in parsed:
+            report.received += 1
+            if error:
+                report.error(index, record, error)
+            elif not isinstance(record, dict) or not record.get("id"):
+                report.error(index, record, "Record must be a JSON object with an id")
+            else:
+                try:
+                    target["partition_key"](record)
+                    entries.append((index, record))
+                except (KeyError, TypeError) as e:
+                    report.error(index, record, f"Missing partition key field: {e}")
+
+    async for chunk in chunks:
+        accept(parser.feed(chunk))
+        if len(entries) >= BULK_LOAD_CHUNK_RECORDS:
+            await write_chunk(container, target, entries, report, embed, on_written, semaphore)
+            entries = []
+    accept(parser.close())
+    if entries:
+        await write_chunk(container, target, entries, report, embed, on_written, semaphore)
+
+    summary = report.summary()
+    print(f"[DEBUG] Bulk load of {target_name}: wrote {summary['written']} of {summary['received']} records in "
+          f"{summary['elapsed_seconds']}s ({summary['records_per_second']}/s), {summary['failed']} failed, "
+          f"{summary['throttled']} throttled")
+    return summary
+
+
+async def read_file_chunks(path, chunk_size=64 * 1024):
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
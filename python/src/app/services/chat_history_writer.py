@@ -0,0 +1,99 @@
+import asyncio
+import os
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_async_chat_history_container
+
+load_dotenv(override=False)
+
+# Pending turns held in memory before callers are made to wait, and number of concurrent writers
+CHAT_HISTORY_QUEUE_SIZE = int(os.getenv("CHAT_HISTORY_QUEUE_SIZE", "1000"))
+CHAT_HISTORY_WRITER_CONCURRENCY = int(os.getenv("CHAT_HISTORY_WRITER_CONCURRENCY", "4"))
+# How long shutdown waits for pending turns to be written before dropping them
+CHAT_HISTORY_FLUSH_TIMEOUT_SECONDS = float(os.getenv("CHAT_HISTORY_FLUSH_TIMEOUT_SECONDS", "10"))
+
+# Turns a writer drains from the queue at once, and operations per transactional batch (Cosmos DB limit is 100)
+COALESCE_LIMIT = 50
+BATCH_SIZE = 100
+
+chat_history_queue = None
+writer_tasks = []
+
+chat_history_metrics = {
+    "queued": 0,
+    "written": 0,
+    "dropped": 0,
+}
+
+
+async def enqueue_chat_history(sessionId, items):
+    """
+    Queues the messages of a turn for persistence. When the queue is full the caller waits,
+    which applies backpressure instead of growing memory without bound.
+    """
+    await chat_history_queue.put((sessionId, items))
+    chat_history_metrics["queued"] += len(items)
+
+
+async def write_session_history(sessionId, items):
+    """Upserts the messages of one session partition in transactional batches."""
+    for start in range(0, len(items), BATCH_SIZE):
+        chunk = items[start:start + BATCH_SIZE]
+        try:
+            await get_async_chat_history_container().execute_item_batch(
+                batch_operations=[("upsert", (item,)) for item in chunk],
+                partition_key=sessionId
+            )
+        except Exception as e:
+            print(f"[ERROR] Error saving chat history batch for sessionId: {sessionId}, retrying per item: {e}")
+            for item in chunk:
+                try:
+                    await get_async_chat_history_container().upsert_item(item)
+                except Exception as item_error:
+                    print(f"[ERROR] Error saving chat history to Cosmos DB: {item_error}")
+    print(f"[DEBUG] Chat history saved to Cosmos DB: {len(items)} messages for sessionId: {sessionId}")
+
+
+async def chat_history_writer():
+    """Drains queued turns, coalescing turns of the same session into a single batch."""
+    while True:
+        entries = [await chat_history_queue.get()]
+        while len(entries) < COALESCE_LIMIT and not chat_history_queue.empty():
+            entries.append(chat_history_queue.get_nowait())
+
+        items_by_session = defaultdict(list)
+        for sessionId, items in entries:
+            items_by_session[sessionId].extend(items)
+
+        try:
+            for sessionId, items in items_by_session.items():
+                await write_session_history(sessionId, items)
+                chat_history_metrics["written"] += len(items)
+        finally:
+            for _ in entries:
+                chat_history_queue.task_done()
+
+
+def start_chat_history_writer():
+    global chat_history_queue
+    chat_history_queue = asyncio.Queue(maxsize=CHAT_HISTORY_QUEUE_SIZE)
+    writer_tasks.extend(asyncio.create_task(chat_history_writer()) for _ in range(CHAT_HISTORY_WRITER_CONCURRENCY))
+
+
+async def stop_chat_history_writer(timeout_seconds=CHAT_HISTORY_FLUSH_TIMEOUT_SECONDS):
+    """
+    Flushes pending turns for at most timeout_seconds, so a slow store cannot hold up shutdown, and stops the
+    writers.
+    """
+    if chat_history_queue is not None:
+        try:
+            await asyncio.wait_for(chat_history_queue.join(), timeout_seconds)
+        except asyncio.TimeoutError:
+            dropped = chat_history_metrics["queued"] - chat_history_metrics["written"] - chat_history_metrics["dropped"]
+            chat_history_metrics["dropped"] += dropped
+            print(f"[ERROR] Gave up flushing {dropped} chat history messages after {timeout_seconds} seconds")
+    for task in writer_tasks:
+        task.cancel()
+    writer_tasks.clear()
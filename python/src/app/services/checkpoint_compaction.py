@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import os
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosBatchOperationError, \
+    CosmosHttpResponseError, CosmosResourceNotFoundError
+from dotenv import load_dotenv
+from langgraph_checkpoint_cosmosdb import CosmosDBSaver
+
+from src.app.services.checkpointer import checkpoint_namespaces, checkpoint_partition_key, writes_partition_key, \
+    make_namespaces_key
+from src.app.services.hybrid_checkpointer import make_head_key
+
+load_dotenv(override=False)
+
+# Number of checkpoints kept per thread and namespace, and how often dirty threads are compacted
+CHECKPOINT_RETENTION_COUNT = int(os.getenv("CHECKPOINT_RETENTION_COUNT", "10"))
+CHECKPOINT_COMPACTION_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_COMPACTION_INTERVAL_SECONDS", "300"))
+
+# Transactional batches in Cosmos DB are limited to 100 operations
+BATCH_SIZE = 100
+
+# Threads that received new checkpoints since the last compaction run
+dirty_threads = set()
+
+compaction_metrics = {
+    "runs": 0,
+    "threads_compacted": 0,
+    "checkpoints_deleted": 0,
+    "namespaces_deleted": 0,
+    "records_deleted": 0,
+    "bytes_reclaimed": 0,
+    "errors": 0,
+    "checkpoint_counts": {},
+}
+
+
+def mark_thread_dirty(thread_id: str) -> None:
+    """Schedules a thread for the next compaction run."""
+    dirty_threads.add(thread_id)
+
+
+def delete_records_in_batches(container, partition_key, record_ids) -> int:
+    """Deletes records of a single partition using transactional batches of up to 100 deletes."""
+    deleted = 0
+    for start in range(0, len(record_ids), BATCH_SIZE):
+        chunk = record_ids[start:start + BATCH_SIZE]
+        try:
+            container.execute_item_batch(
+                batch_operations=[("delete", (record_id,)) for record_id in chunk],
+                partition_key=partition_key
+            )
+            deleted += len(chunk)
+        except (CosmosBatchOperationError, CosmosHttpResponseError) as e:
+            # A batch fails as a whole, e.g. when a record was already deleted; fall back to single deletes
+            logging.debug(f"Batch delete failed in partition {partition_key} (HTTP {e.status_code}), retrying per item")
+            for record_id in chunk:
+                try:
+                    container.delete_item(record_id, partition_key=partition_key)
+                    deleted += 1
+                except CosmosHttpResponseError as item_error:
+                    if item_error.status_code != 404:
+                        print(f"[ERROR] Error deleting record {record_id} (HTTP {item_error.status_code}): "
+                              f"{item_error.message}")
+    return deleted
+
+
+def delete_record(container, record_id) -> int:
+    """Deletes a record that is alone in its partition, such as a head or namespace index record."""
+    try:
+        container.delete_item(record_id, partition_key=record_id)
+        return 1
+    except CosmosHttpResponseError as e:
+        if e.status_code != 404:
+            raise e
+        return 0
+
+
+def query_record_ids(container, partition_key):
+    return list(container.query_items(query="SELECT VALUE c.id FROM c", partition_key=partition_key))
+
+
+def record_bytes(container, partition_key, record_ids):
+    query = "SELECT * FROM c WHERE ARRAY_CONTAINS(@ids, c.id)"
+    return sum(len(json.dumps(record)) for record in container.query_items(
+        query=query, parameters=[{"name": "@ids", "value": record_ids}], partition_key=partition_key))
+
+
+def namespace_task_id(checkpoint_ns):
+    """The id of the root task a subgraph namespace ran under, e.g. "<task id>" for "sales_agent:<task id>"."""
+    return checkpoint_ns.split("|", 1)[0].rsplit(":", 1)[-1]
+
+
+def remove_namespaces(container, thread_id, checkpoint_ns_list) -> None:
+    """
+    Removes namespaces from the thread's namespace index. The index is replaced only if no worker recorded a
+    namespace since it was read; otherwise the removed namespaces stay listed, with nothing left in them, until
+    the next run.
+    """
+    namespaces_key = make_namespaces_key(thread_id)
+    try:
+        index = container.read_item(item=namespaces_key, partition_key=namespaces_key)
+        removed = set(checkpoint_ns_list)
+        index["namespaces"] = [checkpoint_ns for checkpoint_ns in index["namespaces"] if checkpoint_ns not in removed]
+        container.replace_item(item=namespaces_key, body=index, etag=index["_etag"],
+                               match_condition=MatchConditions.IfNotModified)
+    except (CosmosResourceNotFoundError, CosmosAccessConditionFailedError):
+        logging.debug(f"Namespace index of thread {thread_id} changed during compaction, leaving it for the next run")
+
+
+def compact_thread(cosmos_saver: CosmosDBSaver, thread_id: str, keep_last: int = CHECKPOINT_RETENTION_COUNT) -> dict:
+    """
+    Keeps only the newest `keep_last` checkpoints of the root namespace of a thread, and of each subgraph
+    namespace in the thread's namespace index whose run is still pending at the root head, and deletes the rest
+    together with their pending writes. Every subgraph run gets a namespace of its own, so a finished run is
+    deleted as a whole, with its head, and removed from the index in the same pass.
+
+    Every query is scoped to a single partition: checkpoint and write partitions are derived from the thread,
+    namespace and checkpoint id. Retained checkpoints, the head among them, keep their pending writes, so an
+    interrupted step resumes with them. A deleted checkpoint always has a successor, which was created after
+    its pending writes were applied.
+    """
+    container = cosmos_saver.container
+    keep_last = max(keep_last, 1)
+    stats = {
+        "thread_id": thread_id,
+        "checkpoints_before": 0,
+        "checkpoints_after": 0,
+        "namespaces_deleted": 0,
+        "records_deleted": 0,
+        "bytes_reclaimed": 0,
+    }
+
+    # Tasks with pending writes at the root head, whose subgraph runs an interrupted step resumes
+    pending_task_ids = set()
+    finished_namespaces = []
+    # The root namespace comes first
+    for checkpoint_ns in checkpoint_namespaces(container, thread_id):
+        partition_key = checkpoint_partition_key(thread_id, checkpoint_ns)
+        # Checkpoint records end with their checkpoint id, and ids sort by creation time
+        record_ids = sorted(query_record_ids(container, partition_key), reverse=True)
+        if not checkpoint_ns and record_ids:
+            head_writes_key = writes_partition_key(thread_id, "", record_ids[0].rsplit("$", 1)[1])
+            # Write records end with their task id and index
+            pending_task_ids = {record_id.rsplit("$", 2)[1]
+                                for record_id in query_record_ids(container, head_writes_key)}
+        if checkpoint_ns and namespace_task_id(checkpoint_ns) not in pending_task_ids:
+            finished_namespaces.append(checkpoint_ns)
+            stale_record_ids = record_ids
+            stats["records_deleted"] += delete_record(container, make_head_key(thread_id, checkpoint_ns))
+        else:
+            stale_record_ids = record_ids[keep_last:]
+        stats["checkpoints_before"] += len(record_ids)
+        stats["checkpoints_after"] += len(record_ids) - len(stale_record_ids)
+
+        for record_id in stale_record_ids:
+            checkpoint_id = record_id.rsplit("$", 1)[1]
+            writes_key = writes_partition_key(thread_id, checkpoint_ns, checkpoint_id)
+            write_ids = query_record_ids(container, writes_key)
+            if write_ids:
+                stats["bytes_reclaimed"] += record_bytes(container, writes_key, write_ids)
+                stats["records_deleted"] += delete_records_in_batches(container, writes_key, write_ids)
+
+        if stale_record_ids:
+            stats["bytes_reclaimed"] += record_bytes(container, partition_key, stale_record_ids)
+            stats["records_deleted"] += delete_records_in_batches(container, partition_key, stale_record_ids)
+
+    if finished_namespaces:
+        remove_namespaces(container, thread_id, finished_namespaces)
+        stats["namespaces_deleted"] = len(finished_namespaces)
+
+    if stats["records_deleted"]:
+        print(f"[DEBUG] Compacted thread {thread_id}: kept {stats['checkpoints_after']} of "
+              f"{stats['checkpoints_before']} checkpoints, deleted {stats['namespaces_deleted']} finished subgraph "
+              f"namespaces, reclaimed {stats['bytes_reclaimed']} bytes")
+    return stats
+
+
+def delete_thread_records(container, thread_id: str) -> int:
+    """
+    Deletes every checkpoint, pending write, head and namespace index record of a thread, partition by
+    partition, and returns the number of records deleted.
+    """
+    deleted = 0
+    for checkpoint_ns in checkpoint_namespaces(container, thread_id):
+        partition_key = checkpoint_partition_key(thread_id, checkpoint_ns)
+        record_ids = query_record_ids(container, partition_key)
+        for record_id in record_ids:
+            writes_key = writes_partition_key(thread_id, checkpoint_ns, record_id.rsplit("$", 1)[1])
+            deleted += delete_records_in_batches(container, writes_key, query_record_ids(container, writes_key))
+        deleted += delete_records_in_batches(container, partition_key, record_ids)
+
+        deleted += delete_record(container, make_head_key(thread_id, checkpoint_ns))
+
+    deleted += delete_record(container, make_namespaces_key(thread_id))
+    return deleted
+
+
+def compact_dirty_threads(cosmos_saver: CosmosDBSaver, keep_last: int = CHECKPOINT_RETENTION_COUNT) -> None:
+    """Compacts every thread marked dirty since the last run and updates the compaction metrics."""
+    thread_ids = list(dirty_threads)
+    dirty_threads.difference_update(thread_ids)
+    compaction_metrics["runs"] += 1
+
+    for thread_id in thread_ids:
+        try:
+            stats = compact_thread(cosmos_saver, thread_id, keep_last)
+        except Exception as e:
+            compaction_metrics["errors"] += 1
+            print(f"[ERROR] Error compacting checkpoints for thread {thread_id}: {e}")
+            continue
+
+        compaction_metrics["threads_compacted"] += 1
+        compaction_metrics["checkpoints_deleted"] += stats["checkpoints_before"] - stats["checkpoints_after"]
+        compaction_metrics["namespaces_deleted"] += stats["namespaces_deleted"]
+        compaction_metrics["records_deleted"] += stats["records_deleted"]
+        compaction_metrics["bytes_reclaimed"] += stats["bytes_reclaimed"]
+        compaction_metrics["checkpoint_counts"][thread_id] = stats["checkpoints_after"]
+
+
+def forget_thread(thread_id: str) -> None:
+    """Drops a deleted thread from the pending set and the per-thread metrics."""
+    dirty_threads.discard(thread_id)
+    compaction_metrics["checkpoint_counts"].pop(thread_id, None)
+
+
+async def run_compaction_service(cosmos_saver: CosmosDBSaver,
+                                 interval_seconds: int = CHECKPOINT_COMPACTION_INTERVAL_SECONDS) -> None:
+    """Background loop that periodically compacts dirty threads without blocking the event loop."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        if dirty_threads:
+            await asyncio.to_thread(compact_dirty_threads, cosmos_saver)
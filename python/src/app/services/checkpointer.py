@@ -0,0 +1,181 @@
+import asyncio
+import os
+import threading
+
+import zstandard
+from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
+from dotenv import load_dotenv
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph_checkpoint_cosmosdb import CosmosDBSaver, CosmosSerializer
+
+load_dotenv(override=False)
+
+# "compact" writes zstd-compressed msgpack without bulky response metadata, "default" keeps the saver's format
+CHECKPOINT_SERIALIZER = os.getenv("CHECKPOINT_SERIALIZER", "compact")
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3"))
+# The compact serializer leaves the "writes" key out of checkpoint metadata unless this is false
+CHECKPOINT_DROP_METADATA_WRITES = os.getenv("CHECKPOINT_DROP_METADATA_WRITES", "true").lower() == "true"
+
+# Bound on the thread namespaces this process remembers having recorded in a namespace index
+MAX_REGISTERED_NAMESPACES = 10000
+
+# Response metadata that is only useful while a turn is running; debug logs are built from the live run
+BULKY_RESPONSE_METADATA = {"logprobs", "content_filter_results", "prompt_filter_results"}
+
+
+def strip_bulky_metadata(value):
+    """
+    Returns a copy of a state value with bulky response metadata removed from its messages.
+    The messages of the running graph are left untouched.
+    """
+    if isinstance(value, BaseMessage):
+        if not BULKY_RESPONSE_METADATA.intersection(value.response_metadata or {}):
+            return value
+        response_metadata = {key: item for key, item in value.response_metadata.items()
+                             if key not in BULKY_RESPONSE_METADATA}
+        return value.model_copy(update={"response_metadata": response_metadata})
+    if isinstance(value, dict):
+        return {key: strip_bulky_metadata(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [strip_bulky_metadata(item) for item in value]
+    if isinstance(value, tuple) and not hasattr(value, "_fields"):
+        return tuple(strip_bulky_metadata(item) for item in value)
+    return value
+
+
+def checkpoint_partition_key(thread_id, checkpoint_ns):
+    """Partition of the checkpoint records of one thread and namespace, as written by CosmosDBSaver."""
+    return f"checkpoint${thread_id}${checkpoint_ns}$"
+
+
+def writes_partition_key(thread_id, checkpoint_ns, checkpoint_id):
+    """Partition of the pending writes of one checkpoint, as written by CosmosDBSaver."""
+    return f"writes${thread_id}${checkpoint_ns}${checkpoint_id}$$"
+
+
+def make_namespaces_key(thread_id):
+    return f"namespaces${thread_id}"
+
+
+def checkpoint_namespaces(container, thread_id):
+    """The root namespace and every subgraph namespace recorded for a thread, from one point read."""
+    namespaces_key = make_namespaces_key(thread_id)
+    try:
+        recorded = container.read_item(item=namespaces_key, partition_key=namespaces_key)["namespaces"]
+    except CosmosResourceNotFoundError:
+        recorded = []
+    return [""] + sorted(set(recorded) - {""})
+
+
+class CompactCheckpointSerializer(JsonPlusSerializer):
+    """
+    Serializes checkpoints and writes as zstd-compressed msgpack, tagged with a versioned type so the format
+    can evolve. Values written before, as plain msgpack or json, are still read through the default serializer.
+
+    With drop_metadata_writes, the "writes" key of checkpoint metadata, which repeats the node outputs that are
+    already in the checkpoint, is not stored. Checkpoints read back then have no "writes" in their metadata, so
+    get_state_history and StateSnapshot.metadata no longer show which node wrote what at each step. Resuming a
+    thread does not use it.
+    """
+
+    FORMAT = "zstd+msgpack/v1"
+
+    def __init__(self, level=CHECKPOINT_ZSTD_LEVEL, drop_metadata_writes=CHECKPOINT_DROP_METADATA_WRITES):
+        super().__init__()
+        self.level = level
+        self.drop_metadata_writes = drop_metadata_writes
+        # zstandard compressors must not be shared between threads
+        self.local = threading.local()
+
+    def compressor(self):
+        if not hasattr(self.local, "compressor"):
+            self.local.compressor = zstandard.ZstdCompressor(level=self.level)
+            self.local.decompressor = zstandard.ZstdDecompressor()
+        return self.local.compressor
+
+    def decompressor(self):
+        self.compressor()
+        return self.local.decompressor
+
+    def dumps(self, obj):
+        # Used for checkpoint metadata
+        if self.drop_metadata_writes and isinstance(obj, dict) and "writes" in obj:
+            obj = {key: value for key, value in obj.items() if key != "writes"}
+        return super().dumps(strip_bulky_metadata(obj))
+
+    def dumps_typed(self, obj):
+        type_, data = super().dumps_typed(strip_bulky_metadata(obj))
+        if type_ != "msgpack":
+            return type_, data
+        return self.FORMAT, self.compressor().compress(data)
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if type_ == self.FORMAT:
+            return super().loads_typed(("msgpack", self.decompressor().decompress(payload)))
+        return super().loads_typed(data)
+
+
+class AsyncCosmosDBSaver(CosmosDBSaver):
+    """
+    CosmosDBSaver with a pluggable serializer and the async methods used by the async graph, which run the
+    saver's synchronous Cosmos DB calls in worker threads.
+    """
+
+    def __init__(self, database_name: str, container_name: str, serde=None):
+        super().__init__(database_name=database_name, container_name=container_name)
+        if serde is not None:
+            self.serde = serde
+            self.cosmos_serde = CosmosSerializer(serde)
+        self.registered_namespaces = set()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        self.register_namespace(config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        return next_config
+
+    def register_namespace(self, thread_id, checkpoint_ns):
+        """
+        Records a subgraph namespace in the thread's namespace index, so compaction and deletion can reach its
+        partitions without scanning the container. Each namespace is recorded once per process; duplicates
+        written by other workers are removed when the index is read.
+        """
+        if not checkpoint_ns or (thread_id, checkpoint_ns) in self.registered_namespaces:
+            return
+        namespaces_key = make_namespaces_key(thread_id)
+        add_namespace = [{"op": "add", "path": "/namespaces/-", "value": checkpoint_ns}]
+        try:
+            self.container.patch_item(item=namespaces_key, partition_key=namespaces_key,
+                                      patch_operations=add_namespace)
+        except CosmosResourceNotFoundError:
+            try:
+                self.container.create_item({"id": namespaces_key, "partition_key": namespaces_key,
+                                            "namespaces": [checkpoint_ns]})
+            except CosmosResourceExistsError:
+                self.container.patch_item(item=namespaces_key, partition_key=namespaces_key,
+                                          patch_operations=add_namespace)
+        if len(self.registered_namespaces) >= MAX_REGISTERED_NAMESPACES:
+            self.registered_namespaces.clear()
+        self.registered_namespaces.add((thread_id, checkpoint_ns))
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+
+def create_checkpoint_serializer(serializer_name=CHECKPOINT_SERIALIZER):
+    if serializer_name == "compact":
+        return CompactCheckpointSerializer()
+    return None
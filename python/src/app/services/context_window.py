@@ -0,0 +1,126 @@
+import os
+from functools import lru_cache
+
+import tiktoken
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from src.app.services.azure_open_ai import get_chat_model
+
+load_dotenv(override=False)
+
+# Tokens of unsummarized history (and summary) sent to an agent, and the most recent turns kept verbatim
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_WINDOW_MAX_TURNS = int(os.getenv("CONTEXT_WINDOW_MAX_TURNS", "10"))
+CONTEXT_SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", "200"))
+CONTEXT_TOKEN_ENCODING = os.getenv("CONTEXT_TOKEN_ENCODING", "o200k_base")
+
+# Per-message overhead of the chat format, as documented for OpenAI chat models
+MESSAGE_TOKEN_OVERHEAD = 4
+# Tool results are long JSON payloads that matter little once a turn is over
+SUMMARY_TOOL_RESULT_CHARS = 500
+
+SUMMARY_PROMPT = f"""You maintain a running summary of a conversation between a bank customer and banking agents.
+Update the current summary with the new messages. Keep account numbers, amounts, dates, products discussed,
+requests made and their outcome, and anything the customer still expects. Drop greetings and small talk.
+Answer with the updated summary only, in at most {CONTEXT_SUMMARY_MAX_WORDS} words."""
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    return tiktoken.get_encoding(CONTEXT_TOKEN_ENCODING)
+
+
+@lru_cache(maxsize=8192)
+def count_text_tokens(text):
+    return len(get_encoding().encode(text))
+
+
+def count_message_tokens(message):
+    tokens = MESSAGE_TOKEN_OVERHEAD + count_text_tokens(str(message.content or ""))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += count_text_tokens(f"{tool_call.get('name')}{tool_call.get('args')}")
+    return tokens
+
+
+def count_messages_tokens(messages):
+    return sum(count_message_tokens(message) for message in messages)
+
+
+def with_summary(prompt, summary):
+    """The agent prompt, followed by the summary of the turns that are no longer sent verbatim."""
+    if not summary:
+        return prompt
+    return f"{prompt}\n\nSummary of the earlier conversation:\n{summary}"
+
+
+def format_for_summary(messages):
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"Customer: {message.content}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Tool {message.name} returned: {str(message.content)[:SUMMARY_TOOL_RESULT_CHARS]}")
+        elif isinstance(message, AIMessage):
+            if message.content:
+                lines.append(f"Agent: {message.content}")
+            for tool_call in message.tool_calls or []:
+                lines.append(f"Agent called {tool_call['name']} with {tool_call['args']}")
+    return "\n".join(lines)
+
+
+async def summarize_messages(summary, messages):
+    """Folds messages into the running summary with one LLM call, kept out of the streamed tokens."""
+    response = await get_chat_model().ainvoke([
+        SystemMessage(content=SUMMARY_PROMPT),
+        HumanMessage(content=f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{format_for_summary(messages)}")
+    ], config={"tags": [TAG_NOSTREAM]})
+    return response.content
+
+
+def turn_starts(messages, start):
+    """Indices at which turns begin: each customer message from start on."""
+    return [index for index in range(start, len(messages)) if isinstance(messages[index], HumanMessage)]
+
+
+def choose_cut(messages, start, prompt_tokens, budget, max_turns):
+    """
+    Returns the index before which messages should be folded into the summary, or start when the unsummarized
+    history still fits. Once over the limits, only half the budget and half the turns are kept, so the summary
+    is extended every few turns rather than on every turn. Cuts fall on turn boundaries, so tool calls and
+    their results stay together.
+    """
+    starts = turn_starts(messages, start)
+    tokens = prompt_tokens + count_messages_tokens(messages[start:])
+    if tokens <= budget and len(starts) <= max_turns:
+        return start
+
+    keep_turns = max(1, max_turns // 2)
+    cut = starts[-1] if starts else start
+    for index in reversed(starts[-keep_turns:]):
+        if prompt_tokens + count_messages_tokens(messages[index:]) > budget // 2:
+            break
+        cut = index
+    return max(cut, start)
+
+
+async def build_context_window(state, budget=CONTEXT_TOKEN_BUDGET, max_turns=CONTEXT_WINDOW_MAX_TURNS,
+                               summarize=summarize_messages):
+    """
+    Returns the input for an agent, holding only the recent turns and the rolling summary of the older ones,
+    and the state update recording the summary. The summary is kept in graph state with the number of messages
+    it covers, so each message is summarized once.
+    """
+    messages = state["messages"]
+    summary = state.get("summary", "")
+    summarized_until = min(state.get("summarized_until", 0), len(messages))
+
+    cut = choose_cut(messages, summarized_until, count_text_tokens(summary), budget, max_turns)
+    update = {}
+    if cut > summarized_until:
+        summary = await summarize(summary, messages[summarized_until:cut])
+        summarized_until = cut
+        update = {"summary": summary, "summarized_until": summarized_until}
+
+    return {"messages": messages[summarized_until:], "summary": summary}, update
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import random
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_async_debug_container
+
+load_dotenv(override=False)
+
+# Pending debug logs held in memory; when the queue is full new logs are dropped rather than slowing requests
+DEBUG_LOG_QUEUE_SIZE = int(os.getenv("DEBUG_LOG_QUEUE_SIZE", "1000"))
+# String values in the property bag are cut to this length
+DEBUG_LOG_MAX_VALUE_LENGTH = int(os.getenv("DEBUG_LOG_MAX_VALUE_LENGTH", "2000"))
+# Fraction of debug logs that keep the bulky logprobs and content filter results
+DEBUG_LOG_VERBOSE_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_VERBOSE_SAMPLE_RATE", "0.1"))
+# Longest wait for queued logs to be written on shutdown; logs still queued after it are dropped
+DEBUG_LOG_FLUSH_TIMEOUT_SECONDS = float(os.getenv("DEBUG_LOG_FLUSH_TIMEOUT_SECONDS", "10"))
+
+# Logs a writer drains from the queue at once, and operations per transactional batch (Cosmos DB limit is 100)
+COALESCE_LIMIT = 100
+BATCH_SIZE = 100
+
+debug_log_queue = None
+writer_task = None
+# Entries accepted but not yet written, so they can still be served by id in the meantime
+pending_debug_logs = {}
+
+debug_log_metrics = {
+    "queued": 0,
+    "written": 0,
+    "dropped": 0,
+    "failed": 0,
+    "truncated": 0,
+}
+
+
+def truncate(value):
+    if isinstance(value, str) and len(value) > DEBUG_LOG_MAX_VALUE_LENGTH:
+        debug_log_metrics["truncated"] += 1
+        return value[:DEBUG_LOG_MAX_VALUE_LENGTH] + "...[truncated]"
+    return value
+
+
+def build_debug_log_entry(debug_log_id, message_id, timestamp, sessionId, tenantId, userId, response_data,
+                          extra_properties=None, verbose=True):
+    """Builds the debug log document of a graph run from the response metadata of its messages."""
+    agent_selected = "Unknown"
+    previous_agent = "Unknown"
+    finish_reason = "Unknown"
+    model_name = "Unknown"
+    system_fingerprint = "Unknown"
+    input_tokens = 0
+    output_tokens = 0
+    total_tokens = 0
+    cached_tokens = 0
+    transfer_success = False
+    tool_calls = []
+    logprobs = None
+    content_filter_results = {}
+
+    for entry in response_data:
+        for agent, details in entry.items():
+            if "messages" in details:
+                for msg in details["messages"]:
+                    if hasattr(msg, "response_metadata"):
+                        metadata = msg.response_metadata
+                        finish_reason = metadata.get("finish_reason", finish_reason)
+                        model_name = metadata.get("model_name", model_name)
+                        system_fingerprint = metadata.get("system_fingerprint", system_fingerprint)
+                        input_tokens = metadata.get("token_usage", {}).get("prompt_tokens", input_tokens)
+                        output_tokens = metadata.get("token_usage", {}).get("completion_tokens", output_tokens)
+                        total_tokens = metadata.get("token_usage", {}).get("total_tokens", total_tokens)
+                        cached_tokens = metadata.get("token_usage", {}).get("prompt_tokens_details", {}).get(
+                            "cached_tokens", cached_tokens)
+                        logprobs = metadata.get("logprobs", logprobs)
+                        content_filter_results = metadata.get("content_filter_results", content_filter_results)
+
+                        if "tool_calls" in msg.additional_kwargs:
+                            tool_calls.extend(msg.additional_kwargs["tool_calls"])
+                            transfer_success = any(
+                                call.get("name", "").startswith("transfer_to_") for call in tool_calls)
+                            previous_agent = agent_selected
+                            agent_selected = tool_calls[-1].get("name", "").replace("transfer_to_",
+                                                                                    "") if tool_calls else agent_selected
+
+    property_bag = [
+        {"key": "agent_selected", "value": agent_selected, "timeStamp": timestamp},
+        {"key": "previous_agent", "value": previous_agent, "timeStamp": timestamp},
+        {"key": "finish_reason", "value": finish_reason, "timeStamp": timestamp},
+        {"key": "model_name", "value": model_name, "timeStamp": timestamp},
+        {"key": "system_fingerprint", "value": system_fingerprint, "timeStamp": timestamp},
+        {"key": "input_tokens", "value": input_tokens, "timeStamp": timestamp},
+        {"key": "output_tokens", "value": output_tokens, "timeStamp": timestamp},
+        {"key": "total_tokens", "value": total_tokens, "timeStamp": timestamp},
+        {"key": "cached_tokens", "value": cached_tokens, "timeStamp": timestamp},
+        {"key": "transfer_success", "value": transfer_success, "timeStamp": timestamp},
+        {"key": "tool_calls", "value": truncate(str(tool_calls)), "timeStamp": timestamp},
+    ]
+    if verbose:
+        property_bag.append({"key": "logprobs", "value": truncate(str(logprobs)), "timeStamp": timestamp})
+        property_bag.append({"key": "content_filter_results", "value": truncate(str(content_filter_results)),
+                             "timeStamp": timestamp})
+    for key, value in (extra_properties or {}).items():
+        property_bag.append({"key": key, "value": truncate(value), "timeStamp": timestamp})
+
+    return {
+        "id": debug_log_id,
+        "messageId": message_id,
+        "type": "debug_log",
+        "sessionId": sessionId,
+        "tenantId": tenantId,
+        "userId": userId,
+        "timeStamp": timestamp,
+        "propertyBag": property_bag
+    }
+
+
+def submit_debug_log(debug_log_id, build_arguments):
+    """
+    Builds the debug log entry and queues it for the background writer without waiting. Only the trimmed entry
+    is held until it is written, not the messages of the run. Returns False when it was dropped.
+    """
+    if debug_log_queue.full():
+        debug_log_metrics["dropped"] += 1
+        return False
+    entry = build_debug_log_entry(debug_log_id, **build_arguments,
+                                  verbose=random.random() < DEBUG_LOG_VERBOSE_SAMPLE_RATE)
+    debug_log_queue.put_nowait(entry)
+    pending_debug_logs[debug_log_id] = entry
+    debug_log_metrics["queued"] += 1
+    return True
+
+
+def get_pending_debug_log(debug_log_id):
+    """Returns a debug log that is queued but not written yet, or None."""
+    return pending_debug_logs.get(debug_log_id)
+
+
+async def write_session_debug_logs(sessionId, entries):
+    """Creates the debug logs of one session partition in transactional batches."""
+    container = get_async_debug_container()
+    for start in range(0, len(entries), BATCH_SIZE):
+        chunk = entries[start:start + BATCH_SIZE]
+        try:
+            await container.execute_item_batch(batch_operations=[("upsert", (entry,)) for entry in chunk],
+                                               partition_key=sessionId)
+            debug_log_metrics["written"] += len(chunk)
+        except Exception as e:
+            print(f"[ERROR] Error saving debug log batch for sessionId: {sessionId}, retrying per item: {e}")
+            for entry in chunk:
+                try:
+                    await container.upsert_item(entry)
+                    debug_log_metrics["written"] += 1
+                except Exception as item_error:
+                    debug_log_metrics["failed"] += 1
+                    print(f"[ERROR] Error saving debug log to Cosmos DB: {item_error}")
+
+
+async def debug_log_writer():
+    """Drains queued debug logs, writing those of the same session in a single batch."""
+    while True:
+        queued = [await debug_log_queue.get()]
+        while len(queued) < COALESCE_LIMIT and not debug_log_queue.empty():
+            queued.append(debug_log_queue.get_nowait())
+
+        entries_by_session = defaultdict(list)
+        for entry in queued:
+            entries_by_session[entry["sessionId"]].append(entry)
+
+        try:
+            for sessionId, entries in entries_by_session.items():
+                await write_session_debug_logs(sessionId, entries)
+        finally:
+            for entry in queued:
+                pending_debug_logs.pop(entry["id"], None)
+                debug_log_queue.task_done()
+
+
+def start_debug_log_writer():
+    global debug_log_queue, writer_task
+    debug_log_queue = asyncio.Queue(maxsize=DEBUG_LOG_QUEUE_SIZE)
+    writer_task = asyncio.create_task(debug_log_writer())
+
+
+async def stop_debug_log_writer(timeout_seconds=DEBUG_LOG_FLUSH_TIMEOUT_SECONDS):
+    """
+    Flushes pending debug logs for at most timeout_seconds, so a slow store cannot hold up shutdown, and stops
+    the writer.
+    """
+    if debug_log_queue is not None:
+        try:
+            await asyncio.wait_for(debug_log_queue.join(), timeout_seconds)
+        except asyncio.TimeoutError:
+            debug_log_metrics["dropped"] += len(pending_debug_logs)
+            print(f"[ERROR] Gave up flushing {len(pending_debug_logs)} debug logs after {timeout_seconds} seconds")
+    if writer_task is not None:
+        writer_task.cancel()
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.app.services.azure_open_ai import generate_embeddings, generate_embedding
+
+load_dotenv(override=False)
+
+# Off until the thresholds below have been tuned on real traffic: a misrouted message reaches the wrong agent
+FAST_ROUTER_ENABLED = os.getenv("FAST_ROUTER_ENABLED", "false").lower() == "true"
+# A message is routed without the coordinator LLM only when its nearest agent centroid is similar enough
+# and clearly ahead of the runner-up; tune both with test/fast_router_benchmark.py
+FAST_ROUTER_MIN_SIMILARITY = float(os.getenv("FAST_ROUTER_MIN_SIMILARITY", "0.5"))
+FAST_ROUTER_MIN_MARGIN = float(os.getenv("FAST_ROUTER_MIN_MARGIN", "0.05"))
+
+# Example requests per agent, following the routing rules of the coordinator prompt
+ROUTING_EXEMPLARS = {
+    "customer_support_agent": [
+        "I need some help with my account",
+        "Where is your nearest branch?",
+        "What are the branch opening hours in Seattle?",
+        "I want to raise a complaint",
+        "My card was stolen, please block it",
+        "I want to report a problem with my online banking",
+        "Can someone call me back about an issue?",
+        "How do I contact customer service?",
+    ],
+    "sales_agent": [
+        "I want to open a new savings account",
+        "Can I open a checking account?",
+        "I would like to take out a loan",
+        "What interest rate do you offer on personal loans?",
+        "What banking offers do you have?",
+        "Tell me about your credit cards",
+        "How much would my monthly payment be on a 20000 loan over 5 years?",
+        "Do you have any account with high returns?",
+    ],
+    "transactions_agent": [
+        "What is my account balance?",
+        "How much money do I have in Acc001?",
+        "I want to transfer money to another account",
+        "Transfer 500 dollars from my savings to my checking account",
+        "Show me my transactions from last month",
+        "How much did I spend last quarter?",
+        "I want to make a deposit",
+        "I need to withdraw some money",
+    ],
+}
+
+router_metrics = {
+    "routed": defaultdict(int),
+    "fallbacks": 0,
+}
+
+
+@lru_cache(maxsize=None)
+def get_router_centroids():
+    """Normalized mean embedding of the exemplars of each agent, computed once per process."""
+    agents = list(ROUTING_EXEMPLARS.keys())
+    centroids = []
+    for agent in agents:
+        vectors = np.asarray(generate_embeddings(ROUTING_EXEMPLARS[agent]), dtype=np.float32)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        centroid = vectors.mean(axis=0)
+        centroids.append(centroid / np.linalg.norm(centroid))
+    return agents, np.stack(centroids)
+
+
+def score_message(text):
+    """Cosine similarity of a message to each agent centroid, as a dict of agent name to score."""
+    agents, centroids = get_router_centroids()
+    vector = np.asarray(generate_embedding(text), dtype=np.float32)
+    scores = centroids @ (vector / np.linalg.norm(vector))
+    return dict(zip(agents, scores.tolist()))
+
+
+def classify_message(text, min_similarity=FAST_ROUTER_MIN_SIMILARITY, min_margin=FAST_ROUTER_MIN_MARGIN):
+    """Returns the agent to route to and the scores, or None for the agent when the decision is not confident."""
+    scores = score_message(text)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_agent, best_score = ranked[0]
+    runner_up_score = ranked[1][1] if len(ranked) > 1 else 0
+    if best_score < min_similarity or best_score - runner_up_score < min_margin:
+        return None, scores
+    return best_agent, scores
+
+
+async def fast_route(text):
+    """Picks the agent for a message without an LLM call, or returns None to fall back to the coordinator."""
+    if not FAST_ROUTER_ENABLED or not text or not text.strip():
+        return None
+    try:
+        agent, scores = await asyncio.to_thread(classify_message, text)
+    except Exception as e:
+        print(f"[ERROR] Fast router failed, falling back to the coordinator agent: {e}")
+        return None
+    if agent is None:
+        router_metrics["fallbacks"] += 1
+    else:
+        router_metrics["routed"][agent] += 1
+    print(f"[DEBUG] Fast router scores: {scores}, routed to: {agent}")
+    return agent
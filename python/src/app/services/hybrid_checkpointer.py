@@ -0,0 +1,413 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosHttpResponseError, \
+    CosmosResourceExistsError, CosmosResourceNotFoundError
+from dotenv import load_dotenv
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id
+from langgraph.constants import INTERRUPT
+
+from src.app.services.checkpointer import checkpoint_partition_key, writes_partition_key
+
+load_dotenv(override=False)
+
+# "sync" writes every checkpoint and write to Cosmos DB before the graph moves on, "on-interrupt" writes only the
+# checkpoint a turn stops at and waits for it before the turn returns, "async" writes that checkpoint in the
+# background, trading the last turn of a crashed worker for the lowest latency
+CHECKPOINT_DURABILITY = os.getenv("CHECKPOINT_DURABILITY", "on-interrupt")
+CHECKPOINT_HOT_THREADS = int(os.getenv("CHECKPOINT_HOT_THREADS", "1000"))
+# Older checkpoints of a hot thread are only needed for time travel, which reads them from Cosmos DB
+CHECKPOINT_HOT_CHECKPOINTS_PER_THREAD = int(os.getenv("CHECKPOINT_HOT_CHECKPOINTS_PER_THREAD", "20"))
+# A hot thread whose head was confirmed this recently is served from memory without reading its head document;
+# older ones are checked against the head, which picks up turns handled by other workers. Only worth raising with
+# session affinity: a turn started from a stale head fails when it is flushed, instead of dropping the newer turn
+CHECKPOINT_HEAD_FRESH_SECONDS = float(os.getenv("CHECKPOINT_HEAD_FRESH_SECONDS", "0"))
+
+DURABILITY_MODES = {"sync", "on-interrupt", "async"}
+
+hybrid_checkpoint_metrics = {
+    "hot_reads": 0,
+    "head_reads": 0,
+    "cold_reads": 0,
+    "stale_threads": 0,
+    "checkpoints_buffered": 0,
+    "flushes": 0,
+    "flush_errors": 0,
+    "head_conflicts": 0,
+    "flush_ms_total": 0.0,
+    "pending_flushes": 0,
+    "hot_threads": 0,
+}
+
+
+def make_head_key(thread_id, checkpoint_ns):
+    return f"head${thread_id}${checkpoint_ns}"
+
+
+class CheckpointHeadConflictError(Exception):
+    """Another worker moved the head of a thread after this one read it, so the turn cannot be stored on top."""
+
+
+class HotThread:
+    """
+    The recent checkpoints of one thread and namespace, with the pending writes of each, in insertion order.
+    `head` is the id of the checkpoint last recorded as the durable head of the thread in Cosmos DB, `head_etag`
+    the ETag of that head document, and `validated` the time it was last known to be current.
+    """
+
+    def __init__(self):
+        self.checkpoints = OrderedDict()
+        self.writes = {}
+        self.head = None
+        self.head_etag = None
+        self.validated = float("-inf")
+        # Writes, and interrupts to flush, that arrived before the checkpoint they belong to was recorded
+        self.early_writes = OrderedDict()
+        self.interrupted = set()
+        # Flushes of a thread run one at a time, in the order they were scheduled
+        self.flush_lock = asyncio.Lock()
+        # The subgraph namespaces of the current turn of a root thread, by namespace
+        self.subgraphs = {}
+
+    def add_checkpoint(self, checkpoint_id, entry, max_checkpoints):
+        self.checkpoints[checkpoint_id] = entry
+        self.writes[checkpoint_id] = self.writes.get(checkpoint_id, []) + self.early_writes.pop(checkpoint_id, [])
+        while len(self.checkpoints) > max_checkpoints:
+            dropped_id, _ = self.checkpoints.popitem(last=False)
+            self.writes.pop(dropped_id, None)
+
+    def add_writes(self, checkpoint_id, task_id, writes, max_checkpoints):
+        if checkpoint_id in self.checkpoints:
+            self.writes[checkpoint_id].append((task_id, writes))
+            return
+        self.early_writes.setdefault(checkpoint_id, []).append((task_id, writes))
+        while len(self.early_writes) > max_checkpoints:
+            dropped_id, _ = self.early_writes.popitem(last=False)
+            self.interrupted.discard(dropped_id)
+
+    def confirm_head(self, checkpoint_id, etag):
+        self.head = checkpoint_id
+        self.head_etag = etag
+        self.validated = time.monotonic()
+
+    def is_fresh(self, fresh_seconds):
+        return time.monotonic() - self.validated <= fresh_seconds
+
+    def get_tuple(self, checkpoint_id=None):
+        if checkpoint_id is None:
+            if not self.checkpoints:
+                return None
+            checkpoint_id = next(reversed(self.checkpoints))
+        entry = self.checkpoints.get(checkpoint_id)
+        if entry is None:
+            return None
+        pending_writes = [(task_id, channel, value)
+                          for task_id, writes in self.writes.get(checkpoint_id, [])
+                          for channel, value in writes]
+        return CheckpointTuple(entry["config"], entry["checkpoint"], entry["metadata"], entry["parent_config"],
+                               pending_writes)
+
+
+class HybridCheckpointSaver(BaseCheckpointSaver):
+    """
+    Serves the checkpoints of active threads from an in-memory LRU and writes them to Cosmos DB through the
+    wrapped saver according to the durability mode. Outside "sync" mode only the checkpoint a turn stops at,
+    the one the human node interrupts or a state update writes, is written, so intermediate supersteps cost no
+    Cosmos DB round trips.
+
+    Each flush also records the thread head in a small document, replaced only if it is unchanged since this
+    worker read or wrote it; a hot thread is served from memory only while that head is the one this worker
+    wrote, checked at most every head_fresh_seconds, so a turn handled by another worker is picked up from
+    Cosmos DB. Reads of threads that are not in memory fall back to Cosmos DB.
+    """
+
+    def __init__(self, durable, durability=CHECKPOINT_DURABILITY, max_threads=CHECKPOINT_HOT_THREADS,
+                 max_checkpoints=CHECKPOINT_HOT_CHECKPOINTS_PER_THREAD,
+                 head_fresh_seconds=CHECKPOINT_HEAD_FRESH_SECONDS):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown checkpoint durability mode: {durability}")
+        super().__init__(serde=durable.serde)
+        self.durable = durable
+        self.durability = durability
+        self.max_threads = max_threads
+        self.max_checkpoints = max_checkpoints
+        self.head_fresh_seconds = head_fresh_seconds
+        self.threads = OrderedDict()
+        self.lock = threading.Lock()
+        self.flush_tasks = set()
+
+    @property
+    def container(self):
+        # Compaction and session deletion work on the stored records directly
+        return self.durable.container
+
+    def get_thread(self, key, create=False):
+        thread_id, checkpoint_ns = key
+        root_key = (thread_id, "")
+        with self.lock:
+            thread = self.threads.get(root_key)
+            if thread is None and create:
+                thread = self.threads[root_key] = HotThread()
+                while len(self.threads) > self.max_threads:
+                    # A flush in progress holds its own reference to the evicted thread
+                    self.threads.popitem(last=False)
+            if thread is not None:
+                self.threads.move_to_end(root_key)
+            hybrid_checkpoint_metrics["hot_threads"] = len(self.threads)
+            if thread is None or not checkpoint_ns:
+                return thread
+            # Each subgraph run gets a namespace of its own, so they are kept with the root thread instead of
+            # taking slots of the LRU, and dropped once the turn is over
+            subgraph = thread.subgraphs.get(checkpoint_ns)
+            if subgraph is None and create:
+                subgraph = thread.subgraphs[checkpoint_ns] = HotThread()
+            return subgraph
+
+    def evict_thread(self, thread_id):
+        """Drops every namespace of a thread from memory, e.g. when its session is deleted."""
+        with self.lock:
+            self.threads.pop((thread_id, ""), None)
+            hybrid_checkpoint_metrics["hot_threads"] = len(self.threads)
+
+    def read_head(self, key):
+        """Returns the head checkpoint id of a thread and the ETag of its head document, or None for both."""
+        hybrid_checkpoint_metrics["head_reads"] += 1
+        head_key = make_head_key(*key)
+        try:
+            head = self.container.read_item(item=head_key, partition_key=head_key)
+        except CosmosResourceNotFoundError:
+            return None, None
+        return head["checkpoint_id"], head["_etag"]
+
+    def write_head(self, key, checkpoint_id, etag):
+        """
+        Moves the head of a thread on from the head document with the given ETag, or creates it when the thread had
+        none, and returns the new ETag. Raises CheckpointHeadConflictError when another worker got there first.
+        """
+        head_key = make_head_key(*key)
+        head = {"id": head_key, "partition_key": head_key, "checkpoint_id": checkpoint_id}
+        try:
+            if etag is None:
+                return self.container.create_item(head)["_etag"]
+            return self.container.replace_item(item=head_key, body=head, etag=etag,
+                                               match_condition=MatchConditions.IfNotModified)["_etag"]
+        except (CosmosResourceExistsError, CosmosAccessConditionFailedError, CosmosResourceNotFoundError) as e:
+            raise CheckpointHeadConflictError(f"Checkpoint head of thread {key[0]} changed elsewhere") from e
+
+    def discard_checkpoint(self, key, checkpoint_id):
+        """Deletes a stored checkpoint and its writes that never became the head, so no turn is built on them."""
+        partition_key = writes_partition_key(*key, checkpoint_id)
+        for record_id in list(self.container.query_items(query="SELECT VALUE c.id FROM c",
+                                                         partition_key=partition_key)):
+            self.container.delete_item(record_id, partition_key=partition_key)
+        partition_key = checkpoint_partition_key(*key)
+        self.container.delete_item(f"{partition_key}{checkpoint_id}", partition_key=partition_key)
+
+    def record_checkpoint(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""))
+        next_config = {
+            "configurable": {
+                "thread_id": key[0],
+                "checkpoint_ns": key[1],
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+        parent_config = None
+        if configurable.get("checkpoint_id"):
+            parent_config = {"configurable": {"thread_id": key[0], "checkpoint_ns": key[1],
+                                              "checkpoint_id": configurable["checkpoint_id"]}}
+        entry = {"config": next_config, "put_config": config, "checkpoint": checkpoint, "metadata": metadata,
+                 "parent_config": parent_config, "new_versions": new_versions,
+                 "persisted": self.durability == "sync"}
+        self.get_thread(key, create=True).add_checkpoint(checkpoint["id"], entry, self.max_checkpoints)
+        hybrid_checkpoint_metrics["checkpoints_buffered"] += 1
+        return next_config
+
+    def record_writes(self, config, writes, task_id):
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""))
+        self.get_thread(key, create=True).add_writes(configurable["checkpoint_id"], task_id, list(writes),
+                                                     self.max_checkpoints)
+
+    # Synchronous methods write through; the graph runs asynchronously and only tools and scripts use these
+
+    def get_tuple(self, config):
+        return self.durable.get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return self.durable.list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = self.record_checkpoint(config, checkpoint, metadata, new_versions)
+        self.durable.put(config, checkpoint, metadata, new_versions)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self.record_writes(config, writes, task_id)
+        self.durable.put_writes(config, writes, task_id)
+
+    async def aget_tuple(self, config):
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""))
+        checkpoint_id = get_checkpoint_id(config)
+        thread = self.get_thread(key)
+
+        if thread is not None and checkpoint_id:
+            checkpoint_tuple = thread.get_tuple(checkpoint_id)
+            if checkpoint_tuple is not None:
+                hybrid_checkpoint_metrics["hot_reads"] += 1
+                return checkpoint_tuple
+            hybrid_checkpoint_metrics["cold_reads"] += 1
+            return await self.durable.aget_tuple(config)
+
+        if thread is not None and thread.checkpoints and thread.is_fresh(self.head_fresh_seconds):
+            hybrid_checkpoint_metrics["hot_reads"] += 1
+            return thread.get_tuple()
+
+        head, head_etag = await asyncio.to_thread(self.read_head, key)
+        if thread is not None and thread.checkpoints:
+            if head == thread.head:
+                thread.confirm_head(head, head_etag)
+                hybrid_checkpoint_metrics["hot_reads"] += 1
+                return thread.get_tuple()
+            # Another worker moved the thread on since this one last flushed it
+            print(f"[DEBUG] Checkpoint head of thread {key[0]} changed elsewhere, reloading it from Cosmos DB")
+            hybrid_checkpoint_metrics["stale_threads"] += 1
+            self.evict_thread(key[0])
+
+        hybrid_checkpoint_metrics["cold_reads"] += 1
+        if head is not None and not checkpoint_id:
+            # A point read of the head, instead of the saver's scan of every checkpoint of the thread
+            config = {"configurable": {**configurable, "checkpoint_id": head}}
+        checkpoint_tuple = await self.durable.aget_tuple(config)
+        if checkpoint_tuple is None:
+            return None
+
+        thread = self.get_thread(key, create=True)
+        entry = {"config": checkpoint_tuple.config, "put_config": None, "checkpoint": checkpoint_tuple.checkpoint,
+                 "metadata": checkpoint_tuple.metadata, "parent_config": checkpoint_tuple.parent_config,
+                 "new_versions": {}, "persisted": True}
+        loaded_id = checkpoint_tuple.checkpoint["id"]
+        thread.add_checkpoint(loaded_id, entry, self.max_checkpoints)
+        thread.writes[loaded_id] = [(task_id, [(channel, value)])
+                                    for task_id, channel, value in checkpoint_tuple.pending_writes or []]
+        thread.confirm_head(head, head_etag)
+        return checkpoint_tuple
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        async for checkpoint_tuple in self.durable.alist(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = self.record_checkpoint(config, checkpoint, metadata, new_versions)
+        if self.durability == "sync":
+            await self.durable.aput(config, checkpoint, metadata, new_versions)
+
+        # The interrupt of this checkpoint arrived first, and its flush waited for the checkpoint
+        key = (next_config["configurable"]["thread_id"], next_config["configurable"]["checkpoint_ns"])
+        thread = self.get_thread(key)
+        if thread is not None and checkpoint["id"] in thread.interrupted:
+            thread.interrupted.discard(checkpoint["id"])
+            await self.schedule_flush(key, thread, checkpoint["id"])
+        elif thread is not None and not key[1] and metadata.get("source") == "update":
+            # A state update, such as a turn answered from the semantic cache, is not followed by an interrupt
+            await self.schedule_flush(key, thread, checkpoint["id"])
+        return next_config
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        self.record_writes(config, writes, task_id)
+        if self.durability == "sync":
+            await self.durable.aput_writes(config, writes, task_id, task_path)
+        if not any(channel == INTERRUPT for channel, _ in writes):
+            return
+
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""))
+        thread = self.get_thread(key)
+        if configurable["checkpoint_id"] not in thread.checkpoints:
+            # The checkpoint is still being put; aput flushes it once it is recorded
+            thread.interrupted.add(configurable["checkpoint_id"])
+            return
+        await self.schedule_flush(key, thread, configurable["checkpoint_id"])
+
+    async def schedule_flush(self, key, thread, checkpoint_id):
+        """Flushes a checkpoint before returning, or in the background in "async" mode."""
+        if not key[1]:
+            # The subgraph runs of a turn are over once it stops at a root checkpoint
+            thread.subgraphs.clear()
+        flush = self.flush(key, thread, checkpoint_id)
+        if self.durability == "async":
+            task = asyncio.create_task(flush)
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+        else:
+            await flush
+
+    async def flush(self, key, thread, checkpoint_id):
+        """
+        Writes an interrupted checkpoint and its pending writes to Cosmos DB, then records it as the thread head.
+        The intermediate checkpoints of the turn are never written, so the stored checkpoint gets the previous
+        head as its parent, which keeps the stored chain of parents unbroken.
+        The head only moves from the one this worker read: when another worker moved it meanwhile, the checkpoint
+        is deleted again, the thread is dropped from memory, and the turn fails unless the flush runs in the
+        background. Other failures are logged and leave the thread in memory; the next interrupt of the thread
+        writes a newer state.
+        """
+        hybrid_checkpoint_metrics["pending_flushes"] += 1
+        try:
+            async with thread.flush_lock:
+                entry = thread.checkpoints.get(checkpoint_id)
+                if entry is None:
+                    print(f"[ERROR] Checkpoint {checkpoint_id} of thread {key[0]} is no longer in memory")
+                    return
+                start = time.perf_counter()
+                if self.durability != "sync":
+                    if not entry["persisted"]:
+                        await self.durable.aput(self.persisted_parent_config(entry["put_config"], thread.head),
+                                                entry["checkpoint"], entry["metadata"], entry["new_versions"])
+                        entry["persisted"] = True
+                    # Replayed call by call, so the stored write indices match those of a direct write
+                    for task_id, writes in list(thread.writes.get(checkpoint_id, [])):
+                        await self.durable.aput_writes(entry["config"], writes, task_id)
+                try:
+                    etag = await asyncio.to_thread(self.write_head, key, checkpoint_id, thread.head_etag)
+                except CheckpointHeadConflictError:
+                    self.evict_thread(key[0])
+                    if self.durability != "sync":
+                        try:
+                            await asyncio.to_thread(self.discard_checkpoint, key, checkpoint_id)
+                        except CosmosHttpResponseError as e:
+                            print(f"[ERROR] Error deleting checkpoint {checkpoint_id} of thread {key[0]}: {e}")
+                    raise
+                thread.confirm_head(checkpoint_id, etag)
+                hybrid_checkpoint_metrics["flushes"] += 1
+                hybrid_checkpoint_metrics["flush_ms_total"] += (time.perf_counter() - start) * 1000
+        except CheckpointHeadConflictError as e:
+            hybrid_checkpoint_metrics["head_conflicts"] += 1
+            print(f"[ERROR] Dropped checkpoint {checkpoint_id}: {e}")
+            if self.durability != "async":
+                raise
+        except Exception as e:
+            hybrid_checkpoint_metrics["flush_errors"] += 1
+            print(f"[ERROR] Error flushing checkpoint {checkpoint_id} of thread {key[0]}: {e}")
+        finally:
+            hybrid_checkpoint_metrics["pending_flushes"] -= 1
+
+    @staticmethod
+    def persisted_parent_config(put_config, head):
+        """The config a checkpoint is put with, naming the last checkpoint written to Cosmos DB as its parent."""
+        configurable = {key: value for key, value in put_config["configurable"].items() if key != "checkpoint_id"}
+        if head is not None:
+            configurable["checkpoint_id"] = head
+        return {**put_config, "configurable": configurable}
+
+    async def drain(self):
+        """Waits for background flushes, so a worker that shuts down does not drop the last turn of its threads."""
+        if self.flush_tasks:
+            print(f"[DEBUG] Waiting for {len(self.flush_tasks)} checkpoint flushes")
+            await asyncio.gather(*list(self.flush_tasks), return_exceptions=True)
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosResourceNotFoundError
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_account_container, fetch_account_by_number, \
+    fetch_latest_transaction_number
+
+load_dotenv(override=False)
+
+# Attempts per leg when concurrent writes to the same account keep invalidating the ETag
+LEDGER_MAX_ATTEMPTS = int(os.getenv("LEDGER_MAX_ATTEMPTS", "20"))
+# Transfers whose credit leg has not completed after this age are retried, or reversed if the credit is impossible
+TRANSFER_RECOVERY_INTERVAL_SECONDS = int(os.getenv("TRANSFER_RECOVERY_INTERVAL_SECONDS", "60"))
+TRANSFER_RECOVERY_AGE_SECONDS = int(os.getenv("TRANSFER_RECOVERY_AGE_SECONDS", "30"))
+
+ledger_metrics = {
+    "legs": 0,
+    "conflicts": 0,
+    "transfers": 0,
+    "recovered": 0,
+    "compensated": 0,
+}
+
+
+class TransferError(Exception):
+    pass
+
+
+def utc_now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def apply_leg(tenantId, account, credit_amount, debit_amount, details, extra_operations=()):
+    """
+    Applies one side of a transfer to an account as a single transactional batch in its partition: the
+    transaction record is created, any extra operations run, and the balance and transaction counter are
+    patched only if the account is unchanged since it was read. When a concurrent write wins, the account
+    is re-read and the leg retried.
+
+    Returns the transaction record, or None when an extra operation conflicts, meaning the leg was already applied.
+    """
+    container = get_account_container()
+    partition_key = [tenantId, account["accountId"]]
+    for attempt in range(LEDGER_MAX_ATTEMPTS):
+        last_number = account.get("lastTransactionNumber")
+        if last_number is None:
+            last_number = fetch_latest_transaction_number(tenantId, account["accountId"])
+        new_balance = account["balance"] + credit_amount - debit_amount
+
+        transaction = {
+            "id": f"{account['accountId']}-{last_number + 1}",
+            "tenantId": tenantId,
+            "accountId": account["accountId"],
+            "type": "BankTransaction",
+            "debitAmount": debit_amount,
+            "creditAmount": credit_amount,
+            "accountBalance": new_balance,
+            "details": details,
+            "transactionDateTime": utc_now()
+        }
+        operations = [
+            ("create", (transaction,)),
+            *extra_operations,
+            ("patch", (account["id"], [
+                {"op": "set", "path": "/balance", "value": new_balance},
+                {"op": "set", "path": "/lastTransactionNumber", "value": last_number + 1}
+            ]), {"if_match_etag": account["_etag"]})
+        ]
+        try:
+            container.execute_item_batch(batch_operations=operations, partition_key=partition_key)
+            ledger_metrics["legs"] += 1
+            return transaction
+        except CosmosBatchOperationError as e:
+            failed_extra_operation = 0 < e.error_index <= len(extra_operations)
+            if failed_extra_operation and e.status_code in (409, 412):
+                return None
+            if failed_extra_operation or e.status_code not in (409, 412):
+                print(f"[ERROR] Error applying ledger entry to account {account['accountId']}: {e}")
+                raise e
+            # The account or its next transaction number was taken by a concurrent leg
+            ledger_metrics["conflicts"] += 1
+            time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+            account = container.read_item(item=account["id"], partition_key=partition_key)
+    raise TransferError(f"Account {account['accountId']} is too busy, gave up after {LEDGER_MAX_ATTEMPTS} attempts")
+
+
+def complete_transfer(transfer):
+    """
+    Credits the destination of a pending transfer and marks it completed. Safe to repeat: the credit batch
+    creates a receipt keyed by the transfer id, so a credit that already happened is not applied twice.
+    """
+    container = get_account_container()
+    tenantId = transfer["tenantId"]
+    destination = container.read_item(item=transfer["toId"], partition_key=[tenantId, transfer["toAccountId"]])
+    receipt = {
+        "id": f"receipt-{transfer['transferId']}",
+        "tenantId": tenantId,
+        "accountId": transfer["toAccountId"],
+        "type": "TransferReceipt",
+        "transferId": transfer["transferId"]
+    }
+    apply_leg(tenantId, destination, transfer["amount"], 0, f"Transfer from {transfer['accountId']}",
+              [("create", (receipt,))])
+    container.patch_item(item=transfer["id"], partition_key=[tenantId, transfer["accountId"]],
+                         patch_operations=[{"op": "set", "path": "/status", "value": "completed"}])
+
+
+def compensate_transfer(transfer):
+    """Reverses the debit of a transfer whose credit can no longer be applied."""
+    container = get_account_container()
+    tenantId = transfer["tenantId"]
+    source = container.read_item(item=transfer["fromId"], partition_key=[tenantId, transfer["accountId"]])
+    mark_compensated = ("patch", (transfer["id"], [{"op": "set", "path": "/status", "value": "compensated"}]),
+                        {"filter_predicate": "FROM c WHERE c.status = 'pending'"})
+    if apply_leg(tenantId, source, transfer["amount"], 0, f"Reversal of transfer to {transfer['toAccountId']}",
+                 [mark_compensated]):
+        ledger_metrics["compensated"] += 1
+
+
+def transfer_funds(tenantId, userId, fromAccount, toAccount, amount):
+    """
+    Moves funds between two accounts, which live in different partitions. The debit and a pending transfer
+    record (the outbox) are written in one batch, then the credit is applied and the transfer completed.
+    If the credit fails, the pending transfer is picked up by the recovery service, which retries the credit
+    or reverses the debit, so the books never stay half-applied.
+
+    Returns "completed", or "pending" when the credit will be finished by the recovery service.
+    """
+    source = fetch_account_by_number(fromAccount, tenantId, userId)
+    if not source:
+        raise TransferError(f"Account {fromAccount} not found for tenant {tenantId} and user {userId}")
+    destination = fetch_account_by_number(toAccount, tenantId, userId)
+    if not destination:
+        raise TransferError(f"Account {toAccount} not found for tenant {tenantId} and user {userId}")
+
+    transferId = str(uuid.uuid4())
+    transfer = {
+        "id": f"transfer-{transferId}",
+        "transferId": transferId,
+        "tenantId": tenantId,
+        "accountId": source["accountId"],
+        "fromId": source["id"],
+        "toAccountId": destination["accountId"],
+        "toId": destination["id"],
+        "type": "Transfer",
+        "amount": amount,
+        "status": "pending",
+        "createdAt": utc_now()
+    }
+    apply_leg(tenantId, source, 0, amount, f"Transfer to {destination['accountId']}", [("create", (transfer,))])
+    ledger_metrics["transfers"] += 1
+
+    try:
+        complete_transfer(transfer)
+        return "completed"
+    except Exception as e:
+        print(f"[ERROR] Credit of transfer {transferId} failed, left pending for recovery: {e}")
+        return "pending"
+
+
+def recover_pending_transfers(min_age_seconds=TRANSFER_RECOVERY_AGE_SECONDS):
+    cutoff = (datetime.utcnow() - timedelta(seconds=min_age_seconds)).isoformat() + "Z"
+    query = "SELECT * FROM c WHERE c.type = 'Transfer' AND c.status = 'pending' AND c.createdAt < @cutoff"
+    parameters = [{"name": "@cutoff", "value": cutoff}]
+    for transfer in get_account_container().query_items(query=query, parameters=parameters,
+                                                       enable_cross_partition_query=True):
+        try:
+            complete_transfer(transfer)
+            ledger_metrics["recovered"] += 1
+        except CosmosResourceNotFoundError:
+            # The destination account no longer exists
+            compensate_transfer(transfer)
+        except Exception as e:
+            print(f"[ERROR] Error recovering transfer {transfer['transferId']}, will retry: {e}")
+
+
+async def run_transfer_recovery_service(interval_seconds: int = TRANSFER_RECOVERY_INTERVAL_SECONDS) -> None:
+    """Background loop that finishes or reverses transfers whose credit leg did not complete."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(recover_pending_transfers)
+        except Exception as e:
+            print(f"[ERROR] Error recovering pending transfers: {e}")
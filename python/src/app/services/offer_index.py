@@ -0,0 +1,166 @@
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_offers_container, vector_search
+
+load_dotenv(override=False)
+
+# "none" keeps offer retrieval in Cosmos DB, "exact" scans an in-process matrix, "ivf" probes the nearest clusters
+OFFER_INDEX_MODE = os.getenv("OFFER_INDEX_MODE", "none")
+# Partitions smaller than this are always scanned exactly, even in ivf mode
+OFFER_INDEX_IVF_MIN_SIZE = int(os.getenv("OFFER_INDEX_IVF_MIN_SIZE", "1000"))
+OFFER_INDEX_IVF_PROBES = int(os.getenv("OFFER_INDEX_IVF_PROBES", "4"))
+
+# Same semantics as vector_search: TOP 10 above a cosine similarity of 0.075
+SIMILARITY_THRESHOLD = 0.075
+TOP_K = 10
+IVF_TRAINING_ITERATIONS = 10
+
+
+class OfferPartition:
+    """Normalized offer vectors of one accountType, with an optional inverted-file index over k-means clusters."""
+
+    def __init__(self):
+        self.ids = []
+        self.rows = {}
+        self.documents = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.centroids = None
+        self.assignments = None
+
+    def upsert(self, document, vector):
+        row = self.rows.get(document["id"])
+        if row is not None:
+            self.documents[row] = document
+            self.matrix[row] = vector
+        else:
+            self.rows[document["id"]] = len(self.ids)
+            self.ids.append(document["id"])
+            self.documents.append(document)
+            self.matrix = np.vstack([self.matrix, vector]) if self.matrix.size else vector[np.newaxis, :]
+        # The clusters are retrained on the next ivf search
+        self.centroids = None
+
+    def remove(self, document_id):
+        """Removes an offer term by moving the last row into its place."""
+        row = self.rows.pop(document_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            self.ids[row] = self.ids[last]
+            self.documents[row] = self.documents[last]
+            self.matrix[row] = self.matrix[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+        self.documents.pop()
+        self.matrix = self.matrix[:last]
+        self.centroids = None
+
+    def train_ivf(self):
+        cluster_count = max(1, int(np.sqrt(len(self.ids))))
+        rng = np.random.default_rng(0)
+        centroids = self.matrix[rng.choice(len(self.ids), cluster_count, replace=False)]
+        for _ in range(IVF_TRAINING_ITERATIONS):
+            assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+            for cluster in range(cluster_count):
+                members = self.matrix[assignments == cluster]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[cluster] = centroid / np.linalg.norm(centroid)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+
+    def candidate_rows(self, queries):
+        """Rows to score for a batch of queries: all of them, or the members of the nearest clusters in ivf mode."""
+        if OFFER_INDEX_MODE != "ivf" or len(self.ids) < OFFER_INDEX_IVF_MIN_SIZE:
+            return None
+        if self.centroids is None:
+            self.train_ivf()
+        nearest_clusters = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :OFFER_INDEX_IVF_PROBES]
+        return np.flatnonzero(np.isin(self.assignments, np.unique(nearest_clusters)))
+
+    def search(self, queries, top_k):
+        rows = self.candidate_rows(queries)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        scores = queries @ matrix.T
+
+        results = []
+        for query_scores in scores:
+            best = np.argsort(-query_scores)[:top_k]
+            results.append([
+                self.documents[best_row if rows is None else rows[best_row]]
+                for best_row in best
+                if query_scores[best_row] > SIMILARITY_THRESHOLD
+            ])
+        return results
+
+
+class OfferIndex:
+    def __init__(self):
+        self.partitions = {}
+        # The accountType each offer term is indexed under, so a term that moves is removed from its old partition
+        self.account_types = {}
+        self.lock = threading.Lock()
+        self.ready = False
+
+    def upsert(self, document):
+        """
+        Adds or replaces an offer term; documents that are not vectorized terms, and every document while the
+        index is disabled, are ignored.
+        """
+        if OFFER_INDEX_MODE == "none" or document.get("type") != "Term" or not document.get("vector"):
+            return
+        vector = np.asarray(document["vector"], dtype=np.float32)
+        vector = vector / np.linalg.norm(vector)
+        projected = {"offerId": document.get("offerId"), "text": document.get("text"), "name": document.get("name"),
+                     "id": document["id"]}
+        accountType = document.get("accountType")
+        with self.lock:
+            previous = self.account_types.get(document["id"], accountType)
+            if previous != accountType:
+                self.partitions[previous].remove(document["id"])
+            self.account_types[document["id"]] = accountType
+            self.partitions.setdefault(accountType, OfferPartition()).upsert(projected, vector)
+
+    def search_batch(self, vectors, accountType, top_k=TOP_K):
+        """Exact (or ivf) cosine top-k for many query vectors of one accountType in a single matrix product."""
+        partition = self.partitions.get(accountType)
+        if partition is None or not partition.ids:
+            return [[] for _ in vectors]
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        with self.lock:
+            results = partition.search(queries, top_k)
+        return [[{key: doc[key] for key in ("offerId", "text", "name")} for doc in docs] for docs in results]
+
+    def search(self, vector, accountType, top_k=TOP_K):
+        return self.search_batch([vector], accountType, top_k)[0]
+
+
+offer_index = OfferIndex()
+
+
+def load_offer_index():
+    """Loads all vectorized offer terms from Cosmos DB when the local offer index is enabled."""
+    if OFFER_INDEX_MODE == "none":
+        return
+    try:
+        query = "SELECT c.id, c.offerId, c.text, c.name, c.type, c.accountType, c.vector FROM c WHERE c.type = 'Term'"
+        for document in get_offers_container().query_items(query=query, enable_cross_partition_query=True):
+            offer_index.upsert(document)
+        offer_index.ready = True
+        print(f"[DEBUG] Loaded offer index in {OFFER_INDEX_MODE} mode for {len(offer_index.partitions)} account types")
+    except Exception as e:
+        print(f"[ERROR] Error loading offer index, falling back to Cosmos DB vector search: {e}")
+
+
+def search_offers(vectors, accountType):
+    """Searches the local offer index when it is loaded, otherwise runs the vector search in Cosmos DB."""
+    if offer_index.ready:
+        return offer_index.search(vectors, accountType)
+    return vector_search(vectors, accountType)
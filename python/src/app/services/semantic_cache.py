@@ -0,0 +1,199 @@
+import asyncio
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError, CosmosResourceNotFoundError
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_async_semantic_cache_container
+from src.app.services.azure_open_ai import generate_embedding
+
+load_dotenv(override=False)
+
+# Backend for cached responses: "memory" (in-process), "cosmos" (SemanticCache container with a vector index) or "none"
+SEMANTIC_CACHE_BACKEND = os.getenv("SEMANTIC_CACHE_BACKEND", "memory")
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+# Short prompts such as "yes" or "Acc001" only make sense in the context of the conversation and are never cached
+SEMANTIC_CACHE_MIN_WORDS = int(os.getenv("SEMANTIC_CACHE_MIN_WORDS", "4"))
+# Prompts that refer back to the conversation ("that offer", "the same again") are never cached either
+REFERENCE_WORDS = re.compile(r"\b(it|its|that|this|those|these|them|same|again|above|earlier|previous|before|"
+                             r"instead|also|else|other)\b", re.IGNORECASE)
+DELETE_BATCH_SIZE = 100
+
+# Only turns whose tool calls are all free of side effects, and whose answer depends on nothing but the prompt,
+# may be answered from the cache. calculate_monthly_payment is excluded as its result depends on the amounts
+# and rates the user gave, which two similar prompts may not share.
+CACHEABLE_TOOLS = {"get_branch_location", "get_offer_information"}
+
+semantic_cache_metrics = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "skipped": 0,
+    "hits_by_tenant": defaultdict(int),
+    "misses_by_tenant": defaultdict(int),
+}
+
+
+class InMemorySemanticCacheBackend:
+    """Per tenant and agent LRU of normalized prompt embeddings, with TTL expiry."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.scopes = defaultdict(OrderedDict)
+
+    async def lookup(self, tenantId, agent, vector, threshold):
+        scope = self.scopes[(tenantId, agent)]
+        now = time.time()
+        for entry_id in [entry_id for entry_id, entry in scope.items() if now - entry["created"] > self.ttl_seconds]:
+            del scope[entry_id]
+        if not scope:
+            return None
+
+        entry_ids = list(scope.keys())
+        matrix = np.stack([scope[entry_id]["vector"] for entry_id in entry_ids])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+
+        scope.move_to_end(entry_ids[best])
+        return scope[entry_ids[best]]["messages"]
+
+    async def store(self, tenantId, agent, vector, messages):
+        scope = self.scopes[(tenantId, agent)]
+        scope[str(uuid.uuid4())] = {"vector": vector, "messages": messages, "created": time.time()}
+        while len(scope) > self.max_entries:
+            scope.popitem(last=False)
+            semantic_cache_metrics["evictions"] += 1
+
+    async def reset(self, tenantId):
+        for scope_key in [scope_key for scope_key in self.scopes if scope_key[0] == tenantId]:
+            del self.scopes[scope_key]
+
+
+class CosmosSemanticCacheBackend:
+    """
+    Cached responses in the SemanticCache container, partitioned by tenantId with a vector index on /vector.
+    Expiry uses the per-item ttl; there is no LRU bound as storage is not limited by process memory.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+
+    async def lookup(self, tenantId, agent, vector, threshold):
+        query = """
+        SELECT TOP 1 c.messages, VectorDistance(c.vector, @vector) AS score
+        FROM c
+        WHERE c.agent = @agent
+        ORDER BY VectorDistance(c.vector, @vector)
+        """
+        parameters = [
+            {"name": "@agent", "value": agent},
+            {"name": "@vector", "value": vector.tolist()}
+        ]
+        container = get_async_semantic_cache_container()
+        items = [item async for item in container.query_items(query=query, parameters=parameters,
+                                                               partition_key=tenantId)]
+        if not items or items[0]["score"] < threshold:
+            return None
+        return items[0]["messages"]
+
+    async def store(self, tenantId, agent, vector, messages):
+        await get_async_semantic_cache_container().upsert_item({
+            "id": str(uuid.uuid4()),
+            "tenantId": tenantId,
+            "agent": agent,
+            "vector": vector.tolist(),
+            "messages": messages,
+            "ttl": self.ttl_seconds
+        })
+
+    async def reset(self, tenantId):
+        """Deletes the entries of the tenant partition in transactional batches."""
+        container = get_async_semantic_cache_container()
+        query = "SELECT VALUE c.id FROM c"
+        entry_ids = [entry_id async for entry_id in container.query_items(query=query, partition_key=tenantId)]
+        for start in range(0, len(entry_ids), DELETE_BATCH_SIZE):
+            batch = entry_ids[start:start + DELETE_BATCH_SIZE]
+            try:
+                await container.execute_item_batch([("delete", (entry_id,)) for entry_id in batch],
+                                                   partition_key=tenantId)
+            except (CosmosBatchOperationError, CosmosHttpResponseError):
+                # A batch fails as a whole when an entry expired in the meantime, so delete its entries one by one
+                for entry_id in batch:
+                    try:
+                        await container.delete_item(entry_id, partition_key=tenantId)
+                    except CosmosResourceNotFoundError:
+                        pass
+
+
+def create_backend(backend_name):
+    if backend_name == "memory":
+        return InMemorySemanticCacheBackend(SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SECONDS)
+    if backend_name == "cosmos":
+        return CosmosSemanticCacheBackend(SEMANTIC_CACHE_TTL_SECONDS)
+    return None
+
+
+semantic_cache_backend = create_backend(SEMANTIC_CACHE_BACKEND)
+
+
+def is_cacheable_prompt(prompt):
+    return (semantic_cache_backend is not None and len(prompt.split()) >= SEMANTIC_CACHE_MIN_WORDS
+            and not REFERENCE_WORDS.search(prompt))
+
+
+def is_cacheable_turn(response_data):
+    """A turn is cacheable when every tool it called is read-only or an agent transfer."""
+    for entry in response_data:
+        for details in entry.values():
+            if not isinstance(details, dict):
+                continue
+            for msg in details.get("messages", []):
+                for tool_call in getattr(msg, "tool_calls", None) or []:
+                    name = tool_call.get("name", "")
+                    if name not in CACHEABLE_TOOLS and not name.startswith("transfer_to_"):
+                        return False
+    return True
+
+
+async def embed_prompt(prompt):
+    vector = np.asarray(await asyncio.to_thread(generate_embedding, prompt.strip().lower()), dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+async def lookup_semantic_cache(tenantId, agent, vector):
+    """Returns the cached messages of the most similar earlier prompt, or None below the similarity threshold."""
+    messages = await semantic_cache_backend.lookup(tenantId, agent, vector, SEMANTIC_CACHE_SIMILARITY_THRESHOLD)
+    if messages is None:
+        semantic_cache_metrics["misses"] += 1
+        semantic_cache_metrics["misses_by_tenant"][tenantId] += 1
+    else:
+        semantic_cache_metrics["hits"] += 1
+        semantic_cache_metrics["hits_by_tenant"][tenantId] += 1
+    return messages
+
+
+async def store_semantic_cache(tenantId, agent, vector, messages, response_data):
+    if not is_cacheable_turn(response_data):
+        semantic_cache_metrics["skipped"] += 1
+        return
+    try:
+        await semantic_cache_backend.store(tenantId, agent, vector, messages)
+        semantic_cache_metrics["stores"] += 1
+    except Exception as e:
+        print(f"[ERROR] Error storing semantic cache entry for tenantId: {tenantId}: {e}")
+
+
+async def reset_semantic_cache_for_tenant(tenantId):
+    if semantic_cache_backend is not None:
+        await semantic_cache_backend.reset(tenantId)
@@ -0,0 +1,94 @@
+import os
+import random
+import threading
+import time
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError, \
+    CosmosResourceNotFoundError
+from dotenv import load_dotenv
+
+from src.app.services.azure_cosmos_db import get_account_container, fetch_latest_account_number
+
+load_dotenv(override=False)
+
+# Numbers reserved per round-trip to the counter document; unused numbers of a block are skipped after a restart
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv("ACCOUNT_NUMBER_BLOCK_SIZE", "20"))
+
+# Counter documents live in the AccountsData container under their own logical partition
+SEQUENCE_TENANT_ID = "Sequences"
+MAX_RESERVE_ATTEMPTS = 20
+
+
+class SequenceAllocator:
+    """
+    Hands out unique, increasing numbers for a named sequence using the hi/lo pattern. Each instance reserves
+    a block of numbers by advancing a counter document with an ETag-conditioned replace, then serves the block
+    from memory. Concurrent instances in other workers reserve disjoint blocks, so numbers never collide.
+    """
+
+    def __init__(self, name, block_size, initial_value=None, container_getter=get_account_container):
+        self.name = name
+        self.block_size = block_size
+        # Called once, when the counter document does not exist yet, to seed it
+        self.initial_value = initial_value
+        self.container_getter = container_getter
+        self.next_value = 0
+        self.block_end = 0
+        self.lock = threading.Lock()
+
+    @property
+    def counter_id(self):
+        return f"sequence-{self.name}"
+
+    @property
+    def partition_key(self):
+        return [SEQUENCE_TENANT_ID, self.name]
+
+    def next(self):
+        with self.lock:
+            if self.next_value >= self.block_end:
+                self.reserve_block()
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+    def read_or_create_counter(self, container):
+        try:
+            return container.read_item(item=self.counter_id, partition_key=self.partition_key)
+        except CosmosResourceNotFoundError:
+            start = self.initial_value() if self.initial_value else 1
+            counter = {
+                "id": self.counter_id,
+                "tenantId": SEQUENCE_TENANT_ID,
+                "accountId": self.name,
+                "type": "Sequence",
+                "next": start
+            }
+            try:
+                return container.create_item(counter)
+            except CosmosResourceExistsError:
+                # Another worker seeded the counter first
+                return container.read_item(item=self.counter_id, partition_key=self.partition_key)
+
+    def reserve_block(self):
+        container = self.container_getter()
+        for attempt in range(MAX_RESERVE_ATTEMPTS):
+            counter = self.read_or_create_counter(container)
+            start = counter["next"]
+            counter["next"] = start + self.block_size
+            try:
+                container.replace_item(item=self.counter_id, body=counter, etag=counter["_etag"],
+                                       match_condition=MatchConditions.IfNotModified)
+                self.next_value, self.block_end = start, start + self.block_size
+                print(f"[DEBUG] Reserved {self.name} numbers {start} to {self.block_end - 1}")
+                return
+            except CosmosAccessConditionFailedError:
+                # Another allocator advanced the counter since it was read; retry with a fresh read
+                time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+        raise RuntimeError(f"Failed to reserve a block for sequence {self.name} after {MAX_RESERVE_ATTEMPTS} attempts")
+
+
+# Seeded from the existing accounts the first time it is used, so numbering continues where it left off
+account_number_allocator = SequenceAllocator("accountNumber", ACCOUNT_NUMBER_BLOCK_SIZE,
+                                             initial_value=lambda: (fetch_latest_account_number() or 0) + 1)
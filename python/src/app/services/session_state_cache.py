@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv(override=False)
+
+SESSION_STATE_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_STATE_CACHE_MAX_ENTRIES", "10000"))
+SESSION_STATE_CACHE_TTL_SECONDS = int(os.getenv("SESSION_STATE_CACHE_TTL_SECONDS", "1800"))
+# Entries younger than this are served without contacting Cosmos DB; older ones are revalidated by ETag,
+# which picks up writes made by other workers
+SESSION_STATE_CACHE_FRESH_SECONDS = float(os.getenv("SESSION_STATE_CACHE_FRESH_SECONDS", "10"))
+
+session_state_metrics = {
+    "hits": 0,
+    "misses": 0,
+    "revalidations": 0,
+    "not_modified": 0,
+    "writes": 0,
+}
+
+
+class SessionStateCache:
+    """
+    LRU of session documents keyed by [tenantId, userId, sessionId], with TTL expiry. Each entry keeps the
+    ETag of the cached document and the time it was last known to be current.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, fresh_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fresh_seconds = fresh_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached entry, or None when it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry["created"] > self.ttl_seconds:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry):
+        return time.monotonic() - entry["validated"] <= self.fresh_seconds
+
+    def put(self, key, document):
+        now = time.monotonic()
+        with self.lock:
+            self.entries[key] = {"document": document, "etag": document.get("_etag"), "created": now,
+                                 "validated": now}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def touch(self, key):
+        """Marks an entry as current after Cosmos DB confirmed its ETag."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry["validated"] = time.monotonic()
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+session_state_cache = SessionStateCache(SESSION_STATE_CACHE_MAX_ENTRIES, SESSION_STATE_CACHE_TTL_SECONDS,
+                                        SESSION_STATE_CACHE_FRESH_SECONDS)
@@ -4,8 +4,9 @@ from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from langsmith import traceable
 
-from src.app.services.azure_cosmos_db import vector_search, create_account_record, \
-    fetch_latest_account_number
+from src.app.services.azure_cosmos_db import create_account_record
+from src.app.services.offer_index import search_offers
+from src.app.services.sequence_allocator import account_number_allocator
 from src.app.services.azure_open_ai import generate_embedding
 
 
@@ -14,9 +15,9 @@ from src.app.services.azure_open_ai import generate_embedding
 def get_offer_information(user_prompt: str, accountType: str) -> list[dict[str, Any]]:
     """Provide information about a product based on the user prompt.
     Takes as input the user prompt as a string."""
-    # Perform a vector search on the Cosmos DB container and return results to the agent
+    # Perform a vector search on the local offer index, or the Cosmos DB container, and return results to the agent
     vectors = generate_embedding(user_prompt)
-    search_results = vector_search(vectors, accountType)
+    search_results = search_offers(vectors, accountType)
     return search_results
 
 
@@ -26,23 +27,15 @@ def create_account(account_holder: str, balance: float, config: RunnableConfig)
     """
     Create a new bank account for a user.
 
-    This function retrieves the latest account number, increments it, and creates a new account record
-    in Cosmos DB associated with a specific user and tenant.
+    This function takes the next account number from the account number sequence and creates a new account
+    record in Cosmos DB associated with a specific user and tenant.
     """
     print(f"Creating account for {account_holder}")
     thread_id = config["configurable"].get("thread_id", "UNKNOWN_THREAD_ID")
     userId = config["configurable"].get("userId", "UNKNOWN_USER_ID")
     tenantId = config["configurable"].get("tenantId", "UNKNOWN_TENANT_ID")
-    max_attempts = 10
-    account_number = fetch_latest_account_number()
-
-    print(f"Latest account number: {account_number}")
-    if account_number is None:
-        account_number = 1
-    else:
-        account_number += 1
-
-    for attempt in range(max_attempts):
+    try:
+        account_number = account_number_allocator.next()
         account_data = {
             "id": f"{account_number}",
             "accountId": f"A{account_number}",
@@ -59,16 +52,11 @@ def create_account(account_holder: str, balance: float, config: RunnableConfig)
                 "key2": "Value2"
             }
         }
-        try:
-            print(f"Creating account record: {account_data}")
-            create_account_record(account_data)
-            return f"Successfully created account {account_number} for {account_holder} with a balance of ${balance}"
-        except Exception as e:
-            account_number += 1
-            if attempt == max_attempts - 1:
-                return f"Failed to create account after {max_attempts} attempts: {e}"
-
-    return f"Failed to create account after {max_attempts} attempts"
+        print(f"Creating account record: {account_data}")
+        create_account_record(account_data)
+        return f"Successfully created account {account_number} for {account_holder} with a balance of ${balance}"
+    except Exception as e:
+        return f"Failed to create account: {e}"
 
 
 @tool
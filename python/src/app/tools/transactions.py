@@ -1,97 +1,97 @@
 import logging
+import os
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from langsmith import traceable
 
-from src.app.services.azure_cosmos_db import fetch_latest_transaction_number, fetch_account_by_number, \
-    create_transaction_record, \
-    patch_account_record, fetch_transactions_by_date_range
+from src.app.services.azure_cosmos_db import fetch_account_by_number, fetch_transactions_page, \
+    summarize_transactions
+from src.app.services.ledger import transfer_funds, TransferError
+from src.app.services.account_rollups import fetch_monthly_rollups, summarize_rollups
+
+load_dotenv(override=False)
+
+# Bounds the tool output placed in the agent context, whatever the length of the history
+TRANSACTION_HISTORY_PAGE_SIZE = int(os.getenv("TRANSACTION_HISTORY_PAGE_SIZE", "20"))
+TRANSACTION_HISTORY_TOP_N = int(os.getenv("TRANSACTION_HISTORY_TOP_N", "5"))
 
 
 @tool
 @traceable
 def bank_transfer(config: RunnableConfig, toAccount: str, fromAccount: str, amount: float) -> str:
     """Wrapper function to handle the transfer of funds between two accounts."""
-    # Debit the amount from the fromAccount
-    debit_result = bank_transaction(config, fromAccount, amount, credit_account=0, debit_account=amount)
-    if "Failed" in debit_result:
-        return f"Failed to debit amount from {fromAccount}: {debit_result}"
-
-    # Credit the amount to the toAccount
-    credit_result = bank_transaction(config, toAccount, amount, credit_account=amount, debit_account=0)
-    if "Failed" in credit_result:
-        return f"Failed to credit amount to {toAccount}: {credit_result}"
-
-    return f"Successfully transferred ${amount} from account {fromAccount} to account {toAccount}"
-
-
-def bank_transaction(config: RunnableConfig, account_number: str, amount: float, credit_account: float,
-                     debit_account: float) -> str:
-    """Transfer to bank agent"""
-    global new_balance
     tenantId = config["configurable"].get("tenantId", "UNKNOWN_TENANT_ID")
     userId = config["configurable"].get("userId", "UNKNOWN_USER_ID")
+    try:
+        status = transfer_funds(tenantId, userId, fromAccount, toAccount, amount)
+    except TransferError as e:
+        return f"Failed to transfer ${amount} from account {fromAccount} to account {toAccount}: {e}"
+    except Exception as e:
+        logging.error(f"Transfer from {fromAccount} to {toAccount} failed: {e}")
+        return f"Failed to transfer ${amount} from account {fromAccount} to account {toAccount}: {e}"
 
-    # Fetch the account record
-    account = fetch_account_by_number(account_number, tenantId, userId)
-    if not account:
-        return f"Account {account_number} not found for tenant {tenantId} and user {userId}"
-
-    max_attempts = 5
-    for attempt in range(max_attempts):
-        try:
-            # Fetch the latest transaction number for the account
-            latest_transaction_number = fetch_latest_transaction_number(account_number)
-            transaction_id = f"{account_number}-{latest_transaction_number + 1}"
-
-            # Calculate the new account balance
-            new_balance = account["balance"] + credit_account - debit_account
-
-            # Create the transaction record
-            transaction_data = {
-                "id": transaction_id,
-                "tenantId": tenantId,
-                "accountId": account["accountId"],
-                "type": "BankTransaction",
-                "debitAmount": debit_account,
-                "creditAmount": credit_account,
-                "accountBalance": new_balance,
-                "details": "Bank Transfer",
-                "transactionDateTime": datetime.utcnow().isoformat() + "Z"
-            }
-
-            create_transaction_record(transaction_data)
-            print(f"Successfully transferred ${amount} to account number {account_number}")
-            break  # Stop retrying after a successful attempt
-        except Exception as e:
-            logging.error(f"Attempt {attempt + 1} failed: {e}")
-            if attempt == max_attempts - 1:
-                return f"Failed to create transaction record after {max_attempts} attempts: {e}"
-
-    # Update the account balance
-    patch_account_record(tenantId, account["accountId"], new_balance)
-    return f"Successfully transferred ${amount} to account number {account_number}"
+    if status == "pending":
+        return (f"Debited ${amount} from account {fromAccount}. The credit to account {toAccount} is delayed and will be "
+                f"completed automatically, or the debit reversed")
+    return f"Successfully transferred ${amount} from account {fromAccount} to account {toAccount}"
 
 
 @tool
 @traceable
-def get_transaction_history(accountId: str, startDate: datetime, endDate: datetime) -> List[Dict]:
+def get_transaction_history(config: RunnableConfig, accountId: str, startDate: datetime, endDate: datetime,
+                            continuationToken: Optional[str] = None) -> Dict:
     """
     Retrieve the transaction history for a specific account between two dates.
 
+    When the range holds more transactions than fit in one page, a summary (count, totals, min/max and the
+    largest debits and credits) is returned with the first page. Pass the returned continuationToken back
+    to get the next page.
+
     :param accountId: The ID of the account to retrieve transactions for.
     :param startDate: The start date for the transaction history.
     :param endDate: The end date for the transaction history.
-    :return: A list of transactions within the specified date range.
+    :param continuationToken: The token returned with the previous page, to continue from there.
+    :return: The transactions of the page, the continuationToken of the next page, and a summary for large ranges.
     """
+    tenantId = config["configurable"].get("tenantId", "UNKNOWN_TENANT_ID")
     try:
-        transactions = fetch_transactions_by_date_range(accountId, startDate, endDate)
-        return transactions
+        transactions, next_token = fetch_transactions_page(tenantId, accountId, startDate, endDate,
+                                                           TRANSACTION_HISTORY_PAGE_SIZE, continuationToken)
+        result = {"transactions": transactions, "continuationToken": next_token}
+        if continuationToken is None and next_token is not None:
+            result["summary"] = summarize_transactions(tenantId, accountId, startDate, endDate,
+                                                       TRANSACTION_HISTORY_TOP_N)
+        return result
     except Exception as e:
         logging.error(f"Error fetching transaction history for account {accountId}: {e}")
-        return []
+        return {"transactions": [], "continuationToken": None}
+
+
+@tool
+@traceable
+def get_monthly_account_summary(config: RunnableConfig, accountId: str, startMonth: str, endMonth: str) -> Dict:
+    """
+    Answer aggregate questions, such as how much was spent or received over a period, from the monthly
+    rollups of an account instead of the individual transactions.
+
+    :param accountId: The ID of the account to summarize.
+    :param startMonth: The first month of the period, as YYYY-MM.
+    :param endMonth: The last month of the period, as YYYY-MM. A period covers at most 24 months.
+    :return: Debit and credit totals, transaction counts and closing balance per month and for the whole period.
+    """
+    tenantId = config["configurable"].get("tenantId", "UNKNOWN_TENANT_ID")
+    try:
+        return summarize_rollups(fetch_monthly_rollups(tenantId, accountId, startMonth, endMonth))
+    except ValueError as e:
+        # The period is too long, or a month is not YYYY-MM; the agent can ask for a shorter or corrected range
+        return {"error": str(e)}
+    except Exception as e:
+        logging.error(f"Error fetching monthly summary for account {accountId}: {e}")
+        return {}
 
 
 @tool
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+from src.app.services.account_rollups import replay_rollups_from_file, fetch_monthly_rollups
+
+# Run from the python directory: python -m test.account_rollups_replay [--write] [--verify-stored]
+# Rebuilds the rollups from a data file and checks each one against totals recomputed directly from the
+# transactions of its month. With --verify-stored, the rollups kept in Cosmos DB are checked as well.
+# Exits with status 1 when any rollup differs.
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "AccountsData.json")
+CHECKED_FIELDS = ("debitTotal", "creditTotal", "debitCount", "creditCount", "transactionCount", "closingBalance")
+
+
+def expected_totals(path):
+    """Totals per tenant, account and month, summed from the transactions without the rollup code."""
+    with open(path, encoding="utf-8") as data_file:
+        transactions = [document for document in json.load(data_file) if document.get("type") == "BankTransaction"]
+    totals = defaultdict(lambda: dict.fromkeys(CHECKED_FIELDS, 0))
+    latest = {}
+    for transaction in transactions:
+        key = (transaction["tenantId"], transaction["accountId"], transaction["transactionDateTime"][:7])
+        debit = transaction.get("debitAmount") or 0
+        credit = transaction.get("creditAmount") or 0
+        totals[key]["debitTotal"] += debit
+        totals[key]["creditTotal"] += credit
+        totals[key]["debitCount"] += 1 if debit > 0 else 0
+        totals[key]["creditCount"] += 1 if credit > 0 else 0
+        totals[key]["transactionCount"] += 1
+        if key not in latest or transaction["transactionDateTime"] >= latest[key]["transactionDateTime"]:
+            latest[key] = transaction
+    for key, transaction in latest.items():
+        totals[key]["closingBalance"] = transaction.get("accountBalance")
+    return dict(totals)
+
+
+def compare(rollups, expected, source):
+    """Returns one message per rollup that is missing, unexpected or differs from the expected totals."""
+    actual = {(rollup["tenantId"], rollup["accountId"], rollup["month"]): rollup for rollup in rollups}
+    mismatches = []
+    for key in sorted(set(actual) | set(expected)):
+        if key not in actual:
+            mismatches.append(f"{source}: missing rollup for {' '.join(key)}")
+        elif key not in expected:
+            mismatches.append(f"{source}: unexpected rollup for {' '.join(key)}")
+        else:
+            for field in CHECKED_FIELDS:
+                if actual[key][field] != expected[key][field]:
+                    mismatches.append(f"{source}: {' '.join(key)} {field} is {actual[key][field]}, "
+                                      f"expected {expected[key][field]}")
+    return mismatches
+
+
+def stored_rollups(expected):
+    rollups = []
+    for tenantId, accountId in sorted({(tenantId, accountId) for tenantId, accountId, _ in expected}):
+        months = sorted(month for key_tenant, key_account, month in expected
+                        if (key_tenant, key_account) == (tenantId, accountId))
+        rollups.extend(fetch_monthly_rollups(tenantId, accountId, months[0], months[-1]))
+    return rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the monthly account rollups from a data file and check "
+                                                 "them against the transactions.")
+    parser.add_argument("--file", default=DEFAULT_DATA_FILE)
+    parser.add_argument("--write", action="store_true", help="Upsert the rollups into the AccountRollups container")
+    parser.add_argument("--verify-stored", action="store_true",
+                        help="Also check the rollups stored in the AccountRollups container")
+    args = parser.parse_args()
+
+    rollups = replay_rollups_from_file(args.file, write=args.write)
+    for rollup in sorted(rollups, key=lambda r: (r["tenantId"], r["accountId"], r["month"])):
+        print(f"{rollup['tenantId']} {rollup['accountId']} {rollup['month']}: "
+              f"{rollup['transactionCount']} transactions, debits {rollup['debitTotal']} ({rollup['debitCount']}), "
+              f"credits {rollup['creditTotal']} ({rollup['creditCount']}), closing balance {rollup['closingBalance']}")
+    print(f"{len(rollups)} rollups" + (" written to Cosmos DB" if args.write else ""))
+
+    expected = expected_totals(args.file)
+    mismatches = compare(rollups, expected, "replay")
+    if args.verify_stored:
+        mismatches += compare(stored_rollups(expected), expected, "stored")
+    for mismatch in mismatches:
+        print(f"[MISMATCH] {mismatch}")
+    if mismatches:
+        sys.exit(1)
+    print("All rollups match the transactions")
+
+
+if __name__ == "__main__":
+    main()
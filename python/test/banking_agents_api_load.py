@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+BASE_URL = "http://127.0.0.1:8000"  # Update if hosted elsewhere.
+TENANT_ID = "load_tenant"  # Replace with actual tenant ID if needed.
+USER_ID = "load_user"  # Replace with actual user ID if needed.
+PROMPT = "What branches do you have in Washington?"
+
+
+async def create_session(client):
+    response = await client.post(f"{BASE_URL}/tenant/{TENANT_ID}/user/{USER_ID}/sessions")
+    response.raise_for_status()
+    return response.json().get("sessionId")
+
+
+async def send_message(client, session_id, user_message):
+    headers = {"Content-Type": "application/json"}
+    start = time.perf_counter()
+    response = await client.post(
+        f"{BASE_URL}/tenant/{TENANT_ID}/user/{USER_ID}/sessions/{session_id}/completion",
+        content=f'"{user_message}"',
+        headers=headers
+    )
+    return time.perf_counter() - start, response.status_code
+
+
+async def delete_session(client, session_id):
+    await client.delete(f"{BASE_URL}/tenant/{TENANT_ID}/user/{USER_ID}/sessions/{session_id}")
+
+
+async def run(concurrency, turns, report_every):
+    async with httpx.AsyncClient(timeout=300) as client:
+        session_ids = await asyncio.gather(*[create_session(client) for _ in range(concurrency)])
+
+        latencies = []
+        turn_latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(turns):
+            results = await asyncio.gather(*[send_message(client, session_id, PROMPT) for session_id in session_ids])
+            turn_latencies.append(sorted(latency for latency, _ in results))
+            for latency, status_code in results:
+                latencies.append(latency)
+                if status_code != 200:
+                    errors += 1
+        wall_time = time.perf_counter() - start
+
+        await asyncio.gather(*[delete_session(client, session_id) for session_id in session_ids])
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Conversations: {concurrency}, turns each: {turns}, requests: {total}, errors: {errors}")
+    print(f"Wall time: {wall_time:.2f}s, throughput: {total / wall_time:.2f} req/s")
+    print(f"Latency p50: {latencies[total // 2]:.2f}s, p95: {latencies[int(total * 0.95) - 1]:.2f}s, "
+          f"max: {latencies[-1]:.2f}s")
+    # With a blocking handler requests are served one after another and this stays close to 1
+    print(f"Effective concurrency (sum of latencies / wall time): {sum(latencies) / wall_time:.2f}")
+
+    if report_every:
+        # End-to-end latency by thread length; test/checkpoint_resume_benchmark.py isolates the checkpoint read
+        print("Median latency by turn:")
+        for turn in range(0, turns, report_every):
+            median = turn_latencies[turn][len(turn_latencies[turn]) // 2]
+            print(f"  turn {turn + 1}: {median:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load benchmark for the completion endpoint")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of concurrent conversations")
+    parser.add_argument("--turns", type=int, default=3, help="Number of turns per conversation")
+    parser.add_argument("--report-every", type=int, default=0,
+                        help="Print the median latency every N turns, e.g. --turns 200 --report-every 20")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.turns, args.report_every))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import json
+
+import requests
+
+from src.app.services.azure_cosmos_db import close_async_cosmos_client
+from src.app.services.bulk_loader import bulk_load, read_file_chunks, BULK_TARGETS
+
+# Run from the python directory: python -m test.bulk_load_cli offers data/OffersData.json [--embed]
+# Loads a JSON array or NDJSON file into Cosmos DB directly, or streams it to the bulk endpoint of a running API
+# with --api http://127.0.0.1:8000, and prints the load summary and error report.
+ENDPOINTS = {"users": "userdata", "accounts": "accountdata", "offers": "offerdata"}
+
+
+async def load_directly(target, path, embed):
+    try:
+        return await bulk_load(target, read_file_chunks(path), embed=embed)
+    finally:
+        await close_async_cosmos_client()
+
+
+def load_through_api(api_url, target, path, embed):
+    with open(path, "rb") as file:
+        response = requests.post(f"{api_url}/{ENDPOINTS[target]}/bulk", data=file,
+                                 params={"embed": "true"} if embed else None,
+                                 headers={"Content-Type": "application/json"})
+    response.raise_for_status()
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load users, accounts or offers from a JSON or NDJSON file.")
+    parser.add_argument("target", choices=sorted(BULK_TARGETS))
+    parser.add_argument("path")
+    parser.add_argument("--embed", action="store_true", help="Compute vectors of offer terms that have none")
+    parser.add_argument("--api", help="Base URL of a running API to stream the file to")
+    args = parser.parse_args()
+
+    if args.api:
+        summary = load_through_api(args.api, args.target, args.path, args.embed)
+    else:
+        summary = asyncio.run(load_directly(args.target, args.path, args.embed))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
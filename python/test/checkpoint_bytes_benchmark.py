@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+from src.app.banking_agents import get_graph
+
+# Run from the python directory: python -m test.checkpoint_bytes_benchmark [--turns 10]
+# Runs the same scripted conversation on two new threads and reports the checkpoint bytes written per turn:
+# "full" re-submits the last checkpoint state with the new message appended, as the API used to,
+# "delta" sends only the new message.
+PROMPTS = [
+    "I want to check my account balance",
+    "Acc001",
+    "Show me my transactions for February 2025",
+    "Transfer 10 from Acc001 to Acc003",
+    "Yes, please go ahead",
+    "What is the balance of Acc001 now?",
+]
+
+
+def thread_bytes(container, thread_id):
+    query = "SELECT * FROM c WHERE CONTAINS(c.partition_key, @thread_id)"
+    parameters = [{"name": "@thread_id", "value": thread_id}]
+    records = container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True)
+    return sum(len(json.dumps(record)) for record in records)
+
+
+async def full_state_input(workflow, config, prompt):
+    last_checkpoint = await workflow.checkpointer.aget_tuple(config)
+    if last_checkpoint is None:
+        return {"messages": [{"role": "user", "content": prompt}]}
+    last_state = last_checkpoint.checkpoint
+    last_state.setdefault("messages", []).append({"role": "user", "content": prompt})
+    last_state["langgraph_triggers"] = ["resume:coordinator_agent"]
+    return last_state
+
+
+async def run_conversation(mode, turns):
+    workflow = get_graph()
+    thread_id = f"checkpoint-bytes-{mode}-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "userId": "Mark", "tenantId": "Contoso"}}
+    container = workflow.checkpointer.container
+
+    written = []
+    total = 0
+    for turn in range(turns):
+        prompt = PROMPTS[turn % len(PROMPTS)]
+        if mode == "full":
+            graph_input = await full_state_input(workflow, config, prompt)
+        else:
+            graph_input = {"messages": [HumanMessage(content=prompt)]}
+        await workflow.ainvoke(graph_input, config, stream_mode="updates")
+        after = thread_bytes(container, thread_id)
+        written.append(after - total)
+        total = after
+    return written
+
+
+async def run(turns):
+    results = {mode: await run_conversation(mode, turns) for mode in ("full", "delta")}
+    print("turn  full (bytes)  delta (bytes)")
+    for turn in range(turns):
+        print(f"{turn + 1:4d}  {results['full'][turn]:12d}  {results['delta'][turn]:13d}")
+    print(f"total {sum(results['full']):11d}  {sum(results['delta']):13d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare checkpoint bytes written per turn by both resume styles.")
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from src.app.banking_agents import get_checkpointer
+from src.app.services.checkpoint_compaction import delete_thread_records
+from src.app.services.hybrid_checkpointer import HybridCheckpointSaver
+
+# Run from the python directory: python -m test.checkpoint_resume_benchmark [--lengths 1 10 50 100 200]
+# Grows one synthetic thread to each length and measures the latency of resuming it, that is of reading its latest
+# checkpoint without knowing its id: through the Cosmos DB saver, which scans every checkpoint of the thread to find
+# the newest, and through the head document written by the hybrid saver, which is a point read.
+
+
+def put_checkpoints(saver, config, start, count):
+    for step in range(start, start + count):
+        checkpoint = create_checkpoint(empty_checkpoint(), None, step)
+        checkpoint["channel_values"] = {"messages": [HumanMessage(content=f"Turn {step}", id=f"human-{step}")]}
+        config = saver.put(config, checkpoint, {"source": "loop", "step": step, "writes": None}, {})
+    return config
+
+
+async def time_reads(read, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await read()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+async def run(lengths, repeat):
+    durable = get_checkpointer().durable
+    thread_id = f"checkpoint-resume-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    latest = config
+    written = 0
+
+    print("checkpoints  saver scan (ms)  head point read (ms)")
+    try:
+        for length in sorted(lengths):
+            latest = put_checkpoints(durable, latest, written, length - written)
+            written = length
+            hybrid = HybridCheckpointSaver(durable)
+            hybrid.write_head((thread_id, ""), latest["configurable"]["checkpoint_id"],
+                              hybrid.read_head((thread_id, ""))[1])
+
+            scan_ms = await time_reads(lambda: durable.aget_tuple(config), repeat)
+
+            async def cold_head_read():
+                # A new hybrid saver has nothing in memory, so every read goes to Cosmos DB through the head
+                await HybridCheckpointSaver(durable).aget_tuple(config)
+
+            head_ms = await time_reads(cold_head_read, repeat)
+            print(f"{length:11d}  {scan_ms:15.1f}  {head_ms:20.1f}")
+    finally:
+        delete_thread_records(durable.container, thread_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure thread resume latency as the thread grows.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.lengths, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import time
+
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph_checkpoint_cosmosdb import CosmosSerializer
+
+from src.app.services.checkpointer import CompactCheckpointSerializer
+
+# Run from the python directory: python -m test.checkpoint_serializer_benchmark [--turns 50]
+# Serializes a synthetic checkpoint shaped like the ones the graph writes and compares the stored document
+# size and the serialize/deserialize time of the default and the compact serializer.
+
+
+def synthetic_checkpoint(turns):
+    messages = []
+    for turn in range(turns):
+        response_metadata = {
+            "token_usage": {"prompt_tokens": 900 + turn * 40, "completion_tokens": 60, "total_tokens": 960 + turn * 40},
+            "model_name": "gpt-4o-2024-08-06",
+            "system_fingerprint": "fp_b705f0c291",
+            "finish_reason": "stop",
+            "logprobs": None,
+            "prompt_filter_results": [{"prompt_index": 0, "content_filter_results": {
+                category: {"filtered": False, "severity": "safe"}
+                for category in ("hate", "self_harm", "sexual", "violence")}}],
+            "content_filter_results": {
+                category: {"filtered": False, "severity": "safe"}
+                for category in ("hate", "self_harm", "sexual", "violence")},
+        }
+        messages.extend([
+            HumanMessage(content=f"What is the balance of Acc00{turn % 4 + 1}?", id=f"human-{turn}"),
+            AIMessage(content="", id=f"call-{turn}", response_metadata=response_metadata,
+                      tool_calls=[{"name": "bank_balance", "args": {"account_number": f"Acc00{turn % 4 + 1}"},
+                                   "id": f"call_{turn}"}]),
+            ToolMessage(content=f"The balance for account number Acc00{turn % 4 + 1} is ${50000 - turn}",
+                        tool_call_id=f"call_{turn}", name="bank_balance", id=f"tool-{turn}"),
+            AIMessage(content=f"Your balance is ${50000 - turn}. Anything else?", id=f"answer-{turn}",
+                      response_metadata=response_metadata),
+        ])
+    return {
+        "v": 1,
+        "id": "1efd0000-0000-6000-8000-000000000000",
+        "ts": "2025-02-10T10:30:00+00:00",
+        "channel_values": {"messages": messages, "summary": "", "summarized_until": 0},
+        "channel_versions": {"messages": f"{turns:032d}.0.1", "human": f"{turns:032d}.0.2"},
+        "versions_seen": {"human": {"transactions_agent": f"{turns:032d}.0.1"}},
+        "pending_sends": [],
+    }
+
+
+def measure(name, serde, checkpoint, repeat):
+    cosmos_serde = CosmosSerializer(serde)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        type_, stored = cosmos_serde.dumps_typed(checkpoint)
+    serialize_ms = (time.perf_counter() - start) / repeat * 1000
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        cosmos_serde.loads_typed((type_, stored))
+    deserialize_ms = (time.perf_counter() - start) / repeat * 1000
+
+    size = len(json.dumps({"type": type_, "checkpoint": stored}))
+    print(f"{name:8s} {type_:16s} {size:10d} bytes  serialize {serialize_ms:7.2f} ms  "
+          f"deserialize {deserialize_ms:7.2f} ms")
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare checkpoint document size and serializer speed.")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    checkpoint = synthetic_checkpoint(args.turns)
+    default_size = measure("default", JsonPlusSerializer(), checkpoint, args.repeat)
+    compact_size = measure("compact", CompactCheckpointSerializer(), checkpoint, args.repeat)
+    print(f"compact documents are {compact_size / default_size:.0%} of the default size")
+
+    # Checkpoints written with the default serializer stay readable after switching
+    type_, stored = CosmosSerializer(JsonPlusSerializer()).dumps_typed(checkpoint)
+    restored = CosmosSerializer(CompactCheckpointSerializer()).loads_typed((type_, stored))
+    assert len(restored["channel_values"]["messages"]) == len(checkpoint["channel_values"]["messages"])
+
+
+if __name__ == "__main__":
+    main()
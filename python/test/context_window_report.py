@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import os
+
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+
+from src.app.services.context_window import build_context_window, count_messages_tokens, count_text_tokens, \
+    with_summary, summarize_messages, CONTEXT_SUMMARY_MAX_WORDS
+
+# Run from the python directory: python -m test.context_window_report [--turns 100] [--llm]
+# Replays a synthetic conversation and reports the prompt tokens an agent receives on each turn,
+# with the full history as before and with the token-budgeted window.
+PROMPT_FILE = os.path.join(os.path.dirname(__file__), "..", "src", "app", "prompts", "transactions_agent.prompty")
+
+
+def synthetic_turn(turn):
+    """One turn of a transactions conversation: a question, a tool call, its result and the answer."""
+    call_id = f"call_{turn}"
+    return [
+        HumanMessage(content=f"What is the balance of account Acc00{turn % 4 + 1}, and did I spend more than "
+                             f"${turn * 10} last month?", id=f"human-{turn}"),
+        AIMessage(content="", id=f"ai-call-{turn}",
+                  tool_calls=[{"name": "bank_balance", "args": {"account_number": f"Acc00{turn % 4 + 1}"},
+                               "id": call_id}]),
+        ToolMessage(content=f"The balance for account number Acc00{turn % 4 + 1} is ${50000 - turn * 37}",
+                    tool_call_id=call_id, name="bank_balance", id=f"tool-{turn}"),
+        AIMessage(content=f"The balance of account Acc00{turn % 4 + 1} is ${50000 - turn * 37}. Last month you spent "
+                          f"${turn * 9}, which is less than ${turn * 10}. Is there anything else I can help with?",
+                  id=f"ai-answer-{turn}"),
+    ]
+
+
+async def placeholder_summary(summary, messages):
+    """Stands in for the LLM summarizer with a summary of the maximum allowed length."""
+    return " ".join(["summary"] * CONTEXT_SUMMARY_MAX_WORDS)
+
+
+async def run(turns, use_llm):
+    with open(PROMPT_FILE, encoding="utf-8") as prompt_file:
+        prompt = prompt_file.read()
+
+    state = {"messages": [], "summary": "", "summarized_until": 0}
+    summarizations = 0
+    print("turn  full history  windowed  summarized messages")
+    for turn in range(1, turns + 1):
+        new_turn = synthetic_turn(turn)
+        state["messages"].append(new_turn[0])
+
+        full_tokens = count_text_tokens(prompt) + count_messages_tokens(state["messages"])
+        context, update = await build_context_window(
+            state, summarize=summarize_messages if use_llm else placeholder_summary)
+        state.update(update)
+        summarizations += bool(update)
+        windowed_tokens = count_text_tokens(with_summary(prompt, context["summary"])) + \
+            count_messages_tokens(context["messages"])
+
+        print(f"{turn:4d}  {full_tokens:12d}  {windowed_tokens:8d}  {state['summarized_until']:19d}")
+        state["messages"].extend(new_turn[1:])
+
+    print(f"{summarizations} summarization calls over {turns} turns")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report prompt tokens per turn with and without the context window.")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--llm", action="store_true", help="Summarize with the chat model instead of a placeholder")
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.llm))
+
+
+if __name__ == "__main__":
+    main()
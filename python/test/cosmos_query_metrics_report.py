@@ -0,0 +1,93 @@
+import argparse
+import os
+import time
+
+from azure.cosmos import CosmosClient
+from azure.identity import DefaultAzureCredential
+from dotenv import load_dotenv
+
+load_dotenv(override=False)
+
+# Works against an Azure account (DefaultAzureCredential) or the local emulator (COSMOSDB_KEY)
+COSMOS_DB_URL = os.getenv("COSMOSDB_ENDPOINT")
+COSMOS_DB_KEY = os.getenv("COSMOSDB_KEY")
+DATABASE_NAME = "MultiAgentBanking"
+
+
+def measure(container, operation, repeat):
+    charges = []
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        latencies.append((time.perf_counter() - start) * 1000)
+        charges.append(float(container.client_connection.last_response_headers.get("x-ms-request-charge", 0)))
+    return sum(charges) / repeat, sum(latencies) / repeat
+
+
+def report(name, container, before, after, repeat):
+    before_ru, before_ms = measure(container, before, repeat)
+    after_ru, after_ms = measure(container, after, repeat)
+    print(f"{name:<40} {before_ru:>9.2f} {after_ru:>9.2f} {before_ms:>10.1f} {after_ms:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares RU charge and latency of cross-partition queries "
+                                                 "with partition-scoped queries and point reads")
+    parser.add_argument("--tenant", default="Contoso")
+    parser.add_argument("--user", default="Mark")
+    parser.add_argument("--session", required=True, help="An existing sessionId of the given tenant and user")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    credential = COSMOS_DB_KEY if COSMOS_DB_KEY else DefaultAzureCredential()
+    database = CosmosClient(COSMOS_DB_URL, credential=credential).get_database_client(DATABASE_NAME)
+    chat_container = database.get_container_client("Chat")
+    chat_history_container = database.get_container_client("ChatHistory")
+    tenantId, userId, sessionId = args.tenant, args.user, args.session
+
+    print(f"{'operation':<40} {'RU before':>9} {'RU after':>9} {'ms before':>10} {'ms after':>10}")
+
+    report(
+        "sessions by tenant and user", chat_container,
+        lambda: list(chat_container.query_items(
+            query=f"SELECT * FROM c WHERE c.tenantId = '{tenantId}' AND c.userId = '{userId}'",
+            enable_cross_partition_query=True)),
+        lambda: list(chat_container.query_items(
+            query="SELECT * FROM c WHERE c.tenantId = @tenantId AND c.userId = @userId",
+            parameters=[{"name": "@tenantId", "value": tenantId}, {"name": "@userId", "value": userId}],
+            partition_key=[tenantId, userId])),
+        args.repeat)
+
+    report(
+        "session by id", chat_container,
+        lambda: list(chat_container.query_items(
+            query=f"SELECT * FROM c WHERE c.tenantId = '{tenantId}' AND c.userId = '{userId}' "
+                  f"AND c.sessionId = '{sessionId}'",
+            enable_cross_partition_query=True)),
+        lambda: chat_container.read_item(item=sessionId, partition_key=[tenantId, userId, sessionId]),
+        args.repeat)
+
+    report(
+        "chat history by session", chat_history_container,
+        lambda: list(chat_history_container.query_items(
+            query=f"SELECT * FROM c WHERE c.sessionId = '{sessionId}'",
+            enable_cross_partition_query=True)),
+        lambda: list(chat_history_container.query_items(
+            query="SELECT * FROM c WHERE c.sessionId = @sessionId",
+            parameters=[{"name": "@sessionId", "value": sessionId}], partition_key=sessionId)),
+        args.repeat)
+
+    report(
+        "latest chat history message", chat_history_container,
+        lambda: list(chat_history_container.query_items(
+            query=f"SELECT * FROM c WHERE c.sessionId = '{sessionId}' ORDER BY c._ts DESC OFFSET 0 LIMIT 1",
+            enable_cross_partition_query=True)),
+        lambda: list(chat_history_container.query_items(
+            query="SELECT TOP 1 * FROM c WHERE c.sessionId = @sessionId ORDER BY c._ts DESC",
+            parameters=[{"name": "@sessionId", "value": sessionId}], partition_key=sessionId)),
+        args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app import banking_agents, banking_agents_api
+from src.app.services import context_window
+
+# Runs whole turns through the real graph and API functions with a scripted chat model, an in-memory checkpointer
+# and the session, debug log and chat history stores replaced by recorders.
+
+
+class ScriptedChatModel(FakeMessagesListChatModel):
+    """Answers with the scripted messages in order, whatever the tools it is bound to."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class TurnRecorder:
+    def __init__(self):
+        self.active_agents = {}
+        self.chat_history = []
+        self.debug_logs = []
+
+    async def fetch_active_agent_async(self, tenantId, userId, sessionId):
+        return self.active_agents.get(sessionId, "unknown")
+
+    async def patch_active_agent_async(self, tenantId, userId, sessionId, activeAgent):
+        self.active_agents[sessionId] = activeAgent
+
+    async def store_debug_log(self, sessionId, tenantId, userId, response_data, extra_properties=None):
+        self.debug_logs.append(response_data)
+        return f"debug-log-{len(self.debug_logs)}"
+
+    async def process_messages(self, messages, userId, tenantId, sessionId):
+        self.chat_history.append(messages)
+
+
+def install_fake_turn_dependencies(monkeypatch, responses, checkpointer=None):
+    """
+    Returns the recorder and a graph answering with responses, compiled with the given checkpointer or an
+    in-memory one.
+    """
+    recorder = TurnRecorder()
+    model = ScriptedChatModel(responses=responses)
+    monkeypatch.setattr(banking_agents, "get_chat_model", lambda: model)
+    monkeypatch.setattr(banking_agents, "fetch_active_agent_async", recorder.fetch_active_agent_async)
+    monkeypatch.setattr(banking_agents_api, "fetch_active_agent_async", recorder.fetch_active_agent_async)
+    monkeypatch.setattr(banking_agents_api, "patch_active_agent_async", recorder.patch_active_agent_async)
+    monkeypatch.setattr(banking_agents_api, "store_debug_log", recorder.store_debug_log)
+    monkeypatch.setattr(banking_agents_api, "process_messages", recorder.process_messages)
+    monkeypatch.setattr(banking_agents_api, "is_cacheable_prompt", lambda prompt: False)
+    # The tokenizer files cannot be downloaded in tests; count words instead
+    monkeypatch.setattr(context_window, "count_text_tokens", lambda text: len(text.split()))
+    banking_agents.get_agent.cache_clear()
+    return recorder, banking_agents.builder.compile(checkpointer=checkpointer or MemorySaver())
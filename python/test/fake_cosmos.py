@@ -0,0 +1,252 @@
+import copy
+import json
+import re
+import uuid
+
+from azure.cosmos.exceptions import CosmosBatchOperationError, CosmosHttpResponseError, \
+    CosmosResourceExistsError, CosmosResourceNotFoundError, CosmosAccessConditionFailedError
+
+# In-memory stand-in for a Cosmos DB container, used by the tests. It implements the item, patch and transactional
+# batch operations the services use, with ETags, and the small subset of the query language they need:
+# SELECT *, SELECT VALUE c.<field> or SELECT c.<field>, c.<field>..., with WHERE conditions joined by AND that
+# compare a field to a literal or a parameter, or test ARRAY_CONTAINS(@param, c.<field>) or
+# STARTSWITH(c.<field>, @param).
+
+CONDITION = re.compile(r"^c\.(\w+)\s*(=|!=|<=|>=|<|>)\s*(@\w+|'[^']*'|-?\d+(?:\.\d+)?|true|false)$")
+ARRAY_CONTAINS = re.compile(r"^ARRAY_CONTAINS\((@\w+),\s*c\.(\w+)\)$")
+STARTSWITH = re.compile(r"^STARTSWITH\(c\.(\w+),\s*(@\w+|'[^']*')\)$")
+COMPARISONS = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    ">": lambda a, b: a is not None and a > b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">=": lambda a, b: a is not None and a >= b,
+}
+
+
+def parse_literal(token, parameters):
+    if token.startswith("@"):
+        return parameters[token]
+    if token.startswith("'"):
+        return token[1:-1]
+    if token in ("true", "false"):
+        return token == "true"
+    return float(token) if "." in token else int(token)
+
+
+def compile_filter(where, parameters):
+    """Returns a predicate over documents for a WHERE clause of conditions joined by AND."""
+    predicates = []
+    for condition in re.split(r"\s+AND\s+", where.strip(), flags=re.IGNORECASE) if where else []:
+        condition = condition.strip()
+        match = ARRAY_CONTAINS.match(condition)
+        if match:
+            values, field = parameters[match.group(1)], match.group(2)
+            predicates.append(lambda document, values=values, field=field: document.get(field) in values)
+            continue
+        match = STARTSWITH.match(condition)
+        if match:
+            field, prefix = match.group(1), parse_literal(match.group(2), parameters)
+            predicates.append(lambda document, field=field, prefix=prefix:
+                              isinstance(document.get(field), str) and document[field].startswith(prefix))
+            continue
+        match = CONDITION.match(condition)
+        if not match:
+            raise NotImplementedError(f"Unsupported query condition: {condition}")
+        field, operator, token = match.groups()
+        value = parse_literal(token, parameters)
+        predicates.append(lambda document, field=field, operator=operator, value=value:
+                          COMPARISONS[operator](document.get(field), value))
+    return lambda document: all(predicate(document) for predicate in predicates)
+
+
+class FakeContainer:
+    def __init__(self, partition_key_paths=("/partition_key",)):
+        self.fields = [path.lstrip("/") for path in partition_key_paths]
+        self.items = {}
+        self.requests = 0
+        self.cross_partition_queries = 0
+
+    def partition_of(self, document):
+        values = [document.get(field) for field in self.fields]
+        return json.dumps(values[0] if len(values) == 1 else values)
+
+    @staticmethod
+    def key_of(partition_key):
+        return json.dumps(partition_key)
+
+    def stored(self, document):
+        document = copy.deepcopy(document)
+        document["_etag"] = str(uuid.uuid4())
+        return document
+
+    # Item operations
+
+    def read_item(self, item, partition_key, **kwargs):
+        self.requests += 1
+        document = self.items.get((self.key_of(partition_key), item))
+        if document is None:
+            raise CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+        return copy.deepcopy(document)
+
+    def create_item(self, body, **kwargs):
+        self.requests += 1
+        key = (self.partition_of(body), body["id"])
+        if key in self.items:
+            raise CosmosResourceExistsError(status_code=409, message=f"{body['id']} already exists")
+        self.items[key] = self.stored(body)
+        return copy.deepcopy(self.items[key])
+
+    def upsert_item(self, body, **kwargs):
+        self.requests += 1
+        key = (self.partition_of(body), body["id"])
+        self.items[key] = self.stored(body)
+        return copy.deepcopy(self.items[key])
+
+    def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        self.requests += 1
+        key = (self.partition_of(body), item)
+        if key not in self.items:
+            raise CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+        if etag is not None and self.items[key]["_etag"] != etag:
+            raise CosmosAccessConditionFailedError(status_code=412, message="ETag mismatch")
+        self.items[key] = self.stored(body)
+        return copy.deepcopy(self.items[key])
+
+    def delete_item(self, item, partition_key, **kwargs):
+        self.requests += 1
+        if self.items.pop((self.key_of(partition_key), item), None) is None:
+            raise CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+
+    def patch_item(self, item, partition_key, patch_operations, filter_predicate=None, etag=None, **kwargs):
+        self.requests += 1
+        return self.apply_patch(self.items, item, partition_key, patch_operations, filter_predicate, etag)
+
+    def apply_patch(self, items, item, partition_key, patch_operations, filter_predicate=None, etag=None):
+        key = (self.key_of(partition_key), item)
+        document = items.get(key)
+        if document is None:
+            raise CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+        if etag is not None and document["_etag"] != etag:
+            raise CosmosAccessConditionFailedError(status_code=412, message="ETag mismatch")
+        if filter_predicate:
+            where = re.sub(r"^FROM c WHERE ", "", filter_predicate.strip(), flags=re.IGNORECASE)
+            if not compile_filter(where, {})(document):
+                raise CosmosAccessConditionFailedError(status_code=412, message="Filter predicate not met")
+        document = copy.deepcopy(document)
+        for operation in patch_operations:
+            path = operation["path"].strip("/").split("/")
+            target = document
+            for part in path[:-1]:
+                target = target[part]
+            name = path[-1]
+            if operation["op"] in ("set", "replace"):
+                target[name] = operation["value"]
+            elif operation["op"] == "add":
+                if name == "-":
+                    target.append(operation["value"])
+                else:
+                    target[name] = operation["value"]
+            elif operation["op"] == "incr":
+                target[name] = target.get(name, 0) + operation["value"]
+            elif operation["op"] == "remove":
+                target.pop(name, None)
+            else:
+                raise NotImplementedError(f"Unsupported patch operation: {operation['op']}")
+        items[key] = self.stored(document)
+        return copy.deepcopy(items[key])
+
+    def execute_item_batch(self, batch_operations, partition_key, **kwargs):
+        """Applies the operations atomically: all of them, or none with the index of the one that failed."""
+        self.requests += 1
+        items = dict(self.items)
+        results = []
+        partition = self.key_of(partition_key)
+        for index, operation in enumerate(batch_operations):
+            name, args = operation[0], operation[1]
+            options = operation[2] if len(operation) > 2 else {}
+            try:
+                if name in ("create", "upsert"):
+                    body = args[0]
+                    key = (partition, body["id"])
+                    if name == "create" and key in items:
+                        raise CosmosResourceExistsError(status_code=409, message=f"{body['id']} already exists")
+                    items[key] = self.stored(body)
+                    results.append(copy.deepcopy(items[key]))
+                elif name == "patch":
+                    results.append(self.apply_patch(items, args[0], partition_key, args[1],
+                                                    options.get("filter_predicate"), options.get("if_match_etag")))
+                elif name == "delete":
+                    if items.pop((partition, args[0]), None) is None:
+                        raise CosmosResourceNotFoundError(status_code=404, message=f"{args[0]} not found")
+                    results.append({})
+                else:
+                    raise NotImplementedError(f"Unsupported batch operation: {name}")
+            except CosmosHttpResponseError as e:
+                raise CosmosBatchOperationError(error_index=index, headers={}, status_code=e.status_code,
+                                                message=e.message, operation_responses=[])
+        self.items = items
+        return results
+
+    # Queries
+
+    def query_items(self, query, parameters=None, partition_key=None, **kwargs):
+        self.requests += 1
+        if partition_key is None:
+            self.cross_partition_queries += 1
+        parameters = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+        match = re.match(r"^\s*SELECT\s+(VALUE\s+c\.(\w+)|\*|c\.\w+(?:\s*,\s*c\.\w+)*)\s+FROM\s+c"
+                         r"(?:\s+WHERE\s+(.*?))?\s*$", query, flags=re.IGNORECASE | re.DOTALL)
+        if not match:
+            raise NotImplementedError(f"Unsupported query: {query}")
+        projection, value_field, where = match.group(1), match.group(2), match.group(3)
+        fields = re.findall(r"c\.(\w+)", projection) if not value_field and projection != "*" else None
+        predicate = compile_filter(where, parameters)
+        results = []
+        for (partition, _), document in self.items.items():
+            if partition_key is not None and partition != self.key_of(partition_key):
+                continue
+            if not predicate(document):
+                continue
+            if value_field:
+                results.append(document.get(value_field))
+            elif fields:
+                results.append({field: copy.deepcopy(document[field]) for field in fields if field in document})
+            else:
+                results.append(copy.deepcopy(document))
+        return iter(results)
+
+    def documents(self, **fields):
+        return [copy.deepcopy(document) for document in self.items.values()
+                if all(document.get(name) == value for name, value in fields.items())]
+
+
+class FakeCosmosClient:
+    """Serves one fake container for whatever database and container a client asks for."""
+
+    def __init__(self, container):
+        self.container = container
+
+    def get_database_client(self, database_name):
+        return self
+
+    def create_database_if_not_exists(self, database_name):
+        return self
+
+    def get_container_client(self, container_name):
+        return self.container
+
+    def create_container_if_not_exists(self, id, partition_key, **kwargs):
+        return self.container
+
+
+def make_cosmos_saver(monkeypatch, container, serde=None):
+    """An AsyncCosmosDBSaver whose client is the fake container, created the way the app creates it."""
+    from langgraph_checkpoint_cosmosdb import cosmosdbSaver
+    from src.app.services.checkpointer import AsyncCosmosDBSaver
+
+    monkeypatch.setenv("COSMOSDB_ENDPOINT", "https://localhost:8081")
+    monkeypatch.setenv("COSMOSDB_KEY", "test-key")
+    monkeypatch.setattr(cosmosdbSaver, "CosmosClient", lambda *args, **kwargs: FakeCosmosClient(container))
+    return AsyncCosmosDBSaver(database_name="MultiAgentBanking", container_name="Checkpoints", serde=serde)
@@ -0,0 +1,106 @@
+import argparse
+import os
+import time
+
+from src.app.services.fast_router import classify_message, get_router_centroids, FAST_ROUTER_MIN_SIMILARITY, \
+    FAST_ROUTER_MIN_MARGIN
+from src.app.services.azure_open_ai import get_chat_model
+
+# Run from the python directory: python -m test.fast_router_benchmark [--min-similarity 0.5 --min-margin 0.05]
+# [--compare-llm]
+# Labelled messages, distinct from the router exemplars.
+LABELLED_MESSAGES = [
+    ("Is there a branch near Redmond?", "customer_support_agent"),
+    ("I'd like to speak to someone about a problem", "customer_support_agent"),
+    ("My debit card isn't working at the ATM", "customer_support_agent"),
+    ("What time does the downtown branch close?", "customer_support_agent"),
+    ("I was charged twice and want to file a complaint", "customer_support_agent"),
+    ("Can you help me reset my online banking password?", "customer_support_agent"),
+    ("I lost my card yesterday", "customer_support_agent"),
+    ("Please have an advisor call me", "customer_support_agent"),
+    ("I'm interested in opening an account for my daughter", "sales_agent"),
+    ("What savings products do you have?", "sales_agent"),
+    ("Could I borrow 10000 for a car?", "sales_agent"),
+    ("What are the rates on your mortgage offers?", "sales_agent"),
+    ("Do you have a premium checking account?", "sales_agent"),
+    ("I want to apply for a loan", "sales_agent"),
+    ("What would I pay each month on a 3 year loan of 15000?", "sales_agent"),
+    ("Are there any promotions for new customers?", "sales_agent"),
+    ("How much is in my checking account?", "transactions_agent"),
+    ("Send 200 to account Acc002", "transactions_agent"),
+    ("What did I spend in January?", "transactions_agent"),
+    ("Can you show my recent transactions?", "transactions_agent"),
+    ("Move 1000 from Acc001 to Acc003", "transactions_agent"),
+    ("What's the balance on Acc004?", "transactions_agent"),
+    ("I want to deposit my paycheck", "transactions_agent"),
+    ("List the transfers I made last week", "transactions_agent"),
+]
+
+AGENTS = sorted({label for _, label in LABELLED_MESSAGES})
+
+PROMPT_FILE = os.path.join(os.path.dirname(__file__), "..", "src", "app", "prompts", "coordinator_agent.prompty")
+
+
+def is_routed(ranked, min_similarity, min_margin):
+    return ranked[0][1] >= min_similarity and ranked[0][1] - ranked[1][1] >= min_margin
+
+
+def print_agent_precision_recall(results, min_similarity, min_margin):
+    """
+    Precision: share of the messages routed to an agent that belong to it. Recall: share of the messages of an
+    agent that were routed to it; messages left to the coordinator LLM count as not recalled.
+    """
+    print(f"Per agent at min similarity {min_similarity:.2f} / min margin {min_margin:.2f}: "
+          f"routed, precision, recall")
+    for agent in AGENTS:
+        routed = [label for label, ranked, _ in results
+                  if is_routed(ranked, min_similarity, min_margin) and ranked[0][0] == agent]
+        labelled = sum(label == agent for label, _, _ in results)
+        correct = routed.count(agent)
+        precision = f"{correct / len(routed):.0%}" if routed else "n/a"
+        print(f"  {agent:24s} {len(routed):3d}  {precision:>4s}  {correct / labelled:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure routing accuracy, coverage and latency of the fast router.")
+    parser.add_argument("--min-similarity", type=float, default=FAST_ROUTER_MIN_SIMILARITY)
+    parser.add_argument("--min-margin", type=float, default=FAST_ROUTER_MIN_MARGIN)
+    parser.add_argument("--compare-llm", action="store_true",
+                        help="Also time one coordinator-style LLM call per message for the latency saved")
+    args = parser.parse_args()
+
+    get_router_centroids()  # exemplar embeddings are computed once per process, outside the timings
+
+    results = []
+    for text, label in LABELLED_MESSAGES:
+        start = time.perf_counter()
+        _, scores = classify_message(text, min_similarity=-1, min_margin=0)
+        results.append((label, sorted(scores.items(), key=lambda item: item[1], reverse=True),
+                        time.perf_counter() - start))
+    route_ms = sum(elapsed for _, _, elapsed in results) / len(results) * 1000
+
+    print(f"Nearest centroid accuracy without thresholds: "
+          f"{sum(ranked[0][0] == label for label, ranked, _ in results) / len(results):.0%}, "
+          f"{route_ms:.0f} ms per message")
+    print("min similarity / min margin: coverage (routed without LLM), accuracy of routed messages")
+    for min_similarity in (0.3, 0.4, 0.5, 0.6):
+        for min_margin in (0.0, 0.02, 0.05, 0.1):
+            routed = [(label, ranked) for label, ranked, _ in results
+                      if is_routed(ranked, min_similarity, min_margin)]
+            correct = sum(ranked[0][0] == label for label, ranked in routed)
+            accuracy = f"{correct / len(routed):.0%}" if routed else "n/a"
+            print(f"  {min_similarity:.2f} / {min_margin:.2f}: {len(routed) / len(results):.0%}, {accuracy}")
+    print_agent_precision_recall(results, args.min_similarity, args.min_margin)
+
+    if args.compare_llm:
+        with open(PROMPT_FILE, encoding="utf-8") as prompt_file:
+            prompt = prompt_file.read()
+        start = time.perf_counter()
+        for text, _ in LABELLED_MESSAGES:
+            get_chat_model().invoke([("system", prompt), ("user", text)])
+        llm_ms = (time.perf_counter() - start) / len(LABELLED_MESSAGES) * 1000
+        print(f"Coordinator LLM call: {llm_ms:.0f} ms per message, saved per routed message: {llm_ms - route_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
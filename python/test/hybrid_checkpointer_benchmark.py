@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+from src.app.banking_agents import builder, get_checkpointer
+from src.app.services.hybrid_checkpointer import HybridCheckpointSaver, hybrid_checkpoint_metrics
+
+# Run from the python directory: python -m test.hybrid_checkpointer_benchmark [--turns 6]
+# Runs the same scripted conversation once per durability mode and reports the turn latency and the
+# checkpoint flushes written to Cosmos DB.
+PROMPTS = [
+    "I want to check my account balance",
+    "Acc001",
+    "Show me my transactions for February 2025",
+    "What is the balance of Acc001 now?",
+]
+
+
+async def run_conversation(durability, turns):
+    checkpointer = HybridCheckpointSaver(get_checkpointer().durable, durability=durability)
+    workflow = builder.compile(checkpointer=checkpointer)
+    config = {"configurable": {"thread_id": f"hybrid-checkpointer-{durability}-{uuid.uuid4()}",
+                               "checkpoint_ns": "", "userId": "Mark", "tenantId": "Contoso"}}
+
+    latencies = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        await workflow.ainvoke({"messages": [HumanMessage(content=PROMPTS[turn % len(PROMPTS)])]}, config)
+        latencies.append((time.perf_counter() - start) * 1000)
+    await checkpointer.drain()
+    return latencies
+
+
+async def run(turns):
+    print("mode          mean turn (ms)  flushes")
+    for durability in ("sync", "on-interrupt", "async"):
+        flushes = hybrid_checkpoint_metrics["flushes"]
+        latencies = await run_conversation(durability, turns)
+        print(f"{durability:12s}  {sum(latencies) / len(latencies):14.0f}  "
+              f"{hybrid_checkpoint_metrics['flushes'] - flushes:7d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare turn latency of the checkpoint durability modes.")
+    parser.add_argument("--turns", type=int, default=6)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns))
+
+
+if __name__ == "__main__":
+    main()
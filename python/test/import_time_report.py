@@ -0,0 +1,54 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Run from the python directory: python -m test.import_time_report [--module src.app.banking_agents_api]
+# [--repeat 5] [--top 10]
+# Imports the module in fresh interpreters with python -X importtime and reports the fastest total import time
+# and the modules it imports directly that cost the most, cumulative of what they import in turn.
+PYTHON_DIR = os.path.join(os.path.dirname(__file__), "..")
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_imports(module):
+    """Returns the cumulative import time in microseconds of the module and of each module it imports directly."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=PYTHON_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    direct = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) - 1, match.group(4)
+        if depth == 0 and name == module:
+            total = cumulative
+        elif depth == 2:
+            direct[name] = cumulative
+    return total, direct
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the import time of a module and its costliest imports.")
+    parser.add_argument("--module", default="src.app.banking_agents_api")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    # The first import compiles the sources to bytecode; only the runs after it are timed
+    measure_imports(args.module)
+    total, direct = min((measure_imports(args.module) for _ in range(args.repeat)), key=lambda run: run[0])
+
+    print(f"import {args.module}: {total / 1000:.0f} ms (fastest of {args.repeat})")
+    print("cumulative (ms)  imported directly")
+    for name, cumulative in sorted(direct.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:15.0f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
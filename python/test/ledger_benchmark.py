@@ -0,0 +1,79 @@
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.app.services.azure_cosmos_db import get_account_container, create_account_record, fetch_account_by_number
+from src.app.services.ledger import transfer_funds, ledger_metrics
+
+# Run from the python directory: python -m test.ledger_benchmark
+# Transfers run between a few hot accounts of a dedicated tenant, which is cleared before each run.
+TENANT_ID = "LedgerBenchmark"
+USER_ID = "benchmark"
+INITIAL_BALANCE = 1_000_000
+
+
+def reset_accounts(account_count):
+    container = get_account_container()
+    account_ids = [f"Bench{index:03d}" for index in range(account_count)]
+    for account_id in account_ids:
+        partition_key = [TENANT_ID, account_id]
+        for item in list(container.query_items(query="SELECT c.id FROM c", partition_key=partition_key)):
+            container.delete_item(item["id"], partition_key=partition_key)
+        create_account_record({
+            "id": account_id,
+            "accountId": account_id,
+            "tenantId": TENANT_ID,
+            "userId": USER_ID,
+            "type": "BankAccount",
+            "accountName": "Ledger benchmark",
+            "balance": INITIAL_BALANCE
+        })
+    return account_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent transfers between hot accounts and audit the books.")
+    parser.add_argument("--transfers", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--accounts", type=int, default=2, help="Fewer accounts means more contention")
+    args = parser.parse_args()
+
+    account_ids = reset_accounts(args.accounts)
+    rng = random.Random(0)
+    plan = []
+    for _ in range(args.transfers):
+        source, destination = rng.sample(account_ids, 2)
+        plan.append((source, destination, rng.randint(1, 100)))
+
+    expected = {account_id: INITIAL_BALANCE for account_id in account_ids}
+    for source, destination, amount in plan:
+        expected[source] -= amount
+        expected[destination] += amount
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        statuses = list(executor.map(lambda step: transfer_funds(TENANT_ID, USER_ID, *step), plan))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.transfers} transfers across {args.accounts} accounts in {elapsed:.2f}s "
+          f"({args.transfers / elapsed:.1f}/s), {ledger_metrics['conflicts']} ETag conflicts retried, "
+          f"{statuses.count('pending')} left pending")
+
+    mismatches = 0
+    for account_id in account_ids:
+        actual = fetch_account_by_number(account_id, TENANT_ID, USER_ID)["balance"]
+        transactions = list(get_account_container().query_items(
+            query="SELECT VALUE SUM(c.creditAmount - c.debitAmount) FROM c WHERE c.type = 'BankTransaction'",
+            partition_key=[TENANT_ID, account_id]))
+        ledger_total = INITIAL_BALANCE + (transactions[0] or 0)
+        status = "ok" if actual == expected[account_id] == ledger_total else "MISMATCH"
+        mismatches += status != "ok"
+        print(f"{account_id}: balance {actual}, expected {expected[account_id]}, ledger {ledger_total} {status}")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
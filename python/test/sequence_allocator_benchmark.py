@@ -0,0 +1,35 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.app.services.sequence_allocator import SequenceAllocator
+
+# Run from the python directory: python -m test.sequence_allocator_benchmark
+# Uses a dedicated sequence so the account number sequence is not advanced.
+SEQUENCE_NAME = "benchmarkAccountNumber"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open accounts in parallel and check the numbers never collide.")
+    parser.add_argument("--openings", type=int, default=100, help="Account numbers to allocate in parallel")
+    parser.add_argument("--workers", type=int, default=4, help="Allocators, each standing in for one API worker")
+    parser.add_argument("--block-size", type=int, default=5, help="Numbers reserved per counter update")
+    args = parser.parse_args()
+
+    allocators = [SequenceAllocator(SEQUENCE_NAME, args.block_size) for _ in range(args.workers)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.openings) as executor:
+        numbers = list(executor.map(lambda i: allocators[i % args.workers].next(), range(args.openings)))
+    elapsed = time.perf_counter() - start
+
+    collisions = len(numbers) - len(set(numbers))
+    print(f"Allocated {len(numbers)} numbers with {args.workers} workers in {elapsed:.2f}s "
+          f"({len(numbers) / elapsed:.0f}/s), range {min(numbers)}-{max(numbers)}")
+    print(f"Collisions: {collisions}")
+    if collisions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
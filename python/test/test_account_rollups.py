@@ -0,0 +1,90 @@
+import pytest
+
+from src.app.services import account_rollups
+from test.account_rollups_replay import DEFAULT_DATA_FILE, compare, expected_totals
+from test.fake_cosmos import FakeContainer
+
+ACCOUNT_PARTITION_KEY_PATHS = ("/tenantId", "/accountId")
+
+
+class FakeFeedContainer(FakeContainer):
+    """Serves the whole container as the change feed, and the number of items as its position."""
+
+    def __init__(self, partition_key_paths):
+        super().__init__(partition_key_paths)
+        self.client_connection = self
+        self.last_response_headers = {}
+
+    def query_items_change_feed(self, is_start_from_beginning=False, continuation=None, **kwargs):
+        start = 0 if continuation is None else int(continuation)
+        documents = list(self.items.values())
+        self.last_response_headers = {"etag": str(len(documents))}
+        return iter(documents[start:])
+
+
+@pytest.fixture
+def containers(monkeypatch):
+    accounts = FakeFeedContainer(ACCOUNT_PARTITION_KEY_PATHS)
+    rollups = FakeContainer(ACCOUNT_PARTITION_KEY_PATHS)
+    monkeypatch.setattr(account_rollups, "get_account_container", lambda: accounts)
+    monkeypatch.setattr(account_rollups, "get_account_rollup_container", lambda: rollups)
+    return accounts, rollups
+
+
+def add_transaction(container, number, month, debit, credit, balance):
+    container.create_item({"id": f"Acc001-{number}", "tenantId": "Contoso", "accountId": "Acc001",
+                           "type": "BankTransaction", "debitAmount": debit, "creditAmount": credit,
+                           "accountBalance": balance, "transactionDateTime": f"{month}-0{number}T10:00:00Z"})
+
+
+def test_replayed_rollups_match_totals_recomputed_from_the_transactions():
+    rollups = account_rollups.replay_rollups_from_file(DEFAULT_DATA_FILE)
+
+    assert rollups
+    assert compare(rollups, expected_totals(DEFAULT_DATA_FILE), "replay") == []
+
+
+def test_feed_writes_rollups_outside_the_accounts_container_and_only_moves_on_new_changes(containers):
+    accounts, rollups = containers
+    add_transaction(accounts, 1, "2025-02", 100, 0, 900)
+    add_transaction(accounts, 2, "2025-02", 0, 50, 950)
+
+    account_rollups.process_rollup_feed()
+    summary = account_rollups.summarize_rollups(
+        account_rollups.fetch_monthly_rollups("Contoso", "Acc001", "2025-01", "2025-03"))
+    accounts_requests = accounts.requests
+    account_rollups.process_rollup_feed()
+
+    assert summary["debitTotal"] == 100
+    assert summary["creditTotal"] == 50
+    assert summary["closingBalance"] == 950
+    assert accounts.documents(type="MonthlyRollup") == []
+    assert accounts.documents(type="ChangeFeedState") == []
+    # The second run found no changes, so no month was rebuilt from the accounts container
+    assert accounts.requests == accounts_requests
+    [state] = rollups.documents(type="ChangeFeedState")
+    assert state["continuation"] == "2"
+
+
+def test_only_the_lease_owner_reads_the_feed(monkeypatch, containers):
+    accounts, rollups = containers
+    add_transaction(accounts, 1, "2025-02", 100, 0, 900)
+    account_rollups.process_rollup_feed()
+
+    monkeypatch.setattr(account_rollups, "WORKER_ID", "other-worker")
+    add_transaction(accounts, 2, "2025-02", 0, 50, 950)
+    account_rollups.process_rollup_feed()
+    assert rollups.documents(type="MonthlyRollup")[0]["transactionCount"] == 1
+
+    # Once the lease expires, the other worker takes over from the stored position
+    [state] = rollups.documents(type="ChangeFeedState")
+    rollups.upsert_item({**state, "leaseExpiresAt": 0})
+    account_rollups.process_rollup_feed()
+    assert rollups.documents(type="MonthlyRollup")[0]["transactionCount"] == 2
+    assert rollups.documents(type="ChangeFeedState")[0]["owner"] == "other-worker"
+
+
+def test_summaries_longer_than_the_limit_are_rejected():
+    assert len(account_rollups.months_between("2023-01", "2024-12")) == account_rollups.MAX_SUMMARY_MONTHS
+    with pytest.raises(ValueError):
+        account_rollups.months_between("2023-01", "2025-01")
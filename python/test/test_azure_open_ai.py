@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import time
+
+from azure.core.credentials import AccessToken
+
+from src.app.services.azure_open_ai import RefreshingTokenProvider
+
+
+class FakeCredential:
+    def __init__(self):
+        self.calling_threads = []
+
+    def get_token(self, scope):
+        self.calling_threads.append(threading.current_thread())
+        return AccessToken(f"token-{len(self.calling_threads)}", int(time.time()) + 3600)
+
+
+def test_async_token_provider_fetches_off_the_event_loop_and_then_serves_the_cached_token():
+    credential = FakeCredential()
+    provider = RefreshingTokenProvider(credential, "scope", refresh_margin_seconds=300)
+
+    async def run():
+        first = await provider.get_token_async()
+        second = await provider.get_token_async()
+        return first, second, threading.current_thread()
+
+    try:
+        first, second, loop_thread = asyncio.run(run())
+    finally:
+        provider.timer.cancel()
+
+    assert first == second == "token-1"
+    assert len(credential.calling_threads) == 1
+    assert credential.calling_threads[0] is not loop_thread
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from fastapi import BackgroundTasks
+from langchain_core.messages import AIMessage
+
+from src.app import banking_agents, banking_agents_api
+from test.fake_agents import install_fake_turn_dependencies
+
+TENANT_ID = "Contoso"
+USER_ID = "Mark"
+SESSION_ID = "session-1"
+CONFIG = {"configurable": {"thread_id": SESSION_ID, "checkpoint_ns": ""}}
+
+RESPONSES = [
+    # The coordinator hands the first question over to the sales agent, which answers it
+    AIMessage(content="", tool_calls=[{"name": "transfer_to_sales_agent", "args": {}, "id": "call-1"}]),
+    AIMessage(content="We offer a savings account with 3% interest."),
+    # The follow-up goes straight to the sales agent, the active agent of the session
+    AIMessage(content="You can open it online in five minutes."),
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_agents():
+    yield
+    banking_agents.get_agent.cache_clear()
+
+
+async def complete(workflow, request_body):
+    return await banking_agents_api.get_chat_completion(TENANT_ID, USER_ID, SESSION_ID, BackgroundTasks(),
+                                                        request_body, workflow)
+
+
+def test_completion_returns_and_stores_the_user_message_and_the_reply_of_each_turn(monkeypatch):
+    recorder, workflow = install_fake_turn_dependencies(monkeypatch, RESPONSES)
+
+    async def run():
+        first = await complete(workflow, "What savings accounts do you offer?")
+        second = await complete(workflow, "How do I open one?")
+        return first, second, await workflow.aget_state(CONFIG)
+
+    first, second, state = asyncio.run(run())
+
+    assert [(message.sender, message.senderRole, message.text) for message in first] == [
+        ("User", "User", "What savings accounts do you offer?"),
+        ("Sales", "Assistant", "We offer a savings account with 3% interest."),
+    ]
+    assert [(message.sender, message.text) for message in second] == [
+        ("User", "How do I open one?"),
+        ("Sales", "You can open it online in five minutes."),
+    ]
+    assert recorder.active_agents[SESSION_ID] == "sales_agent"
+    assert recorder.chat_history == [first, second]
+    assert [message.content for message in state.values["messages"] if message.type in ("human", "ai")
+            and message.content] == [
+        "What savings accounts do you offer?",
+        "We offer a savings account with 3% interest.",
+        "How do I open one?",
+        "You can open it online in five minutes.",
+    ]
+
+
+def test_turn_without_a_reply_keeps_the_user_message(monkeypatch):
+    recorder, _ = install_fake_turn_dependencies(monkeypatch, RESPONSES)
+
+    messages = asyncio.run(banking_agents_api.complete_turn(TENANT_ID, USER_ID, SESSION_ID, "coordinator_agent", [],
+                                                            "Hello there"))
+
+    assert [(message.sender, message.text) for message in messages] == [("User", "Hello there")]
+    assert recorder.chat_history == [messages]
+
+
+def test_streamed_turn_is_stored_when_the_client_disconnects(monkeypatch):
+    recorder, workflow = install_fake_turn_dependencies(monkeypatch, RESPONSES)
+    config = {"configurable": {**CONFIG["configurable"], "userId": USER_ID, "tenantId": TENANT_ID}}
+
+    async def run():
+        graph_input, last_active_agent = await banking_agents_api.prepare_graph_input(
+            TENANT_ID, USER_ID, SESSION_ID, "What savings accounts do you offer?")
+        events = banking_agents_api.stream_completion_events(workflow, graph_input, config, TENANT_ID, USER_ID,
+                                                             SESSION_ID, last_active_agent)
+        first_event = await anext(events)
+        # The client goes away after the first event
+        await events.aclose()
+        await asyncio.gather(*banking_agents_api.streamed_turns)
+        return first_event
+
+    first_event = asyncio.run(run())
+
+    assert first_event.startswith("event: ")
+    [stored] = recorder.chat_history
+    assert [(message.sender, message.text) for message in stored] == [
+        ("User", "What savings accounts do you offer?"),
+        ("Sales", "We offer a savings account with 3% interest."),
+    ]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from src.app.services import chat_history_writer
+
+
+class AsyncChatHistoryContainer:
+    def __init__(self, fail_batches=False, delay_seconds=0):
+        self.fail_batches = fail_batches
+        self.delay_seconds = delay_seconds
+        self.batches = []
+        self.upserted = []
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        await asyncio.sleep(self.delay_seconds)
+        if self.fail_batches:
+            raise RuntimeError("Batch rejected")
+        self.batches.append((partition_key, [item["id"] for _, (item,) in batch_operations]))
+
+    async def upsert_item(self, item):
+        self.upserted.append(item["id"])
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics(monkeypatch):
+    monkeypatch.setattr(chat_history_writer, "chat_history_metrics", {"queued": 0, "written": 0, "dropped": 0})
+
+
+def turn(sessionId, number):
+    return [{"id": f"{sessionId}-{number}-{sender}", "sessionId": sessionId} for sender in ("user", "agent")]
+
+
+async def write_turns(turns, timeout_seconds=chat_history_writer.CHAT_HISTORY_FLUSH_TIMEOUT_SECONDS):
+    chat_history_writer.start_chat_history_writer()
+    for sessionId, items in turns:
+        await chat_history_writer.enqueue_chat_history(sessionId, items)
+    await asyncio.wait_for(chat_history_writer.stop_chat_history_writer(timeout_seconds=timeout_seconds), 5)
+
+
+def test_turns_of_a_session_queued_together_are_written_in_one_batch(monkeypatch):
+    container = AsyncChatHistoryContainer()
+    monkeypatch.setattr(chat_history_writer, "get_async_chat_history_container", lambda: container)
+
+    asyncio.run(write_turns([("session-1", turn("session-1", 1)), ("session-2", turn("session-2", 1)),
+                             ("session-1", turn("session-1", 2))]))
+
+    assert container.batches == [
+        ("session-1", ["session-1-1-user", "session-1-1-agent", "session-1-2-user", "session-1-2-agent"]),
+        ("session-2", ["session-2-1-user", "session-2-1-agent"]),
+    ]
+    assert chat_history_writer.chat_history_metrics["written"] == 6
+
+
+def test_messages_of_a_failed_batch_are_written_one_by_one(monkeypatch):
+    container = AsyncChatHistoryContainer(fail_batches=True)
+    monkeypatch.setattr(chat_history_writer, "get_async_chat_history_container", lambda: container)
+
+    asyncio.run(write_turns([("session-1", turn("session-1", 1))]))
+
+    assert container.batches == []
+    assert container.upserted == ["session-1-1-user", "session-1-1-agent"]
+
+
+def test_stop_gives_up_flushing_after_the_timeout(monkeypatch):
+    container = AsyncChatHistoryContainer(delay_seconds=60)
+    monkeypatch.setattr(chat_history_writer, "get_async_chat_history_container", lambda: container)
+
+    asyncio.run(write_turns([("session-1", turn("session-1", 1))], timeout_seconds=0.1))
+
+    assert container.batches == []
+    assert chat_history_writer.chat_history_metrics["dropped"] == 2
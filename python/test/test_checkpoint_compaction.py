@@ -0,0 +1,79 @@
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from src.app.services.checkpoint_compaction import compact_thread, delete_thread_records
+from src.app.services.checkpointer import checkpoint_namespaces
+from test.fake_cosmos import FakeContainer, make_cosmos_saver
+
+THREAD_ID = "thread-1"
+# A subgraph run of the task with pending writes at the root head, which put_checkpoints names after its step
+SUBGRAPH_NS = "sales_agent:task-14"
+
+
+def put_checkpoints(saver, checkpoint_ns, count):
+    config = {"configurable": {"thread_id": THREAD_ID, "checkpoint_ns": checkpoint_ns}}
+    for step in range(count):
+        checkpoint = create_checkpoint(empty_checkpoint(), None, step)
+        config = saver.put(config, checkpoint, {"source": "loop", "step": step}, {})
+        saver.put_writes(config, [("messages", f"write {step}")], task_id=f"task-{step}")
+    return config
+
+
+def test_compaction_keeps_newest_checkpoints_of_every_namespace_with_their_writes(monkeypatch):
+    container = FakeContainer()
+    saver = make_cosmos_saver(monkeypatch, container)
+    head = put_checkpoints(saver, "", 15)
+    put_checkpoints(saver, SUBGRAPH_NS, 12)
+    queries_before = container.cross_partition_queries
+
+    stats = compact_thread(saver, THREAD_ID, keep_last=10)
+
+    assert stats["checkpoints_before"] == 27
+    assert stats["checkpoints_after"] == 20
+    # Each deleted checkpoint had one record and one pending write
+    assert stats["records_deleted"] == 14
+    assert container.cross_partition_queries == queries_before
+
+    for checkpoint_ns in ("", SUBGRAPH_NS):
+        config = {"configurable": {"thread_id": THREAD_ID, "checkpoint_ns": checkpoint_ns}}
+        remaining = list(saver.list(config))
+        assert len(remaining) == 10
+        assert all(len(checkpoint_tuple.pending_writes) == 1 for checkpoint_tuple in remaining)
+
+    latest = saver.get_tuple({"configurable": {"thread_id": THREAD_ID, "checkpoint_ns": ""}})
+    assert latest.config["configurable"]["checkpoint_id"] == head["configurable"]["checkpoint_id"]
+    assert latest.pending_writes == [("task-14", "messages", "write 14")]
+
+
+def test_delete_thread_records_removes_every_partition_of_the_thread(monkeypatch):
+    container = FakeContainer()
+    saver = make_cosmos_saver(monkeypatch, container)
+    put_checkpoints(saver, "", 3)
+    put_checkpoints(saver, SUBGRAPH_NS, 2)
+    other = {"configurable": {"thread_id": "thread-2", "checkpoint_ns": ""}}
+    saver.put(other, create_checkpoint(empty_checkpoint(), None, 0), {"source": "loop", "step": 0}, {})
+
+    deleted = delete_thread_records(container, THREAD_ID)
+
+    # Five checkpoints, their five writes and the namespace index
+    assert deleted == 11
+    assert container.cross_partition_queries == 0
+    assert [document["partition_key"] for document in container.items.values()] == ["checkpoint$thread-2$$"]
+
+
+def test_compaction_deletes_finished_subgraph_namespaces_and_their_index_entries(monkeypatch):
+    container = FakeContainer()
+    saver = make_cosmos_saver(monkeypatch, container)
+    put_checkpoints(saver, "", 15)
+    put_checkpoints(saver, SUBGRAPH_NS, 3)
+    # Every earlier turn ran a subgraph under a namespace of its own
+    finished = [f"sales_agent:run-{turn}" for turn in range(14)]
+    for checkpoint_ns in finished:
+        put_checkpoints(saver, checkpoint_ns, 3)
+
+    stats = compact_thread(saver, THREAD_ID, keep_last=10)
+
+    assert stats["namespaces_deleted"] == 14
+    assert stats["checkpoints_after"] == 13
+    assert checkpoint_namespaces(container, THREAD_ID) == ["", SUBGRAPH_NS]
+    assert not any(checkpoint_ns in document["partition_key"] for checkpoint_ns in finished
+                   for document in container.items.values())
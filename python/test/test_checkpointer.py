@@ -0,0 +1,32 @@
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from src.app.services.checkpointer import CompactCheckpointSerializer
+from test.fake_cosmos import FakeContainer, make_cosmos_saver
+
+CONFIG = {"configurable": {"thread_id": "thread-1", "checkpoint_ns": ""}}
+
+
+def put_and_read(saver):
+    checkpoint = create_checkpoint(empty_checkpoint(), None, 1)
+    checkpoint["channel_values"] = {"messages": [AIMessage(content="Hello", id="ai-1",
+                                                           response_metadata={"logprobs": {"content": []},
+                                                                              "model_name": "gpt-4o"})]}
+    writes = {"sales_agent": {"messages": ["Hello"]}}
+    saver.put(CONFIG, checkpoint, {"source": "loop", "step": 1, "writes": writes}, {})
+    return saver.get_tuple(CONFIG)
+
+
+@pytest.mark.parametrize("drop_metadata_writes", [True, False])
+def test_compact_serializer_round_trips_checkpoints_and_gates_metadata_writes(monkeypatch, drop_metadata_writes):
+    saver = make_cosmos_saver(monkeypatch, FakeContainer(),
+                              serde=CompactCheckpointSerializer(drop_metadata_writes=drop_metadata_writes))
+
+    checkpoint_tuple = put_and_read(saver)
+
+    [message] = checkpoint_tuple.checkpoint["channel_values"]["messages"]
+    assert message.content == "Hello"
+    assert message.response_metadata == {"model_name": "gpt-4o"}
+    assert checkpoint_tuple.metadata["step"] == 1
+    assert ("writes" in checkpoint_tuple.metadata) is not drop_metadata_writes
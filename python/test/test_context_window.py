@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.app.services import context_window
+
+
+@pytest.fixture(autouse=True)
+def count_words(monkeypatch):
+    # The tokenizer files cannot be downloaded in tests; count words instead
+    monkeypatch.setattr(context_window, "count_text_tokens", lambda text: len(text.split()))
+
+
+def conversation(turns, words_per_message=10):
+    messages = []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=" ".join([f"question{turn}"] * words_per_message), id=f"human-{turn}"))
+        messages.append(AIMessage(content="", id=f"call-{turn}",
+                                  tool_calls=[{"name": "bank_balance", "args": {}, "id": f"tool-{turn}"}]))
+        messages.append(ToolMessage(content="42", tool_call_id=f"tool-{turn}", id=f"result-{turn}"))
+        messages.append(AIMessage(content=" ".join([f"answer{turn}"] * words_per_message), id=f"ai-{turn}"))
+    return messages
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, summary, messages):
+        self.calls.append([message.id for message in messages])
+        return f"{summary} summary of {len(messages)} messages".strip()
+
+
+def test_history_within_the_limits_is_sent_as_is():
+    summarize = RecordingSummarizer()
+    state = {"messages": conversation(3)}
+
+    context, update = asyncio.run(context_window.build_context_window(state, budget=1000, max_turns=10,
+                                                                      summarize=summarize))
+
+    assert context["messages"] == state["messages"]
+    assert update == {}
+    assert summarize.calls == []
+
+
+def test_turns_over_the_limit_are_summarized_on_turn_boundaries():
+    summarize = RecordingSummarizer()
+    state = {"messages": conversation(8)}
+
+    context, update = asyncio.run(context_window.build_context_window(state, budget=1000, max_turns=4,
+                                                                      summarize=summarize))
+
+    # Half the turns are kept verbatim, starting with a customer message and keeping tool calls with their results
+    assert [message.id for message in context["messages"]][:1] == ["human-6"]
+    assert len(context["messages"]) == 8
+    assert summarize.calls == [[message.id for message in state["messages"][:24]]]
+    assert update == {"summary": "summary of 24 messages", "summarized_until": 24}
+    assert context["summary"] == update["summary"]
+
+
+def test_each_message_is_summarized_once():
+    summarize = RecordingSummarizer()
+    messages = conversation(12)
+    state = {"messages": messages[:32]}
+
+    _, update = asyncio.run(context_window.build_context_window(state, budget=1000, max_turns=4,
+                                                                summarize=summarize))
+    state = {"messages": messages, **update}
+    context, update = asyncio.run(context_window.build_context_window(state, budget=1000, max_turns=4,
+                                                                      summarize=summarize))
+
+    summarized = [message_id for call in summarize.calls for message_id in call]
+    assert len(summarized) == len(set(summarized))
+    assert update["summarized_until"] == 40
+    assert context["summary"] == "summary of 24 messages summary of 16 messages"
+
+
+def test_token_budget_is_kept_with_the_summary():
+    summarize = RecordingSummarizer()
+    state = {"messages": conversation(4, words_per_message=50)}
+
+    context, update = asyncio.run(context_window.build_context_window(state, budget=300, max_turns=10,
+                                                                      summarize=summarize))
+
+    assert update["summarized_until"] == 12
+    tokens = (context_window.count_text_tokens(context["summary"])
+              + context_window.count_messages_tokens(context["messages"]))
+    assert tokens <= 300
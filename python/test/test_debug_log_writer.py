@@ -0,0 +1,64 @@
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from src.app.services import debug_log_writer
+
+
+class AsyncDebugContainer:
+    def __init__(self, delay_seconds=0):
+        self.delay_seconds = delay_seconds
+        self.entries = []
+
+    async def execute_item_batch(self, batch_operations, partition_key):
+        await asyncio.sleep(self.delay_seconds)
+        self.entries.extend(entry for _, (entry,) in batch_operations)
+
+
+def submit(debug_log_id, content):
+    return debug_log_writer.submit_debug_log(debug_log_id, {
+        "message_id": f"message-{debug_log_id}",
+        "timestamp": "2025-02-10T10:30:00",
+        "sessionId": "session-1",
+        "tenantId": "Contoso",
+        "userId": "Mark",
+        "response_data": [{"sales_agent": {"messages": [AIMessage(content=content)]}}],
+        "extra_properties": None
+    })
+
+
+def test_queued_debug_logs_hold_the_built_entry_and_are_written_on_stop(monkeypatch):
+    container = AsyncDebugContainer()
+    monkeypatch.setattr(debug_log_writer, "get_async_debug_container", lambda: container)
+
+    async def run():
+        debug_log_writer.start_debug_log_writer()
+        assert submit("log-1", "x" * 100000)
+        pending = debug_log_writer.get_pending_debug_log("log-1")
+        await debug_log_writer.stop_debug_log_writer()
+        return pending
+
+    pending = asyncio.run(run())
+
+    assert pending["id"] == "log-1"
+    assert "response_data" not in pending
+    assert "x" * 1000 not in str(pending)
+    assert [entry["id"] for entry in container.entries] == ["log-1"]
+    assert debug_log_writer.get_pending_debug_log("log-1") is None
+
+
+def test_stop_gives_up_flushing_after_the_timeout(monkeypatch):
+    container = AsyncDebugContainer(delay_seconds=60)
+    monkeypatch.setattr(debug_log_writer, "get_async_debug_container", lambda: container)
+    monkeypatch.setattr(debug_log_writer, "pending_debug_logs", {})
+    monkeypatch.setitem(debug_log_writer.debug_log_metrics, "dropped", 0)
+
+    async def run():
+        debug_log_writer.start_debug_log_writer()
+        submit("log-1", "Hello")
+        await asyncio.wait_for(debug_log_writer.stop_debug_log_writer(timeout_seconds=0.1), 5)
+
+    asyncio.run(run())
+
+    assert container.entries == []
+    assert debug_log_writer.debug_log_metrics["dropped"] == 1
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+from fastapi import BackgroundTasks
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+from langgraph.constants import INTERRUPT
+
+from src.app import banking_agents, banking_agents_api
+from src.app.services.hybrid_checkpointer import CheckpointHeadConflictError, HybridCheckpointSaver, make_head_key
+from test.fake_agents import install_fake_turn_dependencies
+from test.fake_cosmos import FakeContainer, make_cosmos_saver
+
+THREAD_ID = "session-1"
+CONFIG = {"configurable": {"thread_id": THREAD_ID, "checkpoint_ns": ""}}
+
+
+@pytest.fixture(autouse=True)
+def clear_agents():
+    yield
+    banking_agents.get_agent.cache_clear()
+
+
+def stored_checkpoints(container):
+    return {document["id"].split("$")[-1]: document for document in container.items.values()
+            if document["partition_key"] == f"checkpoint${THREAD_ID}$$"}
+
+
+def head_of(container):
+    head_key = make_head_key(THREAD_ID, "")
+    return container.read_item(head_key, partition_key=head_key)["checkpoint_id"]
+
+
+def test_turns_store_only_interrupted_checkpoints_with_an_unbroken_parent_chain(monkeypatch):
+    container = FakeContainer()
+    hybrid = HybridCheckpointSaver(make_cosmos_saver(monkeypatch, container), durability="on-interrupt")
+    responses = [AIMessage(content="Hello, how can I help?"), AIMessage(content="Your balance is 100.")]
+    _, workflow = install_fake_turn_dependencies(monkeypatch, responses, checkpointer=hybrid)
+
+    async def run():
+        for request_body in ("Hi", "What is my balance?"):
+            await banking_agents_api.get_chat_completion("Contoso", "Mark", THREAD_ID, BackgroundTasks(),
+                                                         request_body, workflow)
+        # A worker without the thread in memory resumes it from Cosmos DB
+        return await HybridCheckpointSaver(hybrid.durable).aget_tuple(CONFIG)
+
+    resumed = asyncio.run(run())
+
+    # The subgraph namespaces of the agents were dropped at the end of each turn
+    assert list(hybrid.threads) == [(THREAD_ID, "")]
+    assert hybrid.threads[(THREAD_ID, "")].subgraphs == {}
+    stored = stored_checkpoints(container)
+    assert len(stored) == 2
+    for document in stored.values():
+        assert document["parent_checkpoint_id"] in ("", *stored)
+    assert sorted(document["parent_checkpoint_id"] for document in stored.values()) == ["", min(stored)]
+    assert resumed.checkpoint["id"] == head_of(container) == max(stored)
+    assert [message.content for message in resumed.checkpoint["channel_values"]["messages"]] == [
+        "Hi", "Hello, how can I help?", "What is my balance?", "Your balance is 100."]
+
+
+def test_interrupt_written_before_its_checkpoint_is_flushed_once_the_checkpoint_arrives(monkeypatch):
+    container = FakeContainer()
+    hybrid = HybridCheckpointSaver(make_cosmos_saver(monkeypatch, container), durability="on-interrupt")
+    checkpoint = create_checkpoint(empty_checkpoint(), None, 1)
+    checkpoint_config = {"configurable": {**CONFIG["configurable"], "checkpoint_id": checkpoint["id"]}}
+
+    async def run():
+        await hybrid.aput_writes(checkpoint_config, [(INTERRUPT, "Ready for user input.")], task_id="human-task")
+        assert stored_checkpoints(container) == {}
+        await hybrid.aput(CONFIG, checkpoint, {"source": "loop", "step": 1}, {})
+
+    asyncio.run(run())
+
+    assert list(stored_checkpoints(container)) == [checkpoint["id"]]
+    assert head_of(container) == checkpoint["id"]
+    resumed = hybrid.durable.get_tuple(CONFIG)
+    assert resumed.pending_writes == [("human-task", INTERRUPT, "Ready for user input.")]
+
+
+@pytest.mark.parametrize("head_fresh_seconds, head_reads", [(60, 0), (0, 1)])
+def test_hot_threads_are_served_without_a_head_read_while_fresh(monkeypatch, head_fresh_seconds, head_reads):
+    container = FakeContainer()
+    hybrid = HybridCheckpointSaver(make_cosmos_saver(monkeypatch, container), durability="on-interrupt",
+                                   head_fresh_seconds=head_fresh_seconds)
+    checkpoint = create_checkpoint(empty_checkpoint(), None, 1)
+
+    async def run():
+        next_config = await hybrid.aput(CONFIG, checkpoint, {"source": "loop", "step": 1}, {})
+        await hybrid.aput_writes(next_config, [(INTERRUPT, "Ready for user input.")], task_id="human-task")
+        requests = container.requests
+        checkpoint_tuple = await hybrid.aget_tuple(CONFIG)
+        return checkpoint_tuple, container.requests - requests
+
+    checkpoint_tuple, requests = asyncio.run(run())
+
+    assert checkpoint_tuple.checkpoint["id"] == checkpoint["id"]
+    assert requests == head_reads
+
+
+def test_cached_turn_is_resumed_by_another_worker(monkeypatch):
+    container = FakeContainer()
+    hybrid = HybridCheckpointSaver(make_cosmos_saver(monkeypatch, container), durability="on-interrupt")
+    _, workflow = install_fake_turn_dependencies(monkeypatch, [], checkpointer=hybrid)
+    cached_messages = [{"sender": "Sales", "senderRole": "Assistant", "text": "We offer three savings accounts."}]
+
+    async def run():
+        await banking_agents_api.complete_cached_turn(workflow, CONFIG, "Contoso", "Mark", THREAD_ID,
+                                                      "Which savings accounts do you offer?", cached_messages)
+        # A worker without the thread in memory resumes it from Cosmos DB
+        return await HybridCheckpointSaver(hybrid.durable).aget_tuple(CONFIG)
+
+    resumed = asyncio.run(run())
+
+    assert resumed.checkpoint["id"] == head_of(container)
+    assert [message.content for message in resumed.checkpoint["channel_values"]["messages"]] == [
+        "Which savings accounts do you offer?", "We offer three savings accounts."]
+
+
+def test_worker_with_a_stale_head_does_not_overwrite_the_turn_of_another_worker(monkeypatch):
+    container = FakeContainer()
+    # Worker A skips head reads, so it serves its stale copy of the thread after worker B handled a turn
+    worker_a = HybridCheckpointSaver(make_cosmos_saver(monkeypatch, container), durability="on-interrupt",
+                                     head_fresh_seconds=60)
+    worker_b = HybridCheckpointSaver(worker_a.durable, durability="on-interrupt")
+    responses = [AIMessage(content="Hello, how can I help?"), AIMessage(content="Your balance is 100."),
+                 AIMessage(content="Anything else?"), AIMessage(content="Anything else?")]
+    _, workflow_a = install_fake_turn_dependencies(monkeypatch, responses, checkpointer=worker_a)
+    workflow_b = banking_agents.builder.compile(checkpointer=worker_b)
+
+    async def complete(workflow, request_body):
+        return await banking_agents_api.get_chat_completion("Contoso", "Mark", THREAD_ID, BackgroundTasks(),
+                                                            request_body, workflow)
+
+    async def run():
+        await complete(workflow_a, "Hi")
+        await complete(workflow_b, "What is my balance?")
+        second_head = head_of(container)
+        with pytest.raises(CheckpointHeadConflictError):
+            await complete(workflow_a, "Thanks")
+        assert head_of(container) == second_head
+        # The checkpoint of the failed turn was deleted again
+        assert len(stored_checkpoints(container)) == 2
+        # Worker A dropped its stale copy, so the retried turn builds on the turn of worker B
+        await complete(workflow_a, "Thanks")
+        return await workflow_a.aget_state(CONFIG)
+
+    state = asyncio.run(run())
+
+    assert [message.content for message in state.values["messages"] if message.type in ("human", "ai")] == [
+        "Hi", "Hello, how can I help?", "What is my balance?", "Your balance is 100.", "Thanks", "Anything else?"]
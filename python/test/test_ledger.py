@@ -0,0 +1,108 @@
+import pytest
+
+from src.app.services import azure_cosmos_db, ledger
+from test.fake_cosmos import FakeContainer
+
+TENANT_ID = "Contoso"
+USER_ID = "Mark"
+
+
+@pytest.fixture
+def accounts(monkeypatch):
+    container = FakeContainer(partition_key_paths=("/tenantId", "/accountId"))
+    for account_id, balance in (("Acc001", 1000), ("Acc002", 50)):
+        container.create_item({"id": account_id, "tenantId": TENANT_ID, "accountId": account_id, "userId": USER_ID,
+                               "type": "BankAccount", "balance": balance, "lastTransactionNumber": 0})
+    monkeypatch.setattr(ledger, "get_account_container", lambda: container)
+    monkeypatch.setattr(azure_cosmos_db, "get_account_container", lambda: container)
+    return container
+
+
+def balance(container, account_id):
+    return container.read_item(account_id, partition_key=[TENANT_ID, account_id])["balance"]
+
+
+def transfers(container):
+    return container.documents(type="Transfer")
+
+
+def transactions(container, account_id):
+    return container.documents(type="BankTransaction", accountId=account_id)
+
+
+def start_transfer_with_failed_credit(monkeypatch, amount):
+    """Debits the source and leaves the transfer pending, as when the credit leg fails."""
+    def fail_credit(transfer):
+        raise RuntimeError("Credit leg failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ledger, "complete_transfer", fail_credit)
+        assert ledger.transfer_funds(TENANT_ID, USER_ID, "Acc001", "Acc002", amount) == "pending"
+    [transfer] = transfers(ledger.get_account_container())
+    return transfer
+
+
+def test_transfer_moves_funds_and_completes(accounts):
+    assert ledger.transfer_funds(TENANT_ID, USER_ID, "Acc001", "Acc002", 200) == "completed"
+
+    assert balance(accounts, "Acc001") == 800
+    assert balance(accounts, "Acc002") == 250
+    assert [transfer["status"] for transfer in transfers(accounts)] == ["completed"]
+
+
+def test_repeated_credit_is_applied_once(monkeypatch, accounts):
+    transfer = start_transfer_with_failed_credit(monkeypatch, 200)
+
+    ledger.complete_transfer(transfer)
+    ledger.complete_transfer(transfer)
+
+    assert balance(accounts, "Acc002") == 250
+    assert len(transactions(accounts, "Acc002")) == 1
+    assert len(accounts.documents(type="TransferReceipt")) == 1
+    assert transfers(accounts)[0]["status"] == "completed"
+
+
+def test_recovery_completes_pending_transfers(monkeypatch, accounts):
+    start_transfer_with_failed_credit(monkeypatch, 200)
+
+    ledger.recover_pending_transfers(min_age_seconds=-60)
+
+    assert balance(accounts, "Acc001") == 800
+    assert balance(accounts, "Acc002") == 250
+    assert transfers(accounts)[0]["status"] == "completed"
+
+
+def test_recovery_reverses_the_debit_when_the_destination_is_gone(monkeypatch, accounts):
+    start_transfer_with_failed_credit(monkeypatch, 200)
+    assert balance(accounts, "Acc001") == 800
+    accounts.delete_item("Acc002", partition_key=[TENANT_ID, "Acc002"])
+
+    ledger.recover_pending_transfers(min_age_seconds=-60)
+
+    assert balance(accounts, "Acc001") == 1000
+    assert transfers(accounts)[0]["status"] == "compensated"
+    # The debit and its reversal
+    assert [(transaction["debitAmount"], transaction["creditAmount"])
+            for transaction in sorted(transactions(accounts, "Acc001"), key=lambda t: t["id"])] == [(200, 0), (0, 200)]
+
+
+def test_compensation_is_applied_once(monkeypatch, accounts):
+    transfer = start_transfer_with_failed_credit(monkeypatch, 200)
+
+    ledger.compensate_transfer(transfer)
+    ledger.compensate_transfer(transfer)
+
+    assert balance(accounts, "Acc001") == 1000
+    assert len(transactions(accounts, "Acc001")) == 2
+    assert transfers(accounts)[0]["status"] == "compensated"
+
+
+def test_completed_transfer_is_not_compensated(monkeypatch, accounts):
+    transfer = start_transfer_with_failed_credit(monkeypatch, 200)
+    ledger.complete_transfer(transfer)
+
+    ledger.compensate_transfer(transfer)
+
+    assert balance(accounts, "Acc001") == 800
+    assert balance(accounts, "Acc002") == 250
+    assert transfers(accounts)[0]["status"] == "completed"
@@ -0,0 +1,31 @@
+from src.app.services import offer_index
+from src.app.services.offer_index import OfferIndex
+
+
+def term(document_id, accountType, vector):
+    return {"id": document_id, "type": "Term", "offerId": f"offer-{document_id}", "text": f"Terms {document_id}",
+            "name": f"Offer {document_id}", "accountType": accountType, "vector": vector}
+
+
+def test_upserts_are_ignored_while_the_index_is_disabled(monkeypatch):
+    monkeypatch.setattr(offer_index, "OFFER_INDEX_MODE", "none")
+    index = OfferIndex()
+
+    index.upsert(term("1", "savings", [1.0, 0.0]))
+
+    assert index.partitions == {}
+
+
+def test_term_that_changes_account_type_leaves_its_old_partition(monkeypatch):
+    monkeypatch.setattr(offer_index, "OFFER_INDEX_MODE", "exact")
+    index = OfferIndex()
+    index.upsert(term("1", "savings", [1.0, 0.0]))
+    index.upsert(term("2", "savings", [0.0, 1.0]))
+    index.upsert(term("3", "savings", [1.0, 1.0]))
+
+    index.upsert(term("1", "loan", [1.0, 0.0]))
+
+    assert [offer["offerId"] for offer in index.search([1.0, 0.0], "savings")] == ["offer-3"]
+    assert [offer["offerId"] for offer in index.search([0.0, 1.0], "savings")] == ["offer-2", "offer-3"]
+    assert [offer["offerId"] for offer in index.search([1.0, 0.0], "loan")] == ["offer-1"]
+    assert index.partitions["savings"].ids == ["3", "2"]
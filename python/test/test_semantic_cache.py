@@ -0,0 +1,65 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app import banking_agents, banking_agents_api
+from src.app.services.semantic_cache import is_cacheable_prompt, is_cacheable_turn
+
+CONFIG = {"configurable": {"thread_id": "session-1", "checkpoint_ns": "", "userId": "Mark", "tenantId": "Contoso"}}
+
+
+def test_prompts_referring_to_the_conversation_are_not_cacheable():
+    assert is_cacheable_prompt("What are the opening hours of the Seattle branch?")
+    assert not is_cacheable_prompt("yes please")
+    assert not is_cacheable_prompt("Can you tell me more about that offer?")
+    assert not is_cacheable_prompt("Do the same for my savings account")
+
+
+def test_turns_with_a_payment_calculation_are_not_cacheable():
+    def turn(tool_name):
+        message = AIMessage(content="", tool_calls=[{"name": tool_name, "args": {}, "id": "call-1"}])
+        return [{"sales_agent": {"messages": [message]}}]
+
+    assert is_cacheable_turn(turn("get_offer_information"))
+    assert not is_cacheable_turn(turn("calculate_monthly_payment"))
+
+
+def test_cached_turn_is_added_to_the_graph_state_and_sets_the_active_agent(monkeypatch):
+    patched_agents = []
+    stored_turns = []
+
+    async def patch_active_agent_async(tenantId, userId, sessionId, activeAgent):
+        patched_agents.append(activeAgent)
+
+    async def store_debug_log(sessionId, tenantId, userId, response_data, extra_properties=None):
+        return "debug-log-1"
+
+    async def process_messages(messages, userId, tenantId, sessionId):
+        stored_turns.append(messages)
+
+    monkeypatch.setattr(banking_agents_api, "patch_active_agent_async", patch_active_agent_async)
+    monkeypatch.setattr(banking_agents_api, "store_debug_log", store_debug_log)
+    monkeypatch.setattr(banking_agents_api, "process_messages", process_messages)
+    workflow = banking_agents.builder.compile(checkpointer=MemorySaver())
+    cached_messages = [{"sender": "Sales", "senderRole": "Assistant", "text": "We offer three savings accounts."}]
+
+    async def run():
+        assert not await banking_agents_api.has_prior_turns(workflow, CONFIG)
+        messages = await banking_agents_api.complete_cached_turn(
+            workflow, CONFIG, "Contoso", "Mark", "session-1", "Which savings accounts do you offer?", cached_messages)
+        assert await banking_agents_api.has_prior_turns(workflow, CONFIG)
+        return messages, await workflow.aget_state(CONFIG)
+
+    messages, state = asyncio.run(run())
+
+    assert [(type(message), message.content) for message in state.values["messages"]] == [
+        (HumanMessage, "Which savings accounts do you offer?"),
+        (AIMessage, "We offer three savings accounts."),
+    ]
+    assert patched_agents == ["sales_agent"]
+    assert [(message.sender, message.text) for message in messages] == [
+        ("User", "Which savings accounts do you offer?"),
+        ("Sales", "We offer three savings accounts."),
+    ]
+    assert stored_turns == [messages]